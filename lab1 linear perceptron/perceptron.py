@@ -0,0 +1,733 @@
+"""The perceptron of `perceptron.ipynb` as an importable, streaming module.
+
+Training never needs the whole dataset in memory: `fit` feeds chunks of
+rows to `partial_fit`, which makes one vectorized perceptron update per
+chunk (a GEMV for the predictions and one for the update), so a `.npy` or
+`np.memmap` far larger than RAM is read sequentially, once per epoch.
+Plotting is kept out of the training path; `show_clf` and `show_loss`
+can be called on the fitted model.
+
+Usage:
+    >>> X, y = np.load('x.npy', mmap_mode='r'), np.load('y.npy', mmap_mode='r')
+    >>> clf = Perceptron(X.shape[1]).fit(X, y)
+    >>> P, R, acc = clf.evaluate(X_test, y_test)
+
+    python perceptron.py                          # the notebook's two Gaussians
+    python perceptron.py --x x.npy --y y.npy      # any .npy pair, memory-mapped
+    python perceptron.py --make 100000000         # write a large pair and stream it
+    python perceptron.py --make 10000000 --classes 10 --features 32 -lr 1 \
+        --average --workers 8                     # multiclass, data parallel
+    python perceptron.py --sparse 1000000 -lr 0.1 # hashed sparse ids
+"""
+import os
+import time
+import zlib
+import argparse
+from copy import deepcopy
+from contextlib import contextmanager
+import multiprocessing as mp
+import numpy as np
+
+
+BLAS_THREAD_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS']
+
+CHUNK_BYTES = 1 << 20  # about 1 MB of rows per chunk, small enough that the
+                       # update GEMV rereads the chunk from cache, not from memory
+
+
+@contextmanager
+def blas_threads(n):
+    """Limits BLAS to `n` threads in processes spawned inside the block.
+    This lab does not depend on lab2, so it keeps its own copy of
+    `mytorch.parallel.blas_threads`."""
+    saved = {var: os.environ.get(var) for var in BLAS_THREAD_VARS}
+    os.environ.update(dict.fromkeys(BLAS_THREAD_VARS, str(n)))
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                del os.environ[var]
+            else:
+                os.environ[var] = value
+
+
+def dataset(num_observations=500):
+    """Two correlated Gaussians, labels 0 and 1, as in the notebook."""
+    x1 = np.random.multivariate_normal(
+        [0, 0], [[1, .75], [.75, 1]], num_observations)
+    x2 = np.random.multivariate_normal(
+        [1, 4], [[1, .75], [.75, 1]], num_observations)
+
+    X = np.vstack((x1, x2)).astype(np.float32)
+    Y = np.hstack((np.zeros(num_observations), np.ones(num_observations)))
+    return X, Y
+
+
+def blobs(n, centers, scale=1.0):
+    """`n` samples scattered around `centers` (K, d), labels 0..K-1."""
+    y = np.random.randint(len(centers), size=n)
+    X = centers[y] + scale * np.random.randn(n, centers.shape[1])
+    return X.astype(np.float32), y
+
+
+def write_dataset(prefix, n, n_classes=2, n_features=2, chunk_size=1 << 20):
+    """Writes `n` samples to `prefix`_x.npy / `prefix`_y.npy chunk by chunk,
+    in random order, without holding them in memory: the notebook's two
+    Gaussians for 2 classes in 2-D, `blobs` around fixed centers otherwise."""
+
+    X = np.lib.format.open_memmap(prefix + '_x.npy', 'w+', np.float32, (n, n_features))
+    Y = np.lib.format.open_memmap(prefix + '_y.npy', 'w+', np.int32, (n,))
+    gauss = n_classes == 2 and n_features == 2
+    centers = 3 * np.random.RandomState(n_classes).randn(n_classes, n_features)
+    for start in range(0, n, chunk_size):
+        m = min(chunk_size, n - start)
+        if gauss:
+            x, y = dataset(m // 2 + 1)
+            order = np.random.permutation(len(x))[:m]
+            x, y = x[order], y[order]
+        else:
+            x, y = blobs(m, centers)
+        X[start:start + m], Y[start:start + m] = x, y
+    X.flush()
+    Y.flush()
+    return prefix + '_x.npy', prefix + '_y.npy'
+
+
+def iter_chunks(X, y, chunk_size, order=None):
+    """Yields (X, y) slices of `chunk_size` rows; slicing a memmap reads
+    only those rows. `order` permutes the chunks, not the rows."""
+
+    n_chunks = -(-len(X) // chunk_size)
+    for i in (range(n_chunks) if order is None else order):
+        s = slice(i * chunk_size, (i + 1) * chunk_size)
+        yield X[s], y[s]
+
+
+class CSR(object):
+    """Rows of a sparse matrix as CSR index/value arrays.
+
+    Slicing rows (`X[lo:hi]`) returns a CSR sharing the arrays, so chunks
+    of a memory-mapped CSR read only their own nonzeros and `iter_chunks`
+    works on it as on a dense array. Produced by `hash_rows`.
+    """
+
+    def __init__(self, indptr, indices, data, n_features):
+        self.indptr = indptr      # (n + 1, ), row i is indptr[i]:indptr[i+1],
+                                  # less indptr[0] once sliced
+        self.indices = indices    # (nnz, ) column of each value
+        self.data = data          # (nnz, )
+        self.n_features = n_features
+
+    @property
+    def shape(self):
+        return len(self), self.n_features
+
+    @property
+    def nbytes(self):
+        nnz = self.indptr[-1] - self.indptr[0]
+        return self.indptr.nbytes + int(nnz) * (self.indices.itemsize + self.data.itemsize)
+
+    def __len__(self):
+        return len(self.indptr) - 1
+
+    def __getitem__(self, rows):
+        start, stop, step = rows.indices(len(self))
+        if step != 1:
+            raise IndexError('CSR rows can only be sliced contiguously')
+        stop = max(start, stop)
+        # indptr is not rebased on slicing: positions are relative to indptr[0]
+        lo, hi = self.indptr[start] - self.indptr[0], self.indptr[stop] - self.indptr[0]
+        return CSR(self.indptr[start:stop + 1], self.indices[lo:hi],
+                   self.data[lo:hi], self.n_features)
+
+    def dot(self, w):
+        """X w for a weight vector (d, ) or matrix (d, K), from the nonzeros."""
+        contrib = w[self.indices]
+        contrib *= self.data if w.ndim == 1 else self.data[:, None]
+        out = np.zeros((len(self), ) + w.shape[1:], contrib.dtype)
+        nonempty = np.flatnonzero(np.diff(self.indptr))
+        if len(nonempty):
+            starts = self.indptr[nonempty] - self.indptr[0]
+            out[nonempty] = np.add.reduceat(contrib, starts, axis=0)
+        return out
+
+    def scatter(self, w, row_weights, cols=None):
+        """w[j] += row_weights[i] * X[i, j], or w[j, cols[i]] += ... for a
+        matrix, over the nonzeros of the rows whose weight is not zero."""
+
+        rows = np.flatnonzero(row_weights)
+        lo = self.indptr[rows] - self.indptr[0]
+        lengths = self.indptr[rows + 1] - self.indptr[rows]
+        offsets = np.cumsum(lengths) - lengths
+        pos = np.arange(lengths.sum()) + np.repeat(lo - offsets, lengths)
+
+        values = self.data[pos] * np.repeat(row_weights[rows], lengths)
+        if cols is None:
+            np.add.at(w, self.indices[pos], values)
+        else:
+            np.add.at(w, (self.indices[pos], np.repeat(cols[rows], lengths)), values)
+
+    def save(self, prefix):
+        for name in ['indptr', 'indices', 'data']:
+            np.save(f'{prefix}_{name}.npy', getattr(self, name))
+
+    @classmethod
+    def load(cls, prefix, n_features, mmap_mode='r'):
+        """The arrays written by `save`, memory-mapped by default."""
+        return cls(*[np.load(f'{prefix}_{name}.npy', mmap_mode=mmap_mode)
+                     for name in ['indptr', 'indices', 'data']], n_features)
+
+
+def hash_ids(ids, n_bits):
+    """Column in a 2^n_bits table and sign (+1/-1) of integer feature ids,
+    by Fibonacci hashing: the top bits of id * 2^64 / golden ratio."""
+
+    h = np.asarray(ids).astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+    columns = (h >> np.uint64(64 - n_bits)).astype(np.intp)
+    # a lower bit decides the sign, so colliding features tend to cancel
+    signs = ((h >> np.uint64(31)) & np.uint64(1)).astype(np.int8) * 2 - 1
+    return columns, signs
+
+
+def hash_rows(rows, n_bits=20, dtype=np.float32) -> CSR:
+    """Hashed CSR of rows of features, whatever the vocabulary size.
+
+    Args:
+        rows: iterable of rows; a row is a list of features (str tokens or
+            int ids, value 1), or a dict of feature -> value. A 2-D integer
+            array (as many ids in every row) is hashed without a Python
+            loop.
+        n_bits: the weight table has 2^n_bits columns.
+    """
+
+    if isinstance(rows, np.ndarray) and rows.ndim == 2:
+        n, nnz = rows.shape
+        columns, signs = hash_ids(rows.ravel(), n_bits)
+        return CSR(np.arange(0, n * nnz + 1, nnz, dtype=np.int64),
+                   columns.astype(np.int32), signs.astype(dtype), 1 << n_bits)
+
+    indptr, ids, values = [0], [], []
+    for row in rows:
+        features = list(row.keys()) if isinstance(row, dict) else row
+        if len(features) and isinstance(features[0], str):
+            features = [zlib.crc32(f.encode()) for f in features]
+        ids.append(np.asarray(features, np.int64))
+        values.append(np.fromiter(row.values(), dtype, len(row))
+                      if isinstance(row, dict) else np.ones(len(row), dtype))
+        indptr.append(indptr[-1] + len(features))
+    if not ids:
+        return CSR(np.zeros(1, np.int64), np.zeros(0, np.int32),
+                   np.zeros(0, dtype), 1 << n_bits)
+
+    columns, signs = hash_ids(np.concatenate(ids), n_bits)
+    data = np.concatenate(values)
+    data *= signs
+    return CSR(np.asarray(indptr, np.int64), columns.astype(np.int32), data,
+               1 << n_bits)
+
+
+class EarlyStopping(object):
+    """Called with the mistakes of every epoch; True once an epoch makes no
+    mistake, or the error rate has not improved by `tol` for
+    `n_iter_no_change` epochs in a row.
+
+    Given a `clf`, the weights it has at the best epoch are copied aside,
+    and `restore` puts them back."""
+
+    def __init__(self, tol, n_iter_no_change, clf=None):
+        self.tol = tol
+        self.n_iter_no_change = n_iter_no_change
+        self.clf = clf
+        self.best, self.stall = np.inf, 0
+        self.best_weights = None
+
+    def __call__(self, mistakes, n) -> bool:
+        rate = mistakes / n
+        if rate < self.best and self.clf is not None:
+            self.best_weights = {name: deepcopy(getattr(self.clf, name))
+                                 for name in self.clf._weights}
+        if mistakes == 0:
+            return True
+        if rate < self.best - self.tol:
+            self.best, self.stall = rate, 0
+            return False
+        self.best = min(self.best, rate)
+        self.stall += 1
+        return self.stall >= self.n_iter_no_change
+
+    def restore(self):
+        for name, value in (self.best_weights or {}).items():
+            setattr(self.clf, name, value)
+
+
+class Perceptron(object):
+
+    _weights = ('w', )  # attributes `EarlyStopping` keeps for the best epoch
+
+    def __init__(self, n_features: int, lr: float = 1e-4,
+                 threshold: float = 0.5, dtype=np.float32):
+        """Binary perceptron predicting 1 when w.x + b > threshold.
+
+        Args:
+            n_features: number of input features d.
+            lr: learning rate of the perceptron rule.
+            threshold: decision threshold on the linear output.
+            dtype: weight and compute dtype; chunks are cast to it.
+        """
+
+        self.lr = lr
+        self.threshold = threshold
+        # w[0] for bias and w[1:] for weight, as the notebook's column of ones,
+        # without copying every chunk to prepend it
+        self.w = np.random.rand(n_features + 1).astype(dtype)
+        self.loss_history = []  # per epoch, 0.5 * error rate as `perception.loss`
+        self.val_history = []   # per epoch, error rate on `fit`'s validation set
+        self.n_epochs = 0
+
+    def chunk_size(self, X=None):
+        if isinstance(X, CSR):
+            row_bytes = X.nbytes / max(len(X), 1)
+        else:
+            row_bytes = self.w.itemsize * (len(self.w) - 1)
+        return max(1, int(CHUNK_BYTES // max(row_bytes, 1)))
+
+    def decision_function(self, X):
+        if not isinstance(X, CSR):
+            X = np.asarray(X, dtype=self.w.dtype)
+        out = X.dot(self.w[1:])
+        out += self.w[0]
+        return out
+
+    def predict(self, X):
+        return self.decision_function(X) > self.threshold
+
+    def partial_fit(self, X, y) -> int:
+        """One vectorized perceptron update on a chunk.
+
+        The rule w += lr * (y - pred) * x is applied to every row of the
+        chunk at once, with the predictions of the weights before the
+        update; misclassified rows are the only ones that contribute.
+
+        A `CSR` chunk (hashed features, `n_features = 2**n_bits`) updates
+        only the weights of the nonzeros of its misclassified rows.
+
+        Args:
+            X: chunk of shape (n, d), any array-like, e.g. a memmap slice,
+                or a `CSR`.
+            y: labels of shape (n, ), 0 or 1.
+        Returns:
+            mistakes: number of misclassified rows in the chunk.
+        """
+
+        if not isinstance(X, CSR):
+            X = np.asarray(X, dtype=self.w.dtype)
+        err = np.asarray(y, dtype=self.w.dtype) - self.predict(X)
+        mistakes = np.count_nonzero(err)
+        if mistakes:
+            err *= self.lr
+            if isinstance(X, CSR):
+                X.scatter(self.w[1:], err)
+            else:
+                self.w[1:] += err.dot(X)
+            self.w[0] += err.sum()
+        return mistakes
+
+    def fit(self, X, y, chunk_size: int = None, max_epochs: int = 300,
+            tol: float = 1e-3, n_iter_no_change: int = 5, shuffle: bool = True,
+            validation: tuple = None):
+        """Epochs of `partial_fit` over the chunks of X, until convergence.
+
+        Training stops early when an epoch makes no mistake, or when the
+        epoch error rate has not improved by `tol` for `n_iter_no_change`
+        epochs in a row. With `validation`, that error rate is measured on
+        the validation set after every epoch, and the weights of the epoch
+        with the lowest one are kept.
+
+        Args:
+            X: inputs of shape (N, d), e.g. `np.load(path, mmap_mode='r')`,
+                or a `CSR` such as `CSR.load(prefix, 2**n_bits)`.
+            y: labels of shape (N, ), 0 or 1.
+            chunk_size: rows per update, about `CHUNK_BYTES` if None.
+            shuffle: visit the chunks in a new random order every epoch;
+                rows inside a chunk are still read sequentially.
+            validation: (X_val, y_val) held out for early stopping.
+        Returns:
+            self
+        """
+
+        chunk_size = chunk_size or self.chunk_size(X)
+        stop = EarlyStopping(tol, n_iter_no_change,
+                             self if validation is not None else None)
+        for epoch in range(max_epochs):
+            mistakes = self.epoch(X, y, chunk_size, shuffle)
+            self.loss_history.append(0.5 * mistakes / len(X))
+            self.n_epochs += 1
+            if validation is None:
+                if stop(mistakes, len(X)):
+                    break
+                continue
+            X_val, y_val = validation
+            val_mistakes = self.mistakes(X_val, y_val)
+            self.val_history.append(val_mistakes / len(X_val))
+            if stop(val_mistakes, len(X_val)):
+                break
+        stop.restore()
+
+        return self
+
+    def epoch(self, X, y, chunk_size, shuffle=True) -> int:
+        """One pass of `partial_fit` over the chunks; returns the mistakes."""
+        n_chunks = -(-len(X) // chunk_size)
+        order = np.random.permutation(n_chunks) if shuffle else None
+        return sum(self.partial_fit(x_chunk, y_chunk) for x_chunk, y_chunk
+                   in iter_chunks(X, y, chunk_size, order))
+
+    def fit_parallel(self, x_path: str, y_path: str, n_rows: int = None,
+                     workers: int = None, chunk_size: int = None,
+                     max_epochs: int = 300, tol: float = 1e-3,
+                     n_iter_no_change: int = 5):
+        """`fit` on a process pool by iterative parameter mixing.
+
+        The first `n_rows` rows are split into one contiguous shard per
+        worker. Every epoch each worker runs `epoch` over its shard starting
+        from the current weights, and the weights become the mean of the
+        workers' (McDonald et al., 2010). Workers memory-map the .npy files,
+        so only the model crosses process boundaries, and BLAS threads are
+        split between them as in lab2 `sweep.py`.
+
+        Args:
+            x_path, y_path: .npy files of the inputs (N, d) and labels (N, ).
+            n_rows: rows to train on, all if None; the rest can be held out.
+            workers: processes, `os.cpu_count()` if None.
+        Returns:
+            self
+        """
+
+        n_rows = n_rows or len(np.load(y_path, mmap_mode='r'))
+        workers = workers or os.cpu_count() or 1
+        chunk_size = chunk_size or self.chunk_size()
+        bounds = np.linspace(0, n_rows, workers + 1).astype(int)
+
+        # workers start fresh interpreters, so the thread limit reaches BLAS
+        with blas_threads(max(1, (os.cpu_count() or 1) // workers)):
+            pool = mp.get_context('spawn').Pool(workers)
+
+        stop = EarlyStopping(tol, n_iter_no_change)
+        with pool:
+            for epoch in range(max_epochs):
+                tasks = [(self, x_path, y_path, lo, hi, chunk_size,
+                          np.random.randint(2**31))
+                         for lo, hi in zip(bounds[:-1], bounds[1:])]
+                results = pool.map(_shard_epoch, tasks)
+                self.mix([clf for clf, _ in results])
+                mistakes = sum(m for _, m in results)
+                self.loss_history.append(0.5 * mistakes / n_rows)
+                self.n_epochs += 1
+                if stop(mistakes, n_rows):
+                    break
+
+        return self
+
+    def mix(self, clones):
+        """Takes the mean of the weights the workers ended an epoch with."""
+        self.w = np.mean([clf.w for clf in clones], axis=0, dtype=self.w.dtype)
+
+    def mistakes(self, X, y, chunk_size: int = None) -> int:
+        """Misclassified rows of X, streamed in chunks."""
+        chunk_size = chunk_size or self.chunk_size(X)
+        return sum(np.count_nonzero(self.predict(x_chunk) != (np.asarray(y_chunk) == 1))
+                   for x_chunk, y_chunk in iter_chunks(X, y, chunk_size))
+
+    def evaluate(self, X, y, chunk_size: int = None):
+        """P, R and acc over X, streamed in chunks."""
+
+        chunk_size = chunk_size or self.chunk_size(X)
+        TP = FP = FN = correct = 0
+        for x_chunk, y_chunk in iter_chunks(X, y, chunk_size):
+            pred, Y = self.predict(x_chunk), np.asarray(y_chunk) == 1
+            TP += np.count_nonzero(pred & Y)
+            FP += np.count_nonzero(pred & ~Y)
+            FN += np.count_nonzero(~pred & Y)
+            correct += np.count_nonzero(pred == Y)
+
+        return TP / max(TP + FP, 1), TP / max(TP + FN, 1), correct / len(X)
+
+
+class MulticlassPerceptron(Perceptron):
+
+    _weights = ('w', 'u', 'n_seen')
+
+    def __init__(self, n_features: int, n_classes: int, lr: float = 1.0,
+                 average: bool = False, dtype=np.float32):
+        """Multinomial perceptron: one weight column per class, predicting
+        the class of highest score.
+
+        Args:
+            n_features: number of input features d.
+            n_classes: number of classes K, labels 0..K-1.
+            lr: learning rate of the perceptron rule.
+            average: predict with the mean of the weights over all the
+                examples seen (averaged perceptron), which is much less
+                sensitive to the last updates on noisy, non separable data.
+            dtype: weight and compute dtype; chunks are cast to it.
+        """
+
+        self.lr = lr
+        self.n_classes = n_classes
+        self.average = average
+        # w[0] for bias and w[1:] for weight, one column per class
+        self.w = np.zeros((n_features + 1, n_classes), dtype)
+        # lazy averaging: each update, scaled by the number of examples seen
+        # before its row, goes to `u`, and the mean of w over the n_seen
+        # examples is w - u / n_seen; float64, as u grows with n_seen
+        self.u = np.zeros(self.w.shape) if average else None
+        self.n_seen = 0
+        self.loss_history = []  # per epoch, 0.5 * error rate
+        self.val_history = []
+        self.n_epochs = 0
+
+    def coef(self):
+        """The weights `predict` uses: averaged ones if `average` is set."""
+        if self.average and self.n_seen:
+            return (self.w - self.u / self.n_seen).astype(self.w.dtype)
+        return self.w
+
+    def decision_function(self, X, w=None):
+        w = self.coef() if w is None else w
+        if not isinstance(X, CSR):
+            X = np.asarray(X, dtype=self.w.dtype)
+        out = X.dot(w[1:])
+        out += w[0]
+        return out
+
+    def predict(self, X):
+        return self.decision_function(X).argmax(axis=1)
+
+    def partial_fit(self, X, y) -> int:
+        """One multinomial perceptron update on a chunk, as one GEMM.
+
+        Each misclassified row adds lr * x to the column of its label and
+        subtracts it from the column it was predicted as, i.e.
+        W += lr * X_wrong^T (Y - P) with one-hot Y and P; only the wrong
+        rows are gathered, so the update costs time in the mistakes; for a
+        `CSR` chunk, in their nonzeros.
+
+        With `average`, the update of each wrong row counts from that row
+        on, as if the rows had been visited one by one, so the averaged
+        weights are a per-example mean whatever the chunk size.
+
+        Args:
+            X: chunk of shape (n, d), any array-like, e.g. a memmap slice,
+                or a `CSR`.
+            y: labels of shape (n, ), 0..K-1.
+        Returns:
+            mistakes: number of misclassified rows in the chunk.
+        """
+
+        if not isinstance(X, CSR):
+            X = np.asarray(X, dtype=self.w.dtype)
+        y = np.asarray(y).astype(np.intp, copy=False)
+        pred = self.decision_function(X, self.w).argmax(axis=1)
+        wrong = np.flatnonzero(pred != y)
+        # examples seen before each wrong row, the weight of its update in u
+        seen = self.n_seen + wrong
+        self.n_seen += len(X)
+        if len(wrong) and isinstance(X, CSR):
+            weights = np.zeros(len(X), self.w.dtype)
+            weights[wrong] = self.lr
+            X.scatter(self.w[1:], weights, cols=y)
+            X.scatter(self.w[1:], -weights, cols=pred)
+            np.add.at(self.w[0], y[wrong], self.lr)
+            np.add.at(self.w[0], pred[wrong], -self.lr)
+            if self.average:
+                weights = np.zeros(len(X))
+                weights[wrong] = self.lr * seen
+                X.scatter(self.u[1:], weights, cols=y)
+                X.scatter(self.u[1:], -weights, cols=pred)
+                np.add.at(self.u[0], y[wrong], weights[wrong])
+                np.add.at(self.u[0], pred[wrong], -weights[wrong])
+        elif len(wrong):
+            delta = np.zeros((len(wrong), self.n_classes), self.w.dtype)
+            rows = np.arange(len(wrong))
+            delta[rows, y[wrong]] = self.lr
+            delta[rows, pred[wrong]] = -self.lr
+            x_wrong = X[wrong]
+            self.w[1:] += x_wrong.T.dot(delta)
+            self.w[0] += delta.sum(axis=0)
+            if self.average:
+                delta = delta * seen[:, None].astype(np.float64)
+                self.u[1:] += x_wrong.T.dot(delta)
+                self.u[0] += delta.sum(axis=0)
+
+        return len(wrong)
+
+    def mix(self, clones):
+        """Mean of the workers' weights; the averaged weights take in every
+        example any of the workers saw."""
+
+        def weight_sum(clf):  # sum of w over the examples seen, n_seen * coef
+            return clf.n_seen * clf.w.astype(np.float64) - clf.u
+
+        if self.average:
+            start_sum = weight_sum(self)
+            total = start_sum + sum(weight_sum(clf) - start_sum for clf in clones)
+        super(MulticlassPerceptron, self).mix(clones)
+        self.n_seen += sum(clf.n_seen - self.n_seen for clf in clones)
+        if self.average:
+            self.u = self.n_seen * self.w.astype(np.float64) - total
+
+    def mistakes(self, X, y, chunk_size: int = None) -> int:
+        chunk_size = chunk_size or self.chunk_size(X)
+        return sum(np.count_nonzero(self.predict(x_chunk) != np.asarray(y_chunk))
+                   for x_chunk, y_chunk in iter_chunks(X, y, chunk_size))
+
+    def evaluate(self, X, y, chunk_size: int = None):
+        """Accuracy over X, streamed in chunks."""
+        return 1 - self.mistakes(X, y, chunk_size) / len(X)
+
+
+def _shard_epoch(task):
+    """Worker of `fit_parallel`: one epoch over the rows [lo, hi)."""
+    clf, x_path, y_path, lo, hi, chunk_size, seed = task
+    np.random.seed(seed)
+    X = np.load(x_path, mmap_mode='r')[lo:hi]
+    y = np.load(y_path, mmap_mode='r')[lo:hi]
+    return clf, clf.epoch(X, y, chunk_size)
+
+
+def show_clf(x, y, w, w_0=None, threshold=0.5):
+    """Samples and the decision line(s) of bias-first weights w (and w_0)."""
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots()
+    ax.scatter(x[:, 0], x[:, 1], c=y, alpha=0.9, edgecolors='black')
+    xx = np.linspace(x[:, 0].min() - 1, x[:, 0].max() + 1, 500)
+    for weights, label in [(w, 'w'), (w_0, 'w_0')]:
+        if weights is not None:
+            plt.plot(xx, (threshold - weights[0] - xx * weights[1]) / weights[2],
+                     label=label)
+    plt.legend()
+    plt.show()
+
+
+def show_loss(loss):
+    import matplotlib.pyplot as plt
+
+    plt.plot(range(len(loss)), loss)
+    plt.show()
+
+
+def sparse_demo(args):
+    """Rows of 20 ids from a 10^9 vocabulary, labelled by a hidden sign per
+    id, through the hashed CSR path."""
+
+    ids = np.random.zipf(1.5, size=(args.sparse, 20)) % 10**9
+    hidden = ((ids * 0x2545F491) >> 17) & 1
+    votes = hidden.sum(axis=1)
+    Y = (votes > np.median(votes)).astype(np.float32)
+    start = time.perf_counter()
+    X = hash_rows(ids, args.hash_bits)
+    print("hashed %d rows, %d nonzeros in %.2fs, weight table %.1f MB" % (
+        len(X), len(X.data), time.perf_counter() - start,
+        (X.n_features + 1) * 4 / 2**20))
+
+    n_train = len(X) - int(len(X) * args.test_size)
+    clf = Perceptron(X.n_features, args.learning_rate, args.threshold)
+    clf.w[:] = 0.5  # start on the threshold, not at random
+    start = time.perf_counter()
+    clf.fit(X[:n_train], Y[:n_train], chunk_size=args.chunk_size or None,
+            max_epochs=args.max_epochs)
+    seconds = time.perf_counter() - start
+    print("%d epochs in %.2fs, %.1fM samples/s" % (
+        clf.n_epochs, seconds, clf.n_epochs * n_train / seconds / 1e6))
+    P, R, acc = clf.evaluate(X[n_train:], Y[n_train:])
+    print("TEST:\nPrecise: %.2f%%, Recall: %.2f%%, acc: %.2f%%" %
+          (100*P, 100*R, 100*acc))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Streaming perceptron on .npy data")
+    parser.add_argument('--x', default='', help='inputs (N, d) .npy, memory-mapped')
+    parser.add_argument('--y', default='', help='labels (N, ) .npy, memory-mapped')
+    parser.add_argument('--make', default=0, type=int,
+                        help='write this many samples to ./data/gauss_{x,y}.npy first')
+    parser.add_argument('--classes', default=2, type=int,
+                        help='more than 2 trains a MulticlassPerceptron')
+    parser.add_argument('--features', default=2, type=int,
+                        help='input size of the data written by --make')
+    parser.add_argument('--average', action='store_true',
+                        help='averaged multiclass perceptron')
+    parser.add_argument('--workers', default=1, type=int,
+                        help='train data shards on a process pool')
+    parser.add_argument('--sparse', default=0, type=int,
+                        help='train on this many rows of hashed random ids instead')
+    parser.add_argument('--hash_bits', default=20, type=int,
+                        help='hashed features go to a 2^hash_bits weight table')
+    parser.add_argument('-lr', '--learning-rate', default=1e-4, type=float)
+    parser.add_argument('--threshold', default=0.5, type=float)
+    parser.add_argument('--chunk_size', default=0, type=int)
+    parser.add_argument('--max_epochs', default=300, type=int)
+    parser.add_argument('--test_size', default=0.1, type=float)
+    parser.add_argument('--plot', action='store_true')
+    args = parser.parse_args()
+
+    np.random.seed(729)
+    if args.sparse:
+        return sparse_demo(args)
+    if args.make:
+        os.makedirs('data', exist_ok=True)
+        args.x, args.y = write_dataset(os.path.join('data', 'gauss'), args.make,
+                                       args.classes, args.features)
+    if args.x:
+        X, Y = np.load(args.x, mmap_mode='r'), np.load(args.y, mmap_mode='r')
+    else:
+        if args.classes == 2:
+            X, Y = dataset()
+        else:
+            X, Y = blobs(500 * args.classes, 3 * np.random.randn(args.classes, 2))
+        order = np.random.permutation(len(X))
+        X, Y = X[order], Y[order]
+        if args.workers > 1:
+            # workers memory-map their shards from files
+            os.makedirs('data', exist_ok=True)
+            args.x, args.y = os.path.join('data', 'x.npy'), os.path.join('data', 'y.npy')
+            np.save(args.x, X)
+            np.save(args.y, Y)
+
+    # the last rows are held out, so a memmap is split without copying
+    n_train = len(X) - int(len(X) * args.test_size)
+    if args.classes == 2:
+        clf = Perceptron(X.shape[1], args.learning_rate, args.threshold)
+    else:
+        clf = MulticlassPerceptron(X.shape[1], args.classes, args.learning_rate,
+                                   args.average)
+    start = time.perf_counter()
+    if args.workers > 1:
+        clf.fit_parallel(args.x, args.y, n_train, args.workers,
+                         chunk_size=args.chunk_size or None, max_epochs=args.max_epochs)
+    else:
+        clf.fit(X[:n_train], Y[:n_train], chunk_size=args.chunk_size or None,
+                max_epochs=args.max_epochs)
+    seconds = time.perf_counter() - start
+
+    gb = clf.n_epochs * (X[:n_train].nbytes + Y[:n_train].nbytes) / 1e9
+    print("%d epochs in %.2fs, %.2f GB/s, %.1fM samples/s" % (
+        clf.n_epochs, seconds, gb / seconds, clf.n_epochs * n_train / seconds / 1e6))
+    if args.classes == 2:
+        P, R, acc = clf.evaluate(X[n_train:], Y[n_train:])
+        print("TEST:\nPrecise: %.2f%%, Recall: %.2f%%, acc: %.2f%%" %
+              (100*P, 100*R, 100*acc))
+    else:
+        print("TEST:\nacc: %.2f%%" % (100 * clf.evaluate(X[n_train:], Y[n_train:])))
+
+    if args.plot:
+        if args.classes == 2:
+            show_clf(X[n_train:], Y[n_train:], clf.w, threshold=clf.threshold)
+        show_loss(clf.loss_history)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+import zlib
+
+import numpy as np
+import pytest
+
+import perceptron
+
+
+def averaged_reference(X, y, n_classes, lr, chunk_size, epochs):
+    """The averaged multinomial perceptron visited one example at a time:
+    predictions use the weights of the chunk start, as `partial_fit` does,
+    and the running weights are summed after every example."""
+
+    w = np.zeros((X.shape[1] + 1, n_classes))
+    w_sum = np.zeros_like(w)
+    n_seen = 0
+    for _ in range(epochs):
+        for start in range(0, len(X), chunk_size):
+            frozen = w.copy()
+            for x, label in zip(X[start:start + chunk_size], y[start:start + chunk_size]):
+                pred = (x.dot(frozen[1:]) + frozen[0]).argmax()
+                if pred != label:
+                    for col, sign in [(label, lr), (pred, -lr)]:
+                        w[1:, col] += sign * x
+                        w[0, col] += sign
+                w_sum += w
+                n_seen += 1
+    return w_sum / n_seen
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64])
+def test_averaged_weights_are_a_per_example_mean(chunk_size):
+    np.random.seed(0)
+    X, y = perceptron.blobs(200, 3 * np.random.randn(4, 3))
+    X = X.astype(np.float64)
+    clf = perceptron.MulticlassPerceptron(3, 4, lr=0.5, average=True,
+                                          dtype=np.float64)
+    for _ in range(3):
+        clf.epoch(X, y, chunk_size, shuffle=False)
+
+    expected = averaged_reference(X, y, 4, 0.5, chunk_size, epochs=3)
+    np.testing.assert_allclose(clf.coef(), expected, rtol=1e-10, atol=1e-10)
+
+
+def test_averaged_weights_csr_match_dense():
+    np.random.seed(0)
+    ids = np.random.randint(1000, size=(300, 5))
+    y = ids[:, 0] % 3
+    X = perceptron.hash_rows(ids, n_bits=8, dtype=np.float64)
+    dense = np.zeros(X.shape)
+    np.add.at(dense, (np.repeat(np.arange(len(X)), 5), X.indices), X.data)
+
+    clfs = [perceptron.MulticlassPerceptron(X.n_features, 3, average=True,
+                                            dtype=np.float64) for _ in range(2)]
+    for clf, data in zip(clfs, [X, dense]):
+        for _ in range(2):
+            clf.epoch(data, y, 32, shuffle=False)
+    np.testing.assert_allclose(clfs[0].coef(), clfs[1].coef(), rtol=1e-10, atol=1e-10)
+
+
+def test_hash_rows_match_the_array_path():
+    np.random.seed(0)
+    ids = np.random.randint(1 << 32, size=(50, 4))
+    expected = perceptron.hash_rows(ids, n_bits=10)
+    assert set(np.unique(expected.data)) <= {-1, 1}
+
+    tokens = [['t%d' % i for i in row] for row in ids]
+    crc = np.array([[zlib.crc32(t.encode()) for t in row] for row in tokens])
+    for rows, reference in [(ids.tolist(), expected),
+                            ([dict.fromkeys(row, 1.) for row in ids.tolist()], expected),
+                            (tokens, perceptron.hash_rows(crc, n_bits=10))]:
+        X = perceptron.hash_rows(rows, n_bits=10)
+        for name in ['indptr', 'indices', 'data']:
+            np.testing.assert_array_equal(getattr(X, name), getattr(reference, name))
+
+    empty = perceptron.hash_rows([], n_bits=10)
+    assert empty.shape == (0, 1024) and len(empty.indices) == len(empty.data) == 0
+    np.testing.assert_array_equal(empty.indptr, [0])
+
+
+def test_binary_csr_matches_dense():
+    np.random.seed(0)
+    ids = np.random.randint(1000, size=(300, 5))
+    y = (ids[:, 0] % 2).astype(np.float64)
+    X = perceptron.hash_rows(ids, n_bits=8, dtype=np.float64)
+    dense = np.zeros(X.shape)
+    np.add.at(dense, (np.repeat(np.arange(len(X)), 5), X.indices), X.data)
+
+    clfs = [perceptron.Perceptron(X.n_features, lr=0.1, dtype=np.float64)
+            for _ in range(2)]
+    clfs[1].w = clfs[0].w.copy()
+    for clf, data in zip(clfs, [X, dense]):
+        for _ in range(3):
+            clf.epoch(data, y, 32, shuffle=False)
+    np.testing.assert_allclose(clfs[0].w, clfs[1].w, rtol=1e-10, atol=1e-10)
+    np.testing.assert_array_equal(clfs[0].predict(X), clfs[1].predict(dense))
+
+
+def separable(tmp_path, n=20000):
+    """Two blobs far apart, written and memory-mapped as by `--make`."""
+    np.random.seed(0)
+    x_path, y_path = perceptron.write_dataset(str(tmp_path / 'blobs'), n, n_classes=2,
+                                              n_features=8, chunk_size=4096)
+    return x_path, y_path, np.load(x_path, mmap_mode='r'), np.load(y_path, mmap_mode='r')
+
+
+def test_fit_streams_memmap_to_convergence(tmp_path):
+    _, _, X, y = separable(tmp_path)
+    assert isinstance(X, np.memmap)
+    clf = perceptron.Perceptron(8, lr=0.1).fit(X, y, chunk_size=1000)
+    assert clf.n_epochs < 300 and clf.loss_history[-1] == 0
+    assert clf.evaluate(X, y)[2] == 1.0
+
+
+def test_early_stopping_restores_best_weights():
+    clf = perceptron.Perceptron(2)
+    stop = perceptron.EarlyStopping(tol=1e-3, n_iter_no_change=2, clf=clf)
+    best = clf.w.copy()
+    assert not stop(10, 100)
+    clf.w = clf.w + 1
+    assert not stop(20, 100)
+    clf.w = clf.w + 1
+    assert stop(15, 100)
+    stop.restore()
+    np.testing.assert_array_equal(clf.w, best)
+
+
+def test_fit_keeps_best_validation_epoch():
+    np.random.seed(0)
+    X, y = perceptron.blobs(2000, np.array([[0., 0.], [1.5, 1.5]]))
+    flip = np.random.rand(len(y)) < 0.2  # noisy labels: never separable
+    y = np.where(flip, 1 - y, y).astype(np.float32)
+    clf = perceptron.Perceptron(2, lr=1e-2).fit(
+        X[:1500], y[:1500], chunk_size=50, n_iter_no_change=3,
+        validation=(X[1500:], y[1500:]))
+
+    assert clf.n_epochs == len(clf.val_history) < 300
+    assert clf.val_history[-1] > min(clf.val_history)  # an earlier epoch was best
+    assert clf.mistakes(X[1500:], y[1500:]) / 500 == min(clf.val_history)
+
+
+def test_fit_parallel_matches_fit(tmp_path):
+    x_path, y_path, X, y = separable(tmp_path)
+    n_train = 16000
+    serial = perceptron.Perceptron(8, lr=0.1).fit(X[:n_train], y[:n_train], chunk_size=1000)
+    np.random.seed(0)
+    mixed = perceptron.Perceptron(8, lr=0.1).fit_parallel(
+        x_path, y_path, n_train, workers=2, chunk_size=1000)
+    assert mixed.evaluate(X[n_train:], y[n_train:])[2] >= \
+        serial.evaluate(X[n_train:], y[n_train:])[2] - 0.01
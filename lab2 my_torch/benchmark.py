@@ -0,0 +1,788 @@
+"""Micro-benchmarks for mytorch on synthetic MNIST-shaped data.
+
+Usage:
+    python benchmark.py --bench tape
+    python benchmark.py --bench optim
+    python benchmark.py --bench step
+    python benchmark.py --bench eval
+    python benchmark.py --bench conv
+    python benchmark.py --bench dtype
+    python benchmark.py --bench loss
+    python benchmark.py --bench trace
+    OMP_NUM_THREADS=1 python benchmark.py --bench parallel
+    python benchmark.py --bench loader
+    python benchmark.py --bench profile
+    python benchmark.py --bench accum --batch_size 4096
+    python benchmark.py --bench saved
+    python benchmark.py --bench checkpoint
+    python benchmark.py --bench fuse
+    python benchmark.py --bench embedding
+    python benchmark.py --bench rnn --hidden_size 256
+    python benchmark.py --bench lbfgs
+"""
+import os
+import time
+import struct
+import argparse
+import tempfile
+import tracemalloc
+import numpy as np
+
+import mytorch
+from mytorch import my_tensor
+
+
+class MLP(mytorch.Module):
+    """Same network as `mnist_mytorch.NeuralNet`."""
+
+    def __init__(self, input_size=784, hidden_size=500, num_classes=10):
+        super(MLP, self).__init__()
+
+        self.fc1 = mytorch.Linear(input_size, hidden_size)
+        self.fc2 = mytorch.Linear(hidden_size, num_classes)
+        self.relu = mytorch.Functional.ReLU()
+        self.softmax = mytorch.Functional.Softmax()
+
+        self.parameters = [self.fc1.w, self.fc2.w]
+
+    def forward(self, x):
+        out = self.fc1(x)
+        out = self.relu(out)
+        out = self.fc2(out)
+        out = self.softmax(out)
+
+        return out
+
+
+class LeNet(mytorch.Module):
+    """Same network as `mnist_mytorch.LeNet` on 28x28 inputs."""
+
+    def __init__(self, num_classes=10):
+        super(LeNet, self).__init__()
+
+        self.conv1 = mytorch.Conv2d(1, 6, kernel_size=5, padding=2)
+        self.conv2 = mytorch.Conv2d(6, 16, kernel_size=5)
+        self.fc1 = mytorch.Linear(16 * 5 * 5, 120)
+        self.fc2 = mytorch.Linear(120, 84)
+        self.fc3 = mytorch.Linear(84, num_classes)
+        self.pool = mytorch.Functional.MaxPool2d(2)
+        self.relu = mytorch.Functional.ReLU()
+        self.flatten = mytorch.Functional.Flatten()
+        self.softmax = mytorch.Functional.Softmax()
+
+        self.parameters = [self.conv1.w, self.conv2.w,
+                           self.fc1.w, self.fc2.w, self.fc3.w]
+
+    def forward(self, x):
+        out = self.pool(self.relu(self.conv1(x)))
+        out = self.pool(self.relu(self.conv2(out)))
+        out = self.flatten(out)
+        out = self.relu(self.fc1(out))
+        out = self.relu(self.fc2(out))
+        out = self.softmax(self.fc3(out))
+
+        return out
+
+
+class HalfMoonNet(mytorch.Module):
+    """Same network as `half_moon_mytorch.Net`."""
+
+    def __init__(self, input_size=2):
+        super(HalfMoonNet, self).__init__()
+
+        self.fc1 = mytorch.Linear(in_features=input_size, out_features=6)
+        self.fc2 = mytorch.Linear(in_features=6, out_features=6)
+        self.fc3 = mytorch.Linear(in_features=6, out_features=1)
+        self.relu = mytorch.Functional.ReLU()
+
+        self.parameters = [self.fc1.w, self.fc2.w, self.fc3.w]
+
+    def forward(self, x):
+        out = self.fc1(x)
+        out = self.relu(out)
+        out = self.fc2(out)
+        out = self.relu(out)
+        out = self.fc3(out)
+        out = out.squeeze(-1)
+        return out
+
+
+class DeepMLP(mytorch.Module):
+    """`depth` Linear+ReLU layers of `hidden_size`, optionally checkpointed
+    in segments of `segment` layers."""
+
+    def __init__(self, depth, hidden_size, segment=0, num_classes=10):
+        super(DeepMLP, self).__init__()
+
+        layers = [mytorch.Sequential(mytorch.Linear(hidden_size, hidden_size),
+                                     mytorch.Functional.ReLU())
+                  for _ in range(depth)]
+        if segment:
+            layers = [mytorch.checkpoint(mytorch.Sequential(*layers[i:i + segment]))
+                      for i in range(0, depth, segment)]
+        self.fc_in = mytorch.Linear(784, hidden_size)
+        self.body = mytorch.Sequential(*layers)
+        self.fc_out = mytorch.Linear(hidden_size, num_classes)
+        self.softmax = mytorch.Functional.Softmax()
+
+        self.parameters = [t for _, t in self.named_parameters()]
+        for w in self.parameters:
+            w *= (2 / w.shape[0]) ** 0.5  # keep activations bounded with depth
+
+    def forward(self, x):
+        return self.softmax(self.fc_out(self.body(self.fc_in(x))))
+
+
+def synthetic_mnist(batch_size, num_classes=10, input_size=784):
+    images = np.random.rand(batch_size, input_size)
+    labels = np.random.randint(0, num_classes, (batch_size, 1))
+    return images, labels
+
+
+def synthetic_moons(n_samples=1000, noise=0.2):
+    """Same distribution as `sklearn.datasets.make_moons`, shuffled."""
+    n_out, n_in = n_samples // 2, n_samples - n_samples // 2
+    t_out, t_in = np.linspace(0, np.pi, n_out), np.linspace(0, np.pi, n_in)
+    X = np.r_[np.c_[np.cos(t_out), np.sin(t_out)],
+              np.c_[1 - np.cos(t_in), 0.5 - np.sin(t_in)]]
+    y = np.r_[np.zeros(n_out, int), np.ones(n_in, int)]
+    X += noise * np.random.randn(*X.shape)
+    order = np.random.permutation(n_samples)
+    return X[order], y[order]
+
+
+def timeit(fn, steps, warmup=5):
+    for _ in range(warmup):
+        fn()
+    start = time.perf_counter()
+    for _ in range(steps):
+        fn()
+    return (time.perf_counter() - start) / steps
+
+
+def bench_tape(args):
+    """Forward + backward time, and per-op recording overhead."""
+    model = MLP(hidden_size=args.hidden_size)
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    images, labels = synthetic_mnist(args.batch_size)
+
+    def step():
+        x = my_tensor.from_array(images)
+        y = my_tensor.from_array(labels)
+        loss = criterion(model(x), y)
+        model.backward(loss.backward())
+
+    t_step = timeit(step, args.steps)
+    print('fwd+bwd  batch=%d: %.3f ms/step' % (args.batch_size, t_step * 1e3))
+
+    # a 1-sample batch through a chain of cheap ops is dominated by dispatch
+    n_ops = 1000
+    relu = mytorch.Functional.ReLU()
+
+    class Chain(mytorch.Module):
+        def forward(self, x):
+            for _ in range(n_ops):
+                x = relu(x)
+            return x
+
+    chain = Chain()
+    x = np.ones((1, 1))
+    t_chain = timeit(lambda: chain.backward(chain(x)), 20)
+    print('dispatch: %.2f us/op (forward + backward, %d ops/tape)' %
+          (t_chain / n_ops * 1e6, n_ops))
+
+
+def peak_alloc(fn):
+    """Peak bytes traced while running fn once."""
+    tracemalloc.start()
+    fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def retained_alloc(fn):
+    """Bytes still traced after fn returns, its result included."""
+    tracemalloc.start()
+    out = fn()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del out
+    return current
+
+
+def bench_optim(args):
+    """Optimizer steps/sec, per-tensor loops vs flat fused buffers."""
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    images, labels = synthetic_mnist(args.batch_size)
+
+    for name in ['SGD', 'Adagrad', 'RMSProp', 'Adam']:
+        for flat in [False, True]:
+            model = MLP(hidden_size=args.hidden_size)
+            if flat:
+                model.flatten_parameters()
+            optimizer = getattr(mytorch.Optim, name)(
+                model.parameters, lr=1e-3, flat=flat)
+
+            def train_step():
+                x = my_tensor.from_array(images)
+                y = my_tensor.from_array(labels)
+                loss = criterion(model(x), y)
+                model.backward(loss.backward())
+                optimizer.step()
+
+            t_opt = timeit(optimizer.step, args.steps)
+            t_train = timeit(train_step, args.steps)
+            print('%-8s flat=%-5s step: %8.1f steps/s  %9d B peak alloc | '
+                  'train: %6.1f steps/s' % (
+                      name, flat, 1 / t_opt, peak_alloc(optimizer.step),
+                      1 / t_train))
+
+
+def bench_step(args):
+    """Time and peak traced memory of one MNIST training step, inputs included."""
+    model = MLP(hidden_size=args.hidden_size)
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    optimizer = mytorch.Optim.Adam(model.parameters, lr=1e-3)
+    images, labels = synthetic_mnist(args.batch_size)
+
+    def inputs():
+        return my_tensor.from_array(images), my_tensor.from_array(labels)
+
+    def train_step():
+        x, y = inputs()
+        loss = criterion(model(x), y)
+        model.backward(loss.backward())
+        optimizer.step()
+
+    print('inputs: %8.3f ms  %10d B peak alloc' % (
+        timeit(inputs, args.steps) * 1e3, peak_alloc(inputs)))
+    print('step:   %8.3f ms  %10d B peak alloc' % (
+        timeit(train_step, args.steps) * 1e3, peak_alloc(train_step)))
+
+
+def bench_eval(args):
+    """Inference over the 10000-image test set size, with and without no_grad."""
+    model = MLP(hidden_size=args.hidden_size)
+    images, _ = synthetic_mnist(10000)
+
+    def forward():
+        return model(my_tensor.from_array(images))
+
+    def forward_no_grad():
+        with mytorch.no_grad():
+            return model(my_tensor.from_array(images))
+
+    for name, fn in [('recorded', forward), ('no_grad', forward_no_grad)]:
+        t = timeit(fn, args.steps // 10 or 1, warmup=1)
+        model.tape = None
+        print('%-8s: %8.2f ms  %10d B retained  %d ops kept on tape' % (
+            name, t * 1e3, retained_alloc(fn), len(model.tape or ())))
+        model.tape = None
+
+
+def bench_conv(args):
+    """LeNet training throughput, mytorch vs torch on CPU when available."""
+    images, labels = synthetic_mnist(args.batch_size)
+    images = images.reshape(-1, 1, 28, 28)
+
+    model = LeNet()
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    optimizer = mytorch.Optim.Adam(model.parameters, lr=1e-3)
+
+    def train_step():
+        x = my_tensor.from_array(images)
+        y = my_tensor.from_array(labels)
+        loss = criterion(model(x), y)
+        model.backward(loss.backward())
+        optimizer.step()
+
+    t = timeit(train_step, args.steps)
+    print('mytorch LeNet: %8.1f images/s' % (args.batch_size / t))
+
+    try:
+        import torch
+        import torch.nn as nn
+    except ImportError:
+        print('torch not installed, skipped the torch baseline')
+        return
+
+    torch.set_num_threads(1)
+    net = nn.Sequential(
+        nn.Conv2d(1, 6, 5, padding=2), nn.ReLU(), nn.MaxPool2d(2),
+        nn.Conv2d(6, 16, 5), nn.ReLU(), nn.MaxPool2d(2), nn.Flatten(),
+        nn.Linear(400, 120), nn.ReLU(), nn.Linear(120, 84), nn.ReLU(),
+        nn.Linear(84, 10))
+    torch_optimizer = torch.optim.Adam(net.parameters(), lr=1e-3)
+    x = torch.from_numpy(images).float()
+    y = torch.from_numpy(labels.ravel())
+
+    def torch_step():
+        loss = nn.functional.cross_entropy(net(x), y)
+        torch_optimizer.zero_grad()
+        loss.backward()
+        torch_optimizer.step()
+
+    t = timeit(torch_step, args.steps)
+    print('torch   LeNet: %8.1f images/s' % (args.batch_size / t))
+
+
+def bench_dtype(args):
+    """MNIST MLP train step per parameter dtype; float16 uses master weights."""
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    images, labels = synthetic_mnist(args.batch_size)
+
+    for dtype in [np.float64, np.float32, np.float16]:
+        model = MLP(hidden_size=args.hidden_size).to(dtype)
+        model.flatten_parameters()
+        optimizer = mytorch.Optim.Adam(model.parameters, lr=1e-3, flat=True)
+        x = my_tensor.from_array(images.astype(my_tensor.compute_dtype(dtype)))
+        y = my_tensor.from_array(labels)
+
+        def train_step():
+            loss = criterion(model(x), y)
+            model.backward(loss.backward())
+            optimizer.step()
+
+        t = timeit(train_step, args.steps)
+        param_bytes = sum(p.nbytes for p in model.parameters)
+        print('%-8s: %8.3f ms/step  %9d B parameters' % (
+            np.dtype(dtype).name, t * 1e3, param_bytes))
+
+
+def bench_loss(args):
+    """Softmax + CrossEntropy vs the fused SoftmaxCrossEntropy, fwd + bwd."""
+    for num_classes in [10, 1000]:
+        logits = np.random.randn(args.batch_size, num_classes).astype(np.float32)
+        labels = np.random.randint(0, num_classes, (args.batch_size, 1))
+        softmax = mytorch.Functional.Softmax()
+        pair = mytorch.Functional.CrossEntropy(n_classes=num_classes)
+        fused = mytorch.Functional.SoftmaxCrossEntropy(n_classes=num_classes)
+
+        def unfused_step():
+            return softmax.backward(pair(softmax(logits), labels).backward())
+
+        def fused_step():
+            return fused(logits, labels).backward()
+
+        for name, fn in [('softmax+ce', unfused_step), ('fused', fused_step)]:
+            print('C=%-5d %-10s: %8.1f us  %9d B peak alloc' % (
+                num_classes, name, timeit(fn, args.steps * 10) * 1e6,
+                peak_alloc(fn)))
+
+
+def bench_trace(args):
+    """Eager vs traced train steps on the half moon net and the MNIST MLP."""
+    images, labels = synthetic_mnist(args.batch_size)
+    cases = [
+        ('half moon, batch 16', HalfMoonNet(), np.random.randn(16, 2),
+         mytorch.Functional.MSELoss(n_classes=2), np.random.randint(0, 2, (16, 1))),
+        ('mnist mlp, batch %d' % args.batch_size, MLP(hidden_size=args.hidden_size),
+         images, mytorch.Functional.CrossEntropy(n_classes=10), labels),
+    ]
+    for name, model, x, criterion, y in cases:
+        model.flatten_parameters()
+        optimizer = mytorch.Optim.Adam(model.parameters, lr=1e-3, flat=True)
+        compiled = mytorch.jit.trace(model, x)
+
+        def step(net):
+            out = net(x)
+            if out.ndim == 1:
+                out = np.expand_dims(out, -1)
+            net.backward(criterion(out, y).backward())
+            optimizer.step()
+
+        t_eager = timeit(lambda: step(model), args.steps * 10)
+        t_traced = timeit(lambda: step(compiled), args.steps * 10)
+        print('%-22s eager: %8.1f steps/s   traced: %8.1f steps/s' % (
+            name, 1 / t_eager, 1 / t_traced))
+
+
+def bench_parallel(args):
+    """MNIST MLP training samples/s with 1/2/4/8 data-parallel workers."""
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    images, labels = synthetic_mnist(args.batch_size)
+
+    for workers in [1, 2, 4, 8]:
+        model = MLP(hidden_size=args.hidden_size)
+        with mytorch.parallel.DataParallel(model, criterion, workers) as trainer:
+            optimizer = mytorch.Optim.Adam(model.parameters, lr=1e-3, flat=True)
+
+            def train_step():
+                trainer.step(images, labels)
+                optimizer.step()
+
+            t = timeit(train_step, args.steps)
+        print('workers=%d: %8.1f samples/s' % (workers, args.batch_size / t))
+
+
+def write_idx(path, arr):
+    with open(path, 'wb') as f:
+        f.write(bytes([0, 0, 0x08, arr.ndim]))
+        f.write(struct.pack('>%di' % arr.ndim, *arr.shape))
+        f.write(arr.tobytes())
+
+
+def bench_loader(args):
+    """Epoch throughput of mytorch.data on MNIST-sized idx files."""
+    with tempfile.TemporaryDirectory() as root:
+        write_idx(os.path.join(root, 'train-images-idx3-ubyte'),
+                  np.random.randint(0, 256, (60000, 28, 28), dtype=np.uint8))
+        write_idx(os.path.join(root, 'train-labels-idx1-ubyte'),
+                  np.random.randint(0, 10, 60000, dtype=np.uint8))
+        dataset = mytorch.data.MNIST(root)
+        _bench_loader(args, dataset)
+
+
+def _bench_loader(args, dataset):
+
+    model = MLP(hidden_size=args.hidden_size)
+    model.flatten_parameters()
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    optimizer = mytorch.Optim.Adam(model.parameters, lr=1e-3, flat=True)
+
+    for prefetch in [0, 2]:
+        loader = mytorch.data.DataLoader(
+            dataset, batch_size=args.batch_size, shuffle=True, prefetch=prefetch)
+
+        start = time.perf_counter()
+        for images, labels in loader:
+            pass
+        t_load = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i, (images, labels) in enumerate(loader):
+            if i == 100:
+                break
+            loss = criterion(model(images.reshape(-1, 784)), labels.reshape(-1, 1))
+            model.backward(loss.backward())
+            optimizer.step()
+        t_train = time.perf_counter() - start
+
+        print('prefetch=%d: load only %9.0f images/s | '
+              'train 100 steps %6.2f s' % (
+                  prefetch, len(dataset) / t_load, t_train))
+
+
+def bench_profile(args):
+    """Per-op profile of MNIST MLP train steps, and the profiler's overhead."""
+    model = MLP(hidden_size=args.hidden_size)
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    optimizer = mytorch.Optim.SGD(model.parameters, lr=1e-3)
+    images, labels = synthetic_mnist(args.batch_size)
+
+    def train_step():
+        loss = criterion(model(images), labels)
+        model.backward(loss.backward())
+        optimizer.step()
+
+    t_off = timeit(train_step, args.steps)
+    with mytorch.profiler.profile() as prof:
+        t_on = timeit(train_step, args.steps)
+    t_after = timeit(train_step, args.steps)
+
+    print(prof.table())
+    path = os.path.join(tempfile.gettempdir(), 'mytorch_trace.json')
+    prof.export_chrome_trace(path)
+    print('chrome trace written to', path)
+    print('before: %.3f ms/step  profiled: %.3f ms/step  after: %.3f ms/step' % (
+        t_off * 1e3, t_on * 1e3, t_after * 1e3))
+
+
+def bench_accum(args):
+    """One batch trained whole vs as micro-batches with accumulation."""
+    model = MLP(hidden_size=args.hidden_size)
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    optimizer = mytorch.Optim.SGD(model.parameters, lr=1e-3)
+    images, labels = synthetic_mnist(args.batch_size)
+
+    def whole_step():
+        loss = criterion(model(images), labels)
+        model.backward(loss.backward())
+        optimizer.step()
+
+    trainer = mytorch.parallel.MicroBatch(model, criterion, args.micro_batch)
+
+    def micro_step():
+        trainer.step(images, labels)
+        optimizer.step()
+
+    for name, fn in [('whole', whole_step), ('micro %d' % args.micro_batch, micro_step)]:
+        print('batch %d %-9s: %8.2f ms/step  %11d B peak alloc' % (
+            args.batch_size, name, timeit(fn, args.steps, warmup=1) * 1e3,
+            peak_alloc(fn)))
+
+
+class InputReLU(mytorch.Functional.ReLU):
+    """ReLU saving its float input, as it did before the packed mask."""
+
+    codec = None
+
+    def forward(self, x):
+        self.save_for_backward(x)
+        return np.maximum(x, 0)
+
+    def backward(self, dy):
+        x, = self.saved
+        return np.multiply(dy, x > 0, out=dy)
+
+
+def bench_saved(args):
+    """Memory kept for backward and step peak by saved-tensor codec,
+    MLP at batch 1k-16k."""
+    model = MLP(hidden_size=args.hidden_size)
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    optimizer = mytorch.Optim.SGD(model.parameters, lr=1e-3)
+    relu = model.relu
+    cases = [('float x', InputReLU(), None, None),
+             ('bool mask', relu, None, None),
+             ('packbits', relu, relu.codec, None),
+             ('float16', relu, relu.codec, mytorch.codec.Float16())]
+
+    for batch_size in [1024, 4096, 16384]:
+        images, labels = synthetic_mnist(batch_size)
+        images = images.astype(np.float32)
+
+        def train_step():
+            loss = criterion(model(images), labels)
+            model.backward(loss.backward())
+            optimizer.step()
+
+        for name, act, act_codec, fc2_codec in cases:
+            model.relu, act.codec, model.fc2.codec = act, act_codec, fc2_codec
+            kept = retained_alloc(lambda: model(images))
+            model.tape = None
+            print('batch %5d %-9s: %10d B kept for backward  %10d B step peak' % (
+                batch_size, name, kept, peak_alloc(train_step)))
+
+    model.relu = relu
+    del relu.codec, model.fc2.codec
+
+
+def bench_checkpoint(args):
+    """Deep MLP forward + backward with and without activation
+    checkpointing every 4 layers."""
+    criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+    images, labels = synthetic_mnist(args.batch_size)
+    images = images.astype(np.float32)
+
+    for depth in [16, 64]:
+        for segment in [0, 4]:
+            model = DeepMLP(depth, args.hidden_size, segment)
+
+            def train_step():
+                loss = criterion(model(images), labels)
+                model.backward(loss.backward())
+
+            kept = retained_alloc(lambda: model(images))
+            model.tape = None
+            t = timeit(train_step, max(args.steps // 5, 1), warmup=1)
+            print('depth %2d %-13s: %10d B kept for backward  %8.1f ms/fwd+bwd' % (
+                depth, 'checkpoint/%d' % segment if segment else 'plain', kept,
+                t * 1e3))
+            if segment:
+                print('    saved per segment:',
+                      [m.bytes_saved for m in model.body.modules])
+
+
+def bench_fuse(args):
+    """Linear+activation forward + backward, unfused vs LinearAct: the MNIST
+    MLP, and a 16 -> 2048 layer where the elementwise work dominates."""
+    F = mytorch.Functional
+
+    for act in [F.ReLU, F.Sigmoid]:
+        def mlp():
+            return mytorch.Sequential(
+                mytorch.Linear(784, args.hidden_size), act(),
+                mytorch.Linear(args.hidden_size, args.hidden_size), act(),
+                mytorch.Linear(args.hidden_size, 10))
+
+        def wide():
+            return mytorch.Sequential(mytorch.Linear(16, 2048), act())
+
+        for case, build, in_size, out_size in [('mlp', mlp, 784, 10),
+                                               ('16->2048', wide, 16, 2048)]:
+            x = np.random.rand(4096, in_size).astype(np.float32)
+            dy = np.random.randn(4096, out_size).astype(np.float32)
+            plain = build()
+            fused = F.fuse(build().load_state_dict(plain.state_dict()))
+
+            for name, model in [('unfused', plain), ('fused', fused)]:
+                def step():
+                    model(x)
+                    model.backward(dy.copy())
+
+                print('batch 4096 %-8s %-7s %-7s: %8.2f ms/step  %10d B peak alloc' % (
+                    case, act.__name__, name,
+                    timeit(step, args.steps) * 1e3, peak_alloc(step)))
+
+
+def bench_embedding(args):
+    """Embedding + Adam step time, row-sparse vs dense gradient, by vocab."""
+    for vocab in [10_000, 100_000, 1_000_000]:
+        ids = np.random.randint(0, vocab, (args.batch_size, 20))
+        for sparse in [True, False]:
+            emb = mytorch.Embedding(vocab, 32)
+            emb.w.sparse = sparse
+            optimizer = mytorch.Optim.Adam([emb.w], lr=1e-3)
+
+            def step():
+                out = emb(ids)
+                emb.backward(np.ones_like(out))
+                if not sparse:
+                    emb.w.grad = emb.w.grad.to_dense()
+                optimizer.step()
+
+            print('vocab %7d %-6s: %9.3f ms/step' % (
+                vocab, 'sparse' if sparse else 'dense',
+                timeit(step, max(args.steps // 5, 1), warmup=1) * 1e3))
+
+
+def bench_rnn(args):
+    """LSTM / GRU forward + backward over a sequence, against the time of
+    their GEMMs alone and torch on CPU when available."""
+    T, I, H, B = 35, 128, args.hidden_size, args.batch_size
+    x = np.random.randn(T, B, I).astype(np.float32)
+    dy = np.random.randn(T, B, H).astype(np.float32)
+
+    for cls, G in [(mytorch.LSTM, 4), (mytorch.GRU, 3)]:
+        rnn = cls(I, H)
+        w_x, w_h = np.asarray(rnn.w_x), np.asarray(rnn.w_h)
+        h = np.random.randn(B, H).astype(np.float32)
+        gates = np.empty((T * B, G * H), np.float32)
+        hw = np.empty((B, G * H), np.float32)
+
+        def step():
+            rnn(x)
+            rnn.backward(dy)
+
+        def gemms():
+            # forward: input projection + T recurrent GEMMs; backward: T
+            # recurrent GEMMs + dW_x, dW_h and dx
+            np.matmul(x.reshape(T * B, I), w_x, out=gates)
+            for _ in range(2 * T):
+                np.matmul(h, w_h, out=hw)
+            x.reshape(T * B, I).T.dot(gates)
+            gates[:, :H].T.dot(gates)
+            gates.dot(w_x.T)
+
+        t, t_gemm = timeit(step, args.steps), timeit(gemms, args.steps)
+        print('mytorch %-4s: %8.2f ms/seq, GEMMs alone %8.2f ms (%.0f%%)' % (
+            cls.__name__, t * 1e3, t_gemm * 1e3, t_gemm / t * 100))
+
+    try:
+        import torch
+        import torch.nn as nn
+    except ImportError:
+        print('torch not installed, skipped the torch baseline')
+        return
+
+    torch.set_num_threads(1)
+    for module in [nn.LSTM(I, H), nn.GRU(I, H)]:
+        tx = torch.from_numpy(x).requires_grad_()
+        tdy = torch.from_numpy(dy)
+
+        def torch_step():
+            module.zero_grad()
+            out, _ = module(tx)
+            out.backward(tdy)
+
+        t = timeit(torch_step, args.steps)
+        print('torch   %-4s: %8.2f ms/seq' % (type(module).__name__, t * 1e3))
+
+
+def bench_lbfgs(args):
+    """Half moon time to test accuracy: the script's mini-batch Adam against
+    full batch L-BFGS, counting forward + backward calls and samples."""
+    X, y = synthetic_moons()
+    x_train, y_train, x_test, y_test = X[:900], y[:900], X[900:], y[900:]
+    target = args.target
+    criterion = mytorch.Functional.MSELoss(n_classes=2)
+
+    def accuracy(model):
+        with mytorch.no_grad():
+            return ((model(x_test) > 0.5) == y_test).mean()
+
+    def report(name, epochs, seconds, calls, samples, acc):
+        reached = 'reached %.2f' % target if acc >= target else 'stopped at %.3f' % acc
+        print('%-18s %s: %4d epochs, %5d fwd+bwd calls, %7d samples, %6.2f s' % (
+            name, reached, epochs, calls, samples, seconds))
+
+    np.random.seed(729)
+    model = HalfMoonNet()
+    optimizer = mytorch.Optim.Adam(model.parameters, lr=1e-2)
+    start, calls = time.perf_counter(), 0
+    for epoch in range(1, 2001):
+        order = np.random.permutation(len(x_train))
+        for i in range(0, len(order), 16):
+            idx = order[i:i + 16]
+            loss = criterion(np.expand_dims(model(x_train[idx]), -1),
+                             y_train[idx].reshape(-1, 1))
+            model.backward(loss.backward())
+            optimizer.step()
+            calls += 1
+        acc = accuracy(model)
+        if acc >= target:
+            break
+    report('Adam, batch 16', epoch, time.perf_counter() - start, calls,
+           epoch * len(x_train), acc)
+
+    np.random.seed(729)
+    model = HalfMoonNet()
+    model.flatten_parameters()
+    optimizer = mytorch.Optim.LBFGS(model.parameters, max_iter=10)
+    targets = y_train.reshape(-1, 1)
+
+    def closure():
+        loss = criterion(np.expand_dims(model(x_train), -1), targets)
+        model.backward(loss.backward())
+        return loss.loss * len(x_train)
+
+    start = time.perf_counter()
+    for epoch in range(1, 201):
+        optimizer.step(closure)
+        acc = accuracy(model)
+        if acc >= target:
+            break
+    report('L-BFGS, full batch', epoch, time.perf_counter() - start,
+           optimizer.evals, optimizer.evals * len(x_train), acc)
+
+
+BENCHES = {
+    'tape': bench_tape,
+    'optim': bench_optim,
+    'step': bench_step,
+    'eval': bench_eval,
+    'conv': bench_conv,
+    'dtype': bench_dtype,
+    'loss': bench_loss,
+    'trace': bench_trace,
+    'parallel': bench_parallel,
+    'loader': bench_loader,
+    'profile': bench_profile,
+    'accum': bench_accum,
+    'saved': bench_saved,
+    'checkpoint': bench_checkpoint,
+    'fuse': bench_fuse,
+    'embedding': bench_embedding,
+    'rnn': bench_rnn,
+    'lbfgs': bench_lbfgs,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="mytorch micro-benchmarks")
+    parser.add_argument('--bench', default='tape', choices=list(BENCHES))
+    parser.add_argument('--batch_size', default=128, type=int)
+    parser.add_argument('--hidden_size', default=500, type=int)
+    parser.add_argument('--steps', default=50, type=int)
+    parser.add_argument('--micro_batch', default=256, type=int,
+                        help='micro-batch size of the accum bench')
+    parser.add_argument('--target', default=0.97, type=float,
+                        help='test accuracy the lbfgs bench trains to')
+    args = parser.parse_args()
+    if args.bench == 'accum' and args.batch_size <= args.micro_batch:
+        parser.error('--bench accum needs --batch_size larger than --micro_batch')
+
+    np.random.seed(729)
+    BENCHES[args.bench](args)
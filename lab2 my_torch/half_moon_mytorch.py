@@ -1,7 +1,6 @@
 import utils
 import mytorch
 from mytorch import my_tensor
-from mytorch.myglobal import graph
 
 import numpy as np
 import matplotlib.pyplot as plt
@@ -52,14 +51,13 @@ def test(model, x_test, y_test):
     Return the precise and recall on the test dataset
     """
     predict = []
-    for i, (x, y) in enumerate(zip(x_test, y_test)):
-        x = my_tensor.from_array(x)
-        y = my_tensor.from_array(np.array(y))
-        predict.append(model.forward(x))
+    with mytorch.no_grad():
+        for i, (x, y) in enumerate(zip(x_test, y_test)):
+            x = my_tensor.from_array(x)
+            y = my_tensor.from_array(np.array(y))
+            predict.append(model(x))
     P, R = utils.mertix(predict, y_test)
 
-    graph.flush()  # 清除算子图
-
     return P, R
 
 ii = 0
@@ -72,8 +70,8 @@ def plot_predictions(X, y, model, axes):
     x1s = np.linspace(axes[2], axes[3], p)
     x0, x1 = np.meshgrid(x0s, x1s)
     X = np.c_[x0.ravel(), x1.ravel()]
-    y_pred = np.array(model.forward(X)>0.5,dtype=int).reshape(p,p)
-    graph.flush()
+    with mytorch.no_grad():
+        y_pred = np.array(model(X)>0.5,dtype=int).reshape(p,p)
     # import pdb;pdb.set_trace()
     plt.contourf(x0, x1, y_pred, cmap=plt.cm.brg, alpha=0.2)
     plt.title("Classifier")
@@ -111,7 +109,12 @@ def main():
     parser.add_argument('--hidden_size', default=500, type=int)
     parser.add_argument('--num_classes', default=10, type=int)
     parser.add_argument('--input_size', default=784, type=int)
-    parser.add_argument('--optim', default='Adam', type=str)
+    parser.add_argument('--optim', default='Adam', type=str,
+                        help='Adam, SGD, Adagrad, RMSProp or LBFGS (full batch)')
+    parser.add_argument('--max_iter', default=20, type=int,
+                        help='LBFGS iterations per epoch')
+    parser.add_argument('--trace', action='store_true',
+                        help='replay full batches through a traced static graph')
     args = parser.parse_args()
 
     X, y = generate_data()
@@ -120,7 +123,12 @@ def main():
     show_data(x_test, y_test)
 
     model = Net(X.shape[1])
-    if args.optim == 'Adam':
+    if args.optim == 'LBFGS':
+        # full batch: every epoch is one `step` of up to `max_iter` iterations
+        model.flatten_parameters()
+        optimizer = mytorch.Optim.LBFGS(
+            module_params=model.parameters, lr=1, max_iter=args.max_iter)
+    elif args.optim == 'Adam':
         optimizer = mytorch.Optim.Adam(
             module_params=model.parameters, lr=args.learning_rate)
     elif args.optim == 'SGD':
@@ -133,6 +141,8 @@ def main():
         optimizer = mytorch.Optim.RMSProp(
             module_params=model.parameters, lr=args.learning_rate)
     criterion = mytorch.Functional.MSELoss(n_classes=2)
+    if args.trace:
+        compiled = mytorch.jit.trace(model, x_train[:args.batch_size])
 
     # Visualize
     # Start the server by: `python -m visdom.server`
@@ -142,18 +152,34 @@ def main():
     # Train
     for epoch in range(args.num_epochs):
 
-        for x, y in get_batches(x_train, y_train, batch_size=args.batch_size):
+        if args.optim == 'LBFGS':
+            x, y = my_tensor.from_array(x_train), np.expand_dims(y_train, -1)
 
-            x = my_tensor.from_array(x)
-            y = my_tensor.from_array(np.array(y))
+            def closure():
+                loss = criterion(np.expand_dims(model(x), -1), y)
+                model.backward(loss.backward())
+                return loss.loss * len(x)
+
+            optimizer.step(closure)
+            with mytorch.no_grad():
+                loss = criterion(np.expand_dims(model(x), -1), y)
+
+        else:
+            for x, y in get_batches(x_train, y_train, batch_size=args.batch_size):
+
+                x = my_tensor.from_array(x)
+                y = my_tensor.from_array(np.array(y))
+
+                # the traced graph is fixed to full batches
+                net = compiled if args.trace and len(x) == args.batch_size else model
 
-            # Forward Pass
-            output = model.forward(x)
-            loss = criterion(np.expand_dims(output, -1), y)
+                # Forward Pass
+                output = net(x)
+                loss = criterion(np.expand_dims(output, -1), y)
 
-            # Backward and Optimize
-            model.backward(loss.backward())
-            optimizer.step()
+                # Backward and Optimize
+                net.backward(loss.backward())
+                optimizer.step()
 
         if epoch%100 == 0:
             plot_predictions(x_train,y_train,model,[-3,3,-3,3])
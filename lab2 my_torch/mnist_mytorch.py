@@ -2,11 +2,8 @@ import utils
 import mytorch
 import numpy as np
 from mytorch import my_tensor
-from mytorch.myglobal import graph
 
-import torch
 import torchvision
-import torchvision.transforms as transforms
 import argparse
 
 # Random Seed
@@ -15,14 +12,16 @@ utils.setup_seed(729)
 # Device configuration
 # device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
-# Preprocess
+# Preprocess, applied to whole batches already scaled to [0, 1]
 preprocess = False
 img_size = 12 if preprocess else 28
-transform = transforms.Compose([
-    transforms.CenterCrop(img_size),
-    transforms.ToTensor(),
-    transforms.Normalize(0.5, 0.5)
-]) if preprocess else transforms.ToTensor()
+crop = (28 - img_size) // 2
+
+
+def transform(images):
+    # CenterCrop(img_size) + Normalize(0.5, 0.5)
+    images = images[:, crop:crop+img_size, crop:crop+img_size]
+    return (images - 0.5) / 0.5
 
 # Hyper-parameters
 parser = argparse.ArgumentParser(description="Opional arguments for training")
@@ -34,19 +33,34 @@ parser.add_argument('--hidden_size', default=500, type=int)
 parser.add_argument('--num_classes', default=10, type=int)
 parser.add_argument('--input_size', default=784, type=int)
 parser.add_argument('--optim', default='Adam', type=str)
+parser.add_argument('--model', default='mlp', choices=['mlp', 'lenet'])
+parser.add_argument('--workers', default=1, type=int,
+                    help='data-parallel worker processes, implies --flat')
+parser.add_argument('--flat', action='store_true',
+                    help='fused optimizer steps over one flat parameter buffer')
+parser.add_argument('--micro_batch', default=0, type=int,
+                    help='accumulate gradients over micro-batches of this size')
+parser.add_argument('--resume', default='', type=str,
+                    help='checkpoint written by a previous run, e.g. model.npz')
 args = parser.parse_args()
+if args.workers > 1 and args.micro_batch:
+    parser.error('--micro_batch cannot be combined with --workers > 1')
+input_shape = (-1, 1, img_size, img_size) if args.model == 'lenet' \
+    else (-1, img_size**2)
 
-# MNIST dataset
-train_dataset = torchvision.datasets.MNIST(
-    root="./data", train=True, transform=transform, download=True)
-test_dataset = torchvision.datasets.MNIST(
-    root="./data", train=False, transform=transform)
+# MNIST dataset: torchvision only fetches the raw idx files once
+torchvision.datasets.MNIST(root="./data", train=True, download=True)
+torchvision.datasets.MNIST(root="./data", train=False, download=True)
+train_dataset = mytorch.data.MNIST("./data/MNIST/raw", train=True)
+test_dataset = mytorch.data.MNIST("./data/MNIST/raw", train=False)
 
 # Data Loader
-train_loader = torch.utils.data.DataLoader(dataset=train_dataset,
-                                           batch_size=args.batch_size, shuffle=True)
-test_loader = torch.utils.data.DataLoader(dataset=test_dataset,
-                                          batch_size=args.batch_size, shuffle=False)
+train_loader = mytorch.data.DataLoader(
+    train_dataset, batch_size=args.batch_size, shuffle=True,
+    transform=transform if preprocess else None)
+test_loader = mytorch.data.DataLoader(
+    test_dataset, batch_size=args.batch_size, shuffle=False,
+    transform=transform if preprocess else None)
 
 
 def test(model):
@@ -55,23 +69,21 @@ def test(model):
     """
     total = 0
     correct = 0
-    for images, labels in test_loader:
-        images = my_tensor.from_array(
-            images.reshape(-1, img_size**2).numpy())
-        labels = my_tensor.from_array(labels.reshape(-1, 1).numpy())
+    with mytorch.no_grad():
+        for images, labels in test_loader:
+            images = my_tensor.from_array(
+                images.reshape(input_shape))
+            labels = my_tensor.from_array(labels.reshape(-1, 1))
 
-        predicted = model(images)
-        graph.flush()
+            predicted = model(images)
 
-        predicted = np.expand_dims(np.argmax(predicted, axis=-1), -1)
-        total += labels.shape[0]
-        correct += (predicted == labels).sum()
+            predicted = np.expand_dims(np.argmax(predicted, axis=-1), -1)
+            total += labels.shape[0]
+            correct += (predicted == labels).sum()
 
     print('Accuracy of the network on the %d test images: %.4f%%' %
           (len(test_loader)*len(images), 100*correct/total))
 
-    graph.flush()  # 清除算子图，避免计入梯度
-
     return 100*correct/total
 
 
@@ -84,40 +96,81 @@ class NeuralNet(mytorch.Module):
         self.fc1 = mytorch.Linear(input_size, hidden_size)
         self.fc2 = mytorch.Linear(hidden_size, num_classes)
         self.relu = mytorch.Functional.ReLU()
-        self.softmax = mytorch.Functional.Softmax()
 
         self.parameters = [self.fc1.w, self.fc2.w]
 
-    def __call__(self, x: np.ndarray) -> np.ndarray:
-
-        return self.forward(x)
-
     def forward(self, x):
         out = self.fc1(x)
         out = self.relu(out)
         out = self.fc2(out)
-        out = self.softmax(out)
+
+        return out
+
+
+# Convolutional network: two conv/pool stages and three linear layers
+class LeNet(mytorch.Module):
+    def __init__(self, img_size, num_classes):
+        super(LeNet, self).__init__()
+
+        feature_size = ((img_size // 2) - 4) // 2
+
+        # layers
+        self.conv1 = mytorch.Conv2d(1, 6, kernel_size=5, padding=2)
+        self.conv2 = mytorch.Conv2d(6, 16, kernel_size=5)
+        self.fc1 = mytorch.Linear(16 * feature_size**2, 120)
+        self.fc2 = mytorch.Linear(120, 84)
+        self.fc3 = mytorch.Linear(84, num_classes)
+        self.pool = mytorch.Functional.MaxPool2d(2)
+        self.relu = mytorch.Functional.ReLU()
+        self.flatten = mytorch.Functional.Flatten()
+
+        self.parameters = [self.conv1.w, self.conv2.w,
+                           self.fc1.w, self.fc2.w, self.fc3.w]
+
+    def forward(self, x):
+        out = self.pool(self.relu(self.conv1(x)))
+        out = self.pool(self.relu(self.conv2(out)))
+        out = self.flatten(out)
+        out = self.relu(self.fc1(out))
+        out = self.relu(self.fc2(out))
+        out = self.fc3(out)
 
         return out
 
 
 # Model
-model = NeuralNet(args.input_size, args.hidden_size, args.num_classes)
+if args.model == 'lenet':
+    model = LeNet(img_size, args.num_classes)
+else:
+    model = NeuralNet(args.input_size, args.hidden_size, args.num_classes)
 
 # Loss_fn and Optimizer
-criterion = mytorch.Functional.CrossEntropy(n_classes=10)
+criterion = mytorch.Functional.SoftmaxCrossEntropy(n_classes=10)
+trainer = None
+if args.workers > 1:
+    trainer = mytorch.parallel.DataParallel(model, criterion, args.workers)
+    args.flat = True
+elif args.micro_batch:
+    trainer = mytorch.parallel.MicroBatch(model, criterion, args.micro_batch)
+if args.flat and args.workers <= 1:
+    model.flatten_parameters()
 if args.optim == 'Adam':
     optimizer = mytorch.Optim.Adam(
-        module_params=model.parameters, lr=args.learning_rate)
+        module_params=model.parameters, lr=args.learning_rate, flat=args.flat)
 elif args.optim == 'SGD':
     optimizer = mytorch.Optim.SGD(
-        module_params=model.parameters, lr=args.learning_rate, momentum=0.9)
+        module_params=model.parameters, lr=args.learning_rate, momentum=0.9, flat=args.flat)
 elif args.optim == 'Adagrad':
     optimizer = mytorch.Optim.Adagrad(
-        module_params=model.parameters, lr=args.learning_rate)
+        module_params=model.parameters, lr=args.learning_rate, flat=args.flat)
 elif args.optim == 'RMSProp':
     optimizer = mytorch.Optim.RMSProp(
-        module_params=model.parameters, lr=args.learning_rate)
+        module_params=model.parameters, lr=args.learning_rate, flat=args.flat)
+
+if args.resume:
+    checkpoint = mytorch.load(args.resume)
+    model.load_state_dict(checkpoint['model'])
+    optimizer.load_state_dict(checkpoint['optim'])
 
 # Visualize
 # Start the server by: `python -m visdom.server`
@@ -130,21 +183,27 @@ total_step = len(train_loader)
 for epoch in range(args.num_epochs):
     for i, (images, labels) in enumerate(train_loader):
         images = my_tensor.from_array(
-            images.reshape(-1, img_size**2).numpy())
-        labels = my_tensor.from_array(labels.reshape(-1, 1).numpy())
+            images.reshape(input_shape))
+        labels = my_tensor.from_array(labels.reshape(-1, 1))
 
-        # Forward pass
-        outputs = model(images)
-        loss = criterion(outputs, labels)
+        if trainer is not None:
+            loss_value = trainer.step(images, labels)
+        else:
+            # Forward pass
+            outputs = model(images)
+            loss = criterion(outputs, labels)
 
-        # Backward and Optimize
-        model.backward(loss.backward())
+            # Backward
+            model.backward(loss.backward())
+            loss_value = loss.loss
+
+        # Optimize
         optimizer.step()
 
         if (i+1) % 100 == 0:
-            vis.plot('loss', loss.loss)
+            vis.plot('loss', loss_value)
             print('Epoch [%d/%d], Step [%d/%d], Loss: %.4f' %
-                  (epoch + 1, args.num_epochs, i+1, total_step, loss.loss))
+                  (epoch + 1, args.num_epochs, i+1, total_step, loss_value))
 
     # lr decay
     optimizer.lr *= args.lr_decay
@@ -154,5 +213,9 @@ for epoch in range(args.num_epochs):
     test_accuracy = test(model)
     vis.plot('test_accuracy', test_accuracy)
 
+if trainer is not None:
+    trainer.close()
+
 # Save the model checkpoint
-# torch.save(model.state_dict(), 'model.ckpt')
+mytorch.save({'model': model.state_dict(), 'optim': optimizer.state_dict()},
+             'model.npz')
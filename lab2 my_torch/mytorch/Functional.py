@@ -1,8 +1,8 @@
 import numpy as np
-from .Modules import Module
-
-import torch
-import torch.nn.functional as F
+from . import my_tensor
+from .Modules import Module, Linear, Sequential, sliding_windows
+from .codec import PackBits
+from .myglobal import is_grad_enabled
 
 
 class Sigmoid(Module):
@@ -16,9 +16,10 @@ class Sigmoid(Module):
             out: output of shape (N, L_out).
         """
 
-        self.x = x
+        y = 1/(1+np.exp(-x))
+        self.save_for_backward(y)
 
-        return 1/(1+np.exp(-x))
+        return y
 
     def backward(self, dy):
         """Backward propagation of Sigmoid.
@@ -29,11 +30,28 @@ class Sigmoid(Module):
             dx: input delta of shape (N, L_in).
         """
 
-        return dy * np.exp(-self.x)/((1+np.exp(-self.x))**2)
+        y, = self.saved
+
+        return dy * y * (1 - y)
+
+    def fused_forward(self, z):
+        """In-place sigmoid of a chunk, for `LinearAct`."""
+        np.negative(z, out=z)
+        np.exp(z, out=z)
+        z += 1
+        np.reciprocal(z, out=z)
+
+    def fused_backward(self, dy, y, tmp):
+        """In-place dy * y * (1 - y) on a chunk, for `LinearAct`."""
+        np.subtract(1, y, out=tmp)
+        tmp *= y
+        dy *= tmp
 
 
 class ReLU(Module):
 
+    codec = PackBits()  # the saved mask takes one bit per element
+
     def forward(self, x):
         """Forward propagation of ReLU.
 
@@ -43,9 +61,10 @@ class ReLU(Module):
             out: output of shape (N, L_out).
         """
 
-        self.x = x
+        if is_grad_enabled():  # no mask to build for inference
+            self.save_for_backward(x > 0)
 
-        return np.where(x > 0, x, 0)
+        return np.maximum(x, 0)
 
     def backward(self, dy):
         """Backward propagation of ReLU.
@@ -55,9 +74,18 @@ class ReLU(Module):
         Returns:
             dx: input delta of shape (N, L_in).
         """
-        dy[self.x < 0] = 0
+        mask, = self.saved
 
-        return dy
+        return np.multiply(dy, mask, out=dy)
+
+    def fused_forward(self, z):
+        """In-place ReLU of a chunk, for `LinearAct`."""
+        np.maximum(z, 0, out=z)
+
+    def fused_backward(self, dy, y, tmp):
+        """In-place dy * (y > 0) on a chunk, for `LinearAct`."""
+        np.greater(y, 0, out=tmp)
+        dy *= tmp
 
 
 class argmax(Module):
@@ -70,10 +98,10 @@ class argmax(Module):
         Returns:
             out: output of shape (N, 1).
         """
-        self.x = x
-        self.out = np.argmax(x, axis=1).reshape(-1, 1) - 1
+        out = np.argmax(x, axis=1).reshape(-1, 1) - 1
+        self.save_for_backward(x, out)
 
-        return self.out
+        return out
 
     def backward(self, dy):
         """Backward propagation of Sigmoid.
@@ -83,9 +111,10 @@ class argmax(Module):
         Returns:
             dx: input delta of shape (N, L_in).
         """
-        dy = np.zeros_like(self.x)
-        for i in range(self.x.shape[0]):
-            dy[i][self.out[i]] = 1
+        x, out = self.saved
+        dy = np.zeros_like(x)
+        for i in range(x.shape[0]):
+            dy[i][out[i]] = 1
 
         return dy
 
@@ -104,13 +133,13 @@ class Softmax(Module):
             out: output of shape (batch_size, num_class).
         """
 
-        self.x = x
         x_max = np.max(x, axis=1, keepdims=True)
         x_exp = np.exp(x-x_max)
-        self.y = x_exp / x_exp.sum(axis=1, keepdims=True)
-        self.y = np.where(self.y > 1e-45, self.y, 0)
+        y = x_exp / x_exp.sum(axis=1, keepdims=True)
+        y = np.where(y > 1e-45, y, 0)
+        self.save_for_backward(y)
 
-        return self.y
+        return y
 
     def backward(self, dy):
         """Backward propagation of Softmax.
@@ -143,6 +172,185 @@ class Softmax(Module):
         return dy
 
 
+class MaxPool2d(Module):
+
+    def __init__(self, kernel_size, stride=None):
+        self.kernel_size = kernel_size
+        self.stride = stride or kernel_size
+
+    def forward(self, x):
+        """Forward propagation of MaxPool2d.
+
+        Args:
+            x: input of shape (N, C, H, W).
+        Returns:
+            out: output of shape (N, C, OH, OW).
+        """
+
+        k = self.kernel_size
+        windows = sliding_windows(x, k, self.stride)
+        N, C, OH, OW, _, _ = windows.shape
+        # keyed by shape: one pool is often shared by layers of different sizes
+        cols = self.workspace('cols%s' % (windows.shape,), windows.shape, x.dtype)
+        np.copyto(cols, windows)
+        cols = cols.reshape(N, C, OH, OW, k * k)
+
+        idx = cols.argmax(axis=-1)
+        self.save_for_backward(x.shape, idx)
+
+        return np.take_along_axis(cols, idx[..., None], axis=-1)[..., 0]
+
+    def backward(self, dy):
+        """Backward propagation of MaxPool2d.
+
+        Args:
+            dy: output delta of shape (N, C, OH, OW).
+        Returns:
+            dx: input delta of shape (N, C, H, W).
+        """
+
+        (N, C, H, W), idx = self.saved
+        k, s = self.kernel_size, self.stride
+        OH, OW = idx.shape[-2:]
+
+        # flat position in dx of the max of every window
+        rows = np.arange(OH).reshape(-1, 1) * s + idx // k
+        cols = np.arange(OW) * s + idx % k
+        planes = np.arange(N * C).reshape(N, C, 1, 1) * (H * W)
+        pos = planes + rows * W + cols
+
+        dx = np.bincount(pos.ravel(), weights=dy.ravel(), minlength=N*C*H*W)
+
+        return dx.reshape(N, C, H, W).astype(dy.dtype, copy=False)
+
+
+class Flatten(Module):
+
+    def forward(self, x):
+        """Forward propagation of Flatten.
+
+        Args:
+            x: input of shape (N, ...).
+        Returns:
+            out: output of shape (N, L).
+        """
+
+        self.save_for_backward(x.shape)
+
+        return x.reshape(x.shape[0], -1)
+
+    def backward(self, dy):
+        """Backward propagation of Flatten.
+
+        Args:
+            dy: output delta of shape (N, L).
+        Returns:
+            dx: input delta of shape (N, ...).
+        """
+
+        shape, = self.saved
+
+        return dy.reshape(shape)
+
+
+class Identity(Module):
+
+    def forward(self, x):
+        return x
+
+
+FUSE_CHUNK_BYTES = 1 << 17  # byte budget per chunk, a few chunk buffers fit in L2
+
+
+class LinearAct(Linear):
+    """Linear followed by ReLU or Sigmoid as one op.
+
+    After the GEMM, the bias add and the activation run in place over
+    blocks of rows of about `FUSE_CHUNK_BYTES`, so each block is read from
+    memory once instead of once per elementwise op; backward applies the
+    activation gradient to dy the same way before the Linear backward. The
+    op saves its input and its output, which the next layer keeps anyway,
+    and shares the weight tensor of the Linear it was built from.
+    """
+
+    def __init__(self, linear: Linear, act: Module):
+        self.w = linear.w
+        self.act = act
+
+    def block_rows(self, out):
+        return max(1, FUSE_CHUNK_BYTES // (out.shape[1] * out.itemsize))
+
+    def forward(self, x):
+        """Forward propagation of LinearAct.
+
+        Args:
+            x: input of shape (N, in_features).
+        Returns:
+            out: output of shape (N, out_features).
+        """
+
+        x = x.astype(my_tensor.compute_dtype(self.w.dtype), copy=False)
+        if len(x.shape) < 2:
+            x = np.broadcast_to(x, [1, x.shape[0]])
+        out = x.dot(self.w[1:])
+        step = self.block_rows(out)
+        for start in range(0, out.shape[0], step):
+            z = out[start:start + step]
+            z += self.w[0]
+            self.act.fused_forward(z)
+        self.save_for_backward(x, out)
+
+        return out
+
+    def backward(self, dy):
+        """Backward propagation of LinearAct.
+
+        Args:
+            dy: output delta of shape (N, out_features), overwritten.
+        Returns:
+            dx: input delta of shape (N, in_features).
+        """
+
+        x, y = self.saved
+        dy = np.reshape(dy, y.shape)
+        if not dy.flags.writeable or dy.dtype != y.dtype:
+            dy = dy.astype(y.dtype)
+        n, step = y.shape[0], self.block_rows(y)
+        tmp = self.workspace('tmp', (min(step, n), y.shape[1]), y.dtype)
+        for start in range(0, n, step):
+            stop = min(start + step, n)
+            self.act.fused_backward(dy[start:stop], y[start:stop],
+                                    tmp[:stop - start])
+
+        # the output is no longer needed: release it before the GEMMs
+        del y
+        self.saved = (x,)
+        return super(LinearAct, self).backward(dy)
+
+
+def fuse(module: Module) -> Module:
+    """Replaces every Linear directly followed by a ReLU or Sigmoid inside
+    the `Sequential` containers of `module` with one `LinearAct`.
+
+    The activation slot becomes an `Identity`, so parameter names, and
+    with them `state_dict`, are unchanged. Run it before
+    `flatten_parameters` or after; the weights are shared, not copied.
+    """
+
+    for value in list(vars(module).values()):
+        if isinstance(value, Module):
+            fuse(value)
+    if isinstance(module, Sequential):
+        mods = module.modules
+        for i in range(len(mods) - 1):
+            if type(mods[i]) is Linear and isinstance(mods[i+1], (ReLU, Sigmoid)):
+                mods[i], mods[i+1] = LinearAct(mods[i], mods[i+1]), Identity()
+                setattr(module, str(i), mods[i])
+                setattr(module, str(i+1), mods[i+1])
+
+    return module
+
+
 class Loss:
     """
     Usage:
@@ -181,8 +389,8 @@ class MSELoss(Loss):
             loss: output of shape (1).
         """
         self.x = predict
-        self.y = targets
-        self.loss = 0.5*np.mean((targets - predict)**2)
+        self.y = targets.astype(predict.dtype, copy=False)
+        self.loss = 0.5*np.mean((self.y - predict)**2)
 
         return self
 
@@ -218,7 +426,7 @@ class CrossEntropy(Loss):
 
         if targets.shape[-1] == 1:
             targets = targets.squeeze(-1)
-        I = np.eye(self.n_classes)
+        I = np.eye(self.n_classes, dtype=predict.dtype)
         self.y = I[targets]
         self.delta = 1e-10
         self.loss = np.mean(-np.sum(self.y *
@@ -238,3 +446,45 @@ class CrossEntropy(Loss):
         # dy = (-self.y / (self.x + self.delta) / self.y.shape[0])
         dy = self.x - self.y
         return dy
+
+
+class SoftmaxCrossEntropy(Loss):
+    """Softmax and CrossEntropy fused, on raw logits and integer labels.
+
+    Use in place of a final Softmax layer + CrossEntropy; like that pair,
+    the gradient is `softmax(x) - onehot(y)`, summed over the batch.
+    """
+
+    def __call__(self, predict, targets):
+        """Forward propagation of SoftmaxCrossEntropy Loss.
+
+        Args:
+            predict: logits of shape (batch_size, num_class).
+            targets: integer labels of shape (batch_size, ) or (batch_size, 1).
+        Returns:
+            loss: output of shape (1).
+        """
+
+        targets = np.asarray(targets).reshape(-1)
+        rows = np.arange(targets.shape[0])
+
+        # log-sum-exp: loss = log(sum(exp(x - max))) - (x[y] - max)
+        z = predict - np.max(predict, axis=1, keepdims=True)
+        picked = z[rows, targets]
+        np.exp(z, out=z)
+        z_sum = z.sum(axis=1, keepdims=True)
+        self.loss = np.mean(np.log(z_sum[:, 0]) - picked)
+
+        # z becomes the gradient in place: softmax, minus 1 on the label column
+        z /= z_sum
+        z[rows, targets] -= 1
+        self.dy = z
+
+        return self
+
+    def backward(self,):
+        """
+        Backward propagation of SoftmaxCrossEntropy.
+        """
+
+        return self.dy
@@ -1,12 +1,19 @@
 import numpy as np
+from collections import OrderedDict
+from numpy.lib.stride_tricks import as_strided
 from . import my_tensor
-from mytorch.myglobal import graph
+from mytorch.myglobal import Tape, current_tape, no_grad
+from mytorch.myglobal import is_grad_enabled, is_grad_accumulating
 
 
 class Module(object):
     """Base class for all neural network modules.
     """
 
+    tape = None   # tape recorded by the last outermost call of this module
+    saved = None  # tensors stashed by forward for the matching backward
+    codec = None  # mytorch.codec.Codec encoding `saved` while on the tape
+
     def __init__(self) -> None:
         """If a module behaves different between training and testing,
         its init method should inherit from this one."""
@@ -16,12 +23,30 @@ class Module(object):
     def __call__(self, x: np.ndarray) -> np.ndarray:
         """Defines calling forward method at every call.
         Should not be overridden by subclasses.
+
+        The outermost call starts a fresh tape for this forward pass; nested
+        calls append one record to it, so recording costs O(1) per op.
+        Nothing is recorded under `no_grad`.
         """
 
-        idx = len(list(graph.dict.keys()))
-        graph.dict[str(idx)] = self
+        if not is_grad_enabled():
+            return self.forward(x)
 
-        return self.forward(x)
+        tape = current_tape()
+        if tape is None:
+            self.tape = Tape()
+            with self.tape:
+                return self.forward(x)
+
+        out = self.forward(x)
+        if self.is_op():
+            saved = self.saved
+            if self.codec is not None:
+                saved = self.codec.encode(saved)
+            tape.record(self, saved)
+        self.saved = None
+
+        return out
 
     def forward(self, x: np.ndarray) -> np.ndarray:
         """Defines the forward propagation of the module performed at every call.
@@ -31,16 +56,135 @@ class Module(object):
 
     def backward(self, dy: np.ndarray) -> np.ndarray:
         """Defines the backward propagation of the module.
+
+        Containers inherit this one, which replays the tape recorded by
+        their last forward in reverse and then releases it.
+        """
+
+        tape, self.tape = self.tape, None
+        if tape is None:
+            raise RuntimeError(
+                f"{self.get_name()}.backward called without a recorded forward")
+
+        return tape.backward(dy)
+
+    def save_for_backward(self, *tensors):
+        """Stashes the tensors backward will need; read back from `self.saved`.
+        A no-op under `no_grad`."""
+        if is_grad_enabled():
+            self.saved = tensors
+
+    def is_op(self) -> bool:
+        """Ops define their own backward; containers only record their children."""
+        return type(self).backward is not Module.backward
+
+    def named_parameters(self, prefix: str = '', _seen=None):
+        """Yields (name, tensor) for every Tensor attribute of this module
+        and its sub-modules, each tensor once, in attribute order."""
+
+        seen = set() if _seen is None else _seen
+        for name, value in vars(self).items():
+            if isinstance(value, my_tensor.Tensor):
+                if id(value) not in seen:
+                    seen.add(id(value))
+                    yield prefix + name, value
+            elif isinstance(value, Module):
+                yield from value.named_parameters(prefix + name + '.', seen)
+
+    def flatten_parameters(self, data=None, grad=None) -> list:
+        """Moves all parameters into one contiguous data buffer and one
+        gradient buffer, rebinding each attribute to a view into it.
+
+        Must be called before the optimizer is built; `self.parameters` is
+        updated in place if the module keeps one. See `my_tensor.flatten`
+        for `data` and `grad`. Sparse parameters (`Embedding`) are left
+        out, since a dense gradient buffer is what they avoid.
+        """
+
+        named = [(n, t) for n, t in self.named_parameters() if not t.sparse]
+        views = my_tensor.flatten([t for _, t in named], data, grad)
+        self._rebind_parameters(named, views)
+
+        return views
+
+    def to(self, dtype):
+        """Casts all parameters to `dtype`, e.g. np.float16 for half
+        precision storage. Like `flatten_parameters`, call it before the
+        optimizer is built."""
+
+        named = list(self.named_parameters())
+        cast = [my_tensor.from_array(t.astype(dtype), requires_grad=True)
+                for _, t in named]
+        self._rebind_parameters(named, cast)
+
+        return self
+
+    def state_dict(self) -> OrderedDict:
+        """Returns the parameters found by `named_parameters`, by name.
+
+        The values are the parameters themselves, not copies; pass the dict
+        to `mytorch.save` to write a checkpoint.
+        """
+
+        return OrderedDict(self.named_parameters())
+
+    def load_state_dict(self, state: dict, assign: bool = False):
+        """Loads parameters from a dict produced by `state_dict`.
+
+        By default values are copied into the existing parameters, so flat
+        buffers and optimizers built on them stay valid. With `assign=True`
+        the parameters are rebound to the given arrays without copying:
+        loading from `mytorch.load(path)` then only maps the file, and pages
+        are read on first use. Do this before `flatten_parameters` and
+        before building the optimizer.
         """
 
-        op_rev_list = list(graph.dict.keys())[::-1]
-        for op_idx in op_rev_list:
-            # print(f"backward in {op_idx} : {graph.dict[op_idx]}")
-            dy = graph.dict[op_idx].backward(dy)
+        named = list(self.named_parameters())
+        missing = [name for name, _ in named if name not in state]
+        unexpected = [name for name in state if name not in dict(named)]
+        if missing or unexpected:
+            raise KeyError(
+                f'state_dict mismatch, missing: {missing}, unexpected: {unexpected}')
+        for name, param in named:
+            if np.shape(state[name]) != param.shape:
+                raise ValueError(
+                    f'{name}: expected shape {param.shape}, '
+                    f'got {np.shape(state[name])}')
+
+        if assign:
+            new = [my_tensor.from_array(state[name], requires_grad=True)
+                   for name, _ in named]
+            self._rebind_parameters(named, new)
+        else:
+            for name, param in named:
+                param[...] = state[name]
+
+        return self
 
-        graph.flush()  # 总模型每次backward完成后，必须清空graph.dict；但是每个算子在backward时不能清空graph.dict，需要重载
+    def _rebind_parameters(self, named, new_tensors):
+        replace = {}
+        for (name, old), new in zip(named, new_tensors):
+            *path, attr = name.split('.')
+            owner = self
+            for p in path:
+                owner = getattr(owner, p)
+            new.sparse = old.sparse
+            setattr(owner, attr, new)
+            replace[id(old)] = new
 
-        return dy
+        params = getattr(self, 'parameters', None)
+        if isinstance(params, list):
+            params[:] = [replace.get(id(p), p) for p in params]
+
+    def workspace(self, name: str, shape: tuple, dtype) -> np.ndarray:
+        """Returns a scratch buffer cached on the module, allocated with zeros
+        and only reallocated when the requested shape or dtype changes."""
+
+        spaces = self.__dict__.setdefault('_workspaces', {})
+        buf = spaces.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = spaces[name] = np.zeros(shape, dtype=dtype)
+        return buf
 
     def get_name(self) -> str:
         name = self.__class__.__name__
@@ -49,16 +193,17 @@ class Module(object):
 
 class Linear(Module):
 
-    def __init__(self, in_features: int, out_features: int):
+    def __init__(self, in_features: int, out_features: int, dtype=None):
         """Module which applies linear transformation to input.
 
         Args:
             in_features: L_in from expected input shape (N, L_in).
             out_features: L_out from output shape (N, L_out).
+            dtype: parameter dtype, the global default if None.
         """
 
         # w[0] for bias and w[1:] for weight
-        self.w = my_tensor.tensor((in_features + 1, out_features))
+        self.w = my_tensor.tensor((in_features + 1, out_features), dtype)
 
     def forward(self, x):
         """Forward propagation of linear module.
@@ -68,10 +213,12 @@ class Linear(Module):
         Returns:
             out: output of shape (out_features, ).
         """
-        self.x = x
-        if len(self.x.shape) < 2:
-            self.x = np.broadcast_to(self.x, [1, self.x.shape[0]])
-        out = self.x.dot(self.w[1:]) + self.w[0]
+        x = x.astype(my_tensor.compute_dtype(self.w.dtype), copy=False)
+        if len(x.shape) < 2:
+            x = np.broadcast_to(x, [1, x.shape[0]])
+        self.save_for_backward(x)
+        out = x.dot(self.w[1:])
+        out += self.w[0]
         return out
 
     def backward(self, dy):
@@ -83,16 +230,553 @@ class Linear(Module):
             dx: input delta of shape (L_in).
         """
 
-        if len(self.x.shape) < 2:
-            self.x = np.broadcast_to(
-                self.x, [1, self.x.shape[0]])  # (b,n_feature)
-        batch = self.x.shape[0]
+        x, = self.saved  # (b,n_feature)
+        batch = x.shape[0]
         if dy.shape is None:
             dy = np.broadcast_to(dy, [batch, self.w.shape[-1]])
         elif len(dy.shape) < 2:
             dy = np.reshape(dy, (-1, self.w.shape[-1]))
 
-        self.w.grad[1:, :] = (self.x.T).dot(dy)
-        self.w.grad[0] = dy.sum(axis=0) * 1
+        if is_grad_accumulating():
+            self.w.grad[1:, :] += (x.T).dot(dy)
+            self.w.grad[0] += dy.sum(axis=0)
+        else:
+            self.w.grad[1:, :] = (x.T).dot(dy)
+            self.w.grad[0] = dy.sum(axis=0)
 
         return dy.dot(self.w[1:].T)
+
+
+class Embedding(Module):
+
+    def __init__(self, num_embeddings: int, embedding_dim: int, dtype=None):
+        """Lookup table mapping integer ids to rows of a trainable weight.
+
+        The weight gradient is row-sparse: backward sets `w.grad` to a
+        `my_tensor.RowSparse` holding only the rows in the batch, and the
+        optimizers update only those rows, so a step costs time in the
+        number of ids in the batch, not in `num_embeddings`.
+
+        Args:
+            num_embeddings: vocabulary size V.
+            embedding_dim: row size D.
+            dtype: parameter dtype, the global default if None.
+        """
+
+        self.w = my_tensor.tensor((num_embeddings, embedding_dim), dtype)
+        self.w.sparse = True
+
+    def forward(self, x):
+        """Forward propagation of embedding module.
+
+        Args:
+            x: integer ids of any shape S.
+        Returns:
+            out: output of shape S + (embedding_dim, ).
+        """
+
+        x = np.asarray(x)
+        self.save_for_backward(x)
+        return self.w[x]
+
+    def backward(self, dy):
+        """Backward propagation of embedding module.
+
+        Args:
+            dy: output delta of shape S + (embedding_dim, ).
+        Returns:
+            None: ids have no delta, so this must be the first op.
+        """
+
+        x, = self.saved
+        ids = x.reshape(-1)
+        dy = np.reshape(dy, (len(ids), -1))
+        grad = my_tensor.RowSparse(ids, dy.astype(self.w.dtype, copy=False),
+                                   self.w.shape)
+        grad = grad.coalesce()
+
+        if is_grad_accumulating() and self.w.grad is not None:
+            grad = self.w.grad + grad
+        self.w.grad = grad
+
+        return None
+
+
+def sliding_windows(x, kernel_size, stride):
+    """Read-only view of the k*k windows of x as (N, C, OH, OW, k, k).
+
+    Args:
+        x: input of shape (N, C, H, W).
+    """
+
+    N, C, H, W = x.shape
+    OH = (H - kernel_size) // stride + 1
+    OW = (W - kernel_size) // stride + 1
+    sN, sC, sH, sW = x.strides
+
+    return as_strided(x, shape=(N, C, OH, OW, kernel_size, kernel_size),
+                      strides=(sN, sC, sH * stride, sW * stride, sH, sW),
+                      writeable=False)
+
+
+class Conv2d(Module):
+
+    def __init__(self, in_channels: int, out_channels: int, kernel_size: int,
+                 stride: int = 1, padding: int = 0, dtype=None):
+        """Module which applies a 2D convolution as im2col + a single GEMM.
+
+        Args:
+            in_channels: C from expected input shape (N, C, H, W).
+            out_channels: O from output shape (N, O, OH, OW).
+            kernel_size: size k of the square k*k kernel.
+            dtype: parameter dtype, the global default if None.
+        """
+
+        self.in_channels = in_channels
+        self.out_channels = out_channels
+        self.kernel_size = kernel_size
+        self.stride = stride
+        self.padding = padding
+
+        # w[0] for bias and w[1:] for the (C*k*k, O) weight matrix, as Linear;
+        # scaled by fan-in so stacked convolutions stay in range
+        fan_in = in_channels * kernel_size * kernel_size
+        self.w = my_tensor.random((fan_in + 1, out_channels), scale=fan_in ** -0.5,
+                                  dtype=dtype, requires_grad=True)
+
+    def im2col(self, x):
+        """Copies the windows of x into the reused (N*OH*OW, C*k*k) workspace."""
+
+        N, C, H, W = x.shape
+        p, k = self.padding, self.kernel_size
+        if p:
+            x_pad = self.workspace('x_pad', (N, C, H + 2*p, W + 2*p), x.dtype)
+            x_pad[:, :, p:p+H, p:p+W] = x  # the border stays zero
+            x = x_pad
+
+        windows = sliding_windows(x, k, self.stride)
+        _, _, OH, OW, _, _ = windows.shape
+        cols = self.workspace('cols', (N, OH, OW, C, k, k), x.dtype)
+        np.copyto(cols, windows.transpose(0, 2, 3, 1, 4, 5))
+
+        return cols.reshape(N * OH * OW, C * k * k), (OH, OW)
+
+    def forward(self, x):
+        """Forward propagation of convolution module.
+
+        Args:
+            x: input of shape (N, C, H, W).
+        Returns:
+            out: output of shape (N, O, OH, OW).
+        """
+
+        # only the input is kept; backward rebuilds cols in the workspace,
+        # so the module can appear several times on one tape
+        x = x.astype(my_tensor.compute_dtype(self.w.dtype), copy=False)
+        self.save_for_backward(x)
+        cols, (OH, OW) = self.im2col(x)
+        out = cols.dot(self.w[1:]) + self.w[0]
+
+        return out.reshape(x.shape[0], OH, OW, -1).transpose(0, 3, 1, 2)
+
+    def backward(self, dy):
+        """Backward propagation of convolution module.
+
+        Args:
+            dy: output delta of shape (N, O, OH, OW).
+        Returns:
+            dx: input delta of shape (N, C, H, W).
+        """
+
+        x, = self.saved
+        N, C, H, W = x.shape
+        p, k, s = self.padding, self.kernel_size, self.stride
+        cols, (OH, OW) = self.im2col(x)
+        dy = dy.transpose(0, 2, 3, 1).reshape(-1, self.out_channels)
+
+        if is_grad_accumulating():
+            self.w.grad[1:, :] += (cols.T).dot(dy)
+            self.w.grad[0] += dy.sum(axis=0)
+        else:
+            self.w.grad[1:, :] = (cols.T).dot(dy)
+            self.w.grad[0] = dy.sum(axis=0)
+
+        dcols = self.workspace('dcols', cols.shape, x.dtype)
+        np.matmul(dy, self.w[1:].T, out=dcols)
+        dcols = dcols.reshape(N, OH, OW, C, k, k).transpose(0, 3, 1, 2, 4, 5)
+
+        # col2im: scatter-add each kernel offset back onto the padded input
+        dx = self.workspace('dx_pad', (N, C, H + 2*p, W + 2*p), x.dtype)
+        dx.fill(0)
+        for i in range(k):
+            for j in range(k):
+                dx[:, :, i:i + s*OH:s, j:j + s*OW:s] += dcols[..., i, j]
+
+        return dx[:, :, p:p+H, p:p+W].copy()
+
+
+class Sequential(Module):
+    """Container calling its modules in order.
+
+    The modules are stored as attributes '0', '1', ..., so their
+    parameters are found by `named_parameters`.
+    """
+
+    def __init__(self, *modules):
+        for i, module in enumerate(modules):
+            setattr(self, str(i), module)
+        self.modules = list(modules)
+
+    def forward(self, x):
+        for module in self.modules:
+            x = module(x)
+        return x
+
+
+class Checkpoint(Module):
+    """Runs `segment` without keeping its activations, and recomputes
+    them from the segment input during backward.
+
+    The forward pass records nothing inside the segment; only its input is
+    saved. Backward replays the segment onto a fresh tape and runs that
+    tape backward, so a model split into k segments keeps k boundary
+    activations plus one segment of interior activations at a time, for
+    one extra forward of compute.
+
+    Attributes:
+        bytes_saved: bytes of interior activations the segment did not
+            keep during the last forward, measured at recomputation.
+    """
+
+    def __init__(self, segment: Module):
+        self.segment = segment
+        self.bytes_saved = 0
+
+    def forward(self, x):
+        self.save_for_backward(x)
+        with no_grad():
+            return self.segment(x)
+
+    def backward(self, dy):
+        x, = self.saved
+        tape = Tape()
+        with tape:
+            self.segment(x)
+        self.bytes_saved = sum(getattr(t, 'nbytes', 0)
+                               for _, saved in tape.records for t in saved or ())
+        self.bytes_saved -= getattr(x, 'nbytes', 0)
+
+        return tape.backward(dy)
+
+    def get_name(self) -> str:
+        return 'Checkpoint(' + self.segment.get_name() + ')'
+
+
+def checkpoint(segment: Module) -> Checkpoint:
+    """Wraps `segment` for activation recomputation, see `Checkpoint`.
+
+    Usage:
+        >>> self.block1 = checkpoint(Sequential(Linear(784, 500), ReLU(),
+        ...                                     Linear(500, 500), ReLU()))
+    """
+
+    return Checkpoint(segment)
+
+
+class _Recurrent(Module):
+    """Shared parts of `LSTM` and `GRU`.
+
+    The weight is a single tensor holding the bias row(s), then W_x
+    (input_size, G*H) and W_h (hidden_size, G*H) with the G gates side by
+    side, so each timestep is one (B, H) x (H, G*H) GEMM. The input part of
+    every timestep is one (T*B, I) x (I, G*H) GEMM written straight into the
+    gate buffer before the recurrence starts; backward overwrites the gate
+    buffer with the gate deltas, and the weight gradients are again one GEMM
+    each over all timesteps.
+
+    Inputs are time-major, (T, B, input_size), and the output is the hidden
+    state of every step, (T, B, hidden_size). With `stateful=True` a forward
+    starts from the final state of the previous one, which gives truncated
+    BPTT when a long sequence is fed window by window with a backward after
+    each: gradients stop at the window boundary. `reset_state()` starts a
+    new sequence.
+
+    The gate buffers are workspaces reused by every forward, so the module
+    can be called only once per tape.
+    """
+
+    n_gates = 1
+    bias_rows = 1
+
+    def __init__(self, input_size: int, hidden_size: int,
+                 stateful: bool = False, dtype=None):
+        self.input_size = input_size
+        self.hidden_size = hidden_size
+        self.stateful = stateful
+        self.state = None
+        self.calls = 0
+        from .Functional import Sigmoid  # Functional imports this module
+        self.sigmoid = Sigmoid()  # its in-place kernel for the gates
+
+        self.w = my_tensor.random(
+            (self.bias_rows + input_size + hidden_size,
+             self.n_gates * hidden_size),
+            scale=hidden_size ** -0.5, dtype=dtype, requires_grad=True)
+
+    @property
+    def w_x(self):
+        return self.w[self.bias_rows:self.bias_rows + self.input_size]
+
+    @property
+    def w_h(self):
+        return self.w[self.bias_rows + self.input_size:]
+
+    def reset_state(self):
+        self.state = None
+
+    def initial_state(self, batch, dtype, n):
+        if self.stateful and self.state is not None:
+            return self.state
+        return [np.zeros((batch, self.hidden_size), dtype)] * n
+
+    def project_inputs(self, x):
+        """x W_x + b of all timesteps, in the (T, B, G*H) gate workspace."""
+        T, B, _ = x.shape
+        G = self.n_gates * self.hidden_size
+        gates = self.workspace('gates', (T, B, G), x.dtype)
+        np.matmul(x.reshape(T * B, -1), self.w_x, out=gates.reshape(T * B, G))
+        gates += self.w[0]
+        return gates
+
+    def check_calls(self, calls):
+        if calls != self.calls:
+            raise RuntimeError(self.get_name() + ' was called again before '
+                               'its backward; the gate buffers hold that call')
+
+    def set_grad(self, rows, g):
+        if is_grad_accumulating():
+            self.w.grad[rows] += g
+        else:
+            self.w.grad[rows] = g
+
+    def weight_backward(self, x, h, dgx, dgh):
+        """Weight gradients from the deltas of the input (dgx) and hidden
+        (dgh) projections of all timesteps; returns the input delta."""
+
+        T, B, _ = x.shape
+        G = self.n_gates * self.hidden_size
+        dgx, dgh = dgx.reshape(T * B, G), dgh.reshape(T * B, G)
+        start = self.bias_rows + self.input_size
+
+        self.set_grad(slice(self.bias_rows, start),
+                      x.reshape(T * B, -1).T.dot(dgx))
+        self.set_grad(slice(start, None), h[:-1].reshape(T * B, -1).T.dot(dgh))
+        self.set_grad(0, dgx.sum(axis=0))
+
+        return dgx.dot(self.w_x.T).reshape(x.shape)
+
+
+class LSTM(_Recurrent):
+
+    n_gates = 4
+
+    def __init__(self, input_size: int, hidden_size: int,
+                 stateful: bool = False, dtype=None):
+        """Long short-term memory layer, gates ordered i, f, g, o as in
+        `torch.nn.LSTM`. See `_Recurrent` for the layout and truncated BPTT.
+
+        Args:
+            input_size: I from expected input shape (T, B, I).
+            hidden_size: H from output shape (T, B, H).
+            stateful: start each forward from the last final (h, c).
+            dtype: parameter dtype, the global default if None.
+        """
+
+        # w[0] for bias, then W_x and W_h
+        super(LSTM, self).__init__(input_size, hidden_size, stateful, dtype)
+
+    def forward(self, x):
+        """Forward propagation of LSTM module.
+
+        Args:
+            x: input of shape (T, B, input_size).
+        Returns:
+            out: hidden states of shape (T, B, hidden_size).
+        """
+
+        x = x.astype(my_tensor.compute_dtype(self.w.dtype), copy=False)
+        T, B, _ = x.shape
+        H = self.hidden_size
+        self.calls += 1
+
+        gates = self.project_inputs(x)
+        c = self.workspace('c', (T + 1, B, H), x.dtype)
+        tanh_c = self.workspace('tanh_c', (T, B, H), x.dtype)
+        hw = self.workspace('hw', (B, 4 * H), x.dtype)
+        tmp = self.workspace('tmp', (B, H), x.dtype)
+        h = np.empty((T + 1, B, H), x.dtype)
+        h[0], c[0] = self.initial_state(B, x.dtype, 2)
+
+        w_h = self.w_h
+        for t in range(T):
+            a = gates[t]
+            np.matmul(h[t], w_h, out=hw)
+            a += hw
+            self.sigmoid.fused_forward(a[:, :2*H])
+            self.sigmoid.fused_forward(a[:, 3*H:])
+            np.tanh(a[:, 2*H:3*H], out=a[:, 2*H:3*H])
+            i, f, g, o = a[:, :H], a[:, H:2*H], a[:, 2*H:3*H], a[:, 3*H:]
+
+            np.multiply(f, c[t], out=c[t + 1])
+            np.multiply(i, g, out=tmp)
+            c[t + 1] += tmp
+            np.tanh(c[t + 1], out=tanh_c[t])
+            np.multiply(o, tanh_c[t], out=h[t + 1])
+
+        if self.stateful:
+            self.state = h[T].copy(), c[T].copy()
+        self.save_for_backward(x, h, self.calls)
+
+        return h[1:]
+
+    def backward(self, dy):
+        """Backward propagation of LSTM module.
+
+        Args:
+            dy: output delta of shape (T, B, hidden_size).
+        Returns:
+            dx: input delta of shape (T, B, input_size).
+        """
+
+        x, h, calls = self.saved
+        self.check_calls(calls)
+        T, B, _ = x.shape
+        H = self.hidden_size
+        gates = self.workspace('gates', (T, B, 4 * H), x.dtype)
+        c = self.workspace('c', (T + 1, B, H), x.dtype)
+        tanh_c = self.workspace('tanh_c', (T, B, H), x.dtype)
+
+        w_h = self.w_h
+        dh = np.zeros((B, H), x.dtype)
+        dc = np.zeros((B, H), x.dtype)
+        for t in reversed(range(T)):
+            dh += dy[t]
+            a, tc = gates[t], tanh_c[t]
+            i, f, g, o = a[:, :H], a[:, H:2*H], a[:, 2*H:3*H], a[:, 3*H:]
+
+            do = dh * tc
+            dc += dh * o * (1 - tc * tc)
+            di, dg, df = dc * g, dc * i, dc * c[t]
+            dc *= f
+
+            # the gates of step t are not needed again: store their deltas
+            a[:, :H] = di * i * (1 - i)
+            a[:, H:2*H] = df * f * (1 - f)
+            a[:, 2*H:3*H] = dg * (1 - g * g)
+            a[:, 3*H:] = do * o * (1 - o)
+            np.matmul(a, w_h.T, out=dh)
+
+        return self.weight_backward(x, h, gates, gates)
+
+
+class GRU(_Recurrent):
+
+    n_gates = 3
+    bias_rows = 2
+
+    def __init__(self, input_size: int, hidden_size: int,
+                 stateful: bool = False, dtype=None):
+        """Gated recurrent unit layer, gates ordered r, z, n as in
+        `torch.nn.GRU`. See `_Recurrent` for the layout and truncated BPTT.
+
+        Args:
+            input_size: I from expected input shape (T, B, I).
+            hidden_size: H from output shape (T, B, H).
+            stateful: start each forward from the last final h.
+            dtype: parameter dtype, the global default if None.
+        """
+
+        # w[0] for the input bias, w[1] for the hidden bias (the candidate
+        # gate applies r after it), then W_x and W_h
+        super(GRU, self).__init__(input_size, hidden_size, stateful, dtype)
+
+    def forward(self, x):
+        """Forward propagation of GRU module.
+
+        Args:
+            x: input of shape (T, B, input_size).
+        Returns:
+            out: hidden states of shape (T, B, hidden_size).
+        """
+
+        x = x.astype(my_tensor.compute_dtype(self.w.dtype), copy=False)
+        T, B, _ = x.shape
+        H = self.hidden_size
+        self.calls += 1
+
+        gates = self.project_inputs(x)
+        hn = self.workspace('hn', (T, B, H), x.dtype)
+        hw = self.workspace('hw', (B, 3 * H), x.dtype)
+        h = np.empty((T + 1, B, H), x.dtype)
+        h[0], = self.initial_state(B, x.dtype, 1)
+
+        w_h = self.w_h
+        for t in range(T):
+            a = gates[t]
+            np.matmul(h[t], w_h, out=hw)
+            hw += self.w[1]
+            a[:, :2*H] += hw[:, :2*H]
+            self.sigmoid.fused_forward(a[:, :2*H])
+            r, z, n = a[:, :H], a[:, H:2*H], a[:, 2*H:]
+
+            hn[t] = hw[:, 2*H:]
+            n += r * hn[t]
+            np.tanh(n, out=n)
+            # h' = (1 - z) n + z h
+            np.subtract(h[t], n, out=h[t + 1])
+            h[t + 1] *= z
+            h[t + 1] += n
+
+        if self.stateful:
+            self.state = h[T].copy(),
+        self.save_for_backward(x, h, self.calls)
+
+        return h[1:]
+
+    def backward(self, dy):
+        """Backward propagation of GRU module.
+
+        Args:
+            dy: output delta of shape (T, B, hidden_size).
+        Returns:
+            dx: input delta of shape (T, B, input_size).
+        """
+
+        x, h, calls = self.saved
+        self.check_calls(calls)
+        T, B, _ = x.shape
+        H = self.hidden_size
+        gates = self.workspace('gates', (T, B, 3 * H), x.dtype)
+        hn = self.workspace('hn', (T, B, H), x.dtype)
+        dgh = self.workspace('dgh', (T, B, 3 * H), x.dtype)
+
+        w_h = self.w_h
+        dh = np.zeros((B, H), x.dtype)
+        for t in reversed(range(T)):
+            dh += dy[t]
+            a, d = gates[t], dgh[t]
+            r, z, n = a[:, :H], a[:, H:2*H], a[:, 2*H:]
+
+            dn = dh * (1 - z) * (1 - n * n)
+            d[:, :H] = dn * hn[t] * r * (1 - r)
+            d[:, H:2*H] = dh * (h[t] - n) * z * (1 - z)
+            d[:, 2*H:] = dn * r
+            dh *= z
+
+            # the input side sees the same r, z deltas and dn without r
+            a[:, :2*H] = d[:, :2*H]
+            a[:, 2*H:] = dn
+            dh += d.dot(w_h.T)
+
+        self.set_grad(1, dgh.reshape(T * B, -1).sum(axis=0))
+        return self.weight_backward(x, h, gates, dgh)
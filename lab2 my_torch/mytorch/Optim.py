@@ -1,69 +1,223 @@
 import numpy as np
 from copy import deepcopy
-from .my_tensor import Tensor, zeros
+from collections import OrderedDict
+from .my_tensor import Tensor, flat_buffers, from_array
 
 
 class Optim(object):
+    """Base class for all optimizers.
 
-    def __init__(self, module_params: list, lr: float = 1e-3):
+    With `flat=True` the parameters must come from
+    `Module.flatten_parameters()`: every step is then a handful of in-place
+    ufunc calls over the shared data/gradient buffers, and the statistics
+    live in preallocated buffers of the same size, so a step allocates
+    nothing.
+
+    Parameters stored as float16 are updated through float32 master
+    copies, which also hold the optimizer statistics; the model's half
+    precision weights are refreshed from them after every step.
+
+    Sparse parameters (`Embedding`) are kept out of both paths: their
+    `RowSparse` gradient is applied by `_update_sparse`, which touches only
+    the rows in the batch, of the weight and of its statistics alike.
+    """
+
+    _state = ()  # names of the statistics attributes, saved by `state_dict`
+
+    def __init__(self, module_params: list, lr: float = 1e-3, flat: bool = False):
         self.lr = lr
+        self.sparse_params = [p for p in module_params if getattr(p, 'sparse', False)]
+        if self.sparse_params:
+            module_params = [p for p in module_params if not getattr(p, 'sparse', False)]
         self.params = module_params
+        self.flat = flat
+        self.master = any(p.dtype == np.float16 for p in module_params)
+        if flat:
+            self.flat_param, self.flat_grad = flat_buffers(module_params)
+            if self.master:
+                self.model_param, self.model_grad = self.flat_param, self.flat_grad
+                self.flat_param = self.model_param.astype(np.float32)
+                self.flat_grad = np.zeros_like(self.flat_param)
+            self._buf = np.empty_like(self.flat_param)  # step scratch space
+        elif self.master:
+            self.model_params = module_params
+            self.params = [from_array(p.astype(np.float32), requires_grad=True)
+                           for p in module_params]
 
     def step(self):
+        for i, param in enumerate(self.sparse_params):
+            if param.grad is not None:
+                self._update_sparse(i, param, param.grad.coalesce())
+                param.grad = None
+        if self.flat:
+            if self.master:
+                np.copyto(self.flat_grad, self.model_grad)
+            self._update_flat()
+            self.flat_grad.fill(0)
+            if self.master:
+                np.copyto(self.model_param, self.flat_param)
+                self.model_grad.fill(0)
+            return
         for i, param in enumerate(self.params):
             if type(param) != Tensor:
                 print('Error: `param` must be `Tensor`.')
                 return
+            if self.master:
+                param.grad[...] = self.model_params[i].grad
             self._update_weight(i, param)
+            if self.master:
+                self.model_params[i][...] = param
+                self.model_params[i].grad.fill(0)
+
+    def state_dict(self) -> OrderedDict:
+        """Returns the optimizer statistics (and float32 master weights) by
+        name; per-tensor statistics are stored as 'name.i'."""
+
+        state = OrderedDict()
+        for name in self._state:
+            value = getattr(self, name, None)
+            if isinstance(value, list):
+                for i, v in enumerate(value):
+                    state[f'{name}.{i}'] = np.asarray(v)
+            elif value is not None:
+                state[name] = np.asarray(value)
+        if not self.flat:
+            for i, p in enumerate(self.params):
+                if p.momentum_grad is not None:
+                    state[f'momentum_grad.{i}'] = p.momentum_grad
+        if self.master:
+            if self.flat:
+                state['master'] = self.flat_param
+            else:
+                for i, p in enumerate(self.params):
+                    state[f'master.{i}'] = p
+        return state
+
+    def load_state_dict(self, state: dict):
+        """Restores the statistics from `state_dict`, copying arrays into the
+        existing buffers."""
+
+        for key, value in state.items():
+            name, _, i = key.partition('.')
+            if name == 'momentum_grad':
+                self.params[int(i)].momentum_grad = np.array(value)
+                continue
+            if name == 'master':
+                target = self.params[int(i)] if i else self.flat_param
+                target[...] = value
+                continue
+            if name not in self._state:
+                raise KeyError(f'unexpected optimizer state {key}')
+
+            owner, index = (getattr(self, name), int(i)) if i else (None, None)
+            current = owner[index] if i else getattr(self, name)
+            if isinstance(current, np.ndarray):
+                current[...] = value
+            elif i:
+                owner[index] = np.asarray(value).item()
+            else:
+                setattr(self, name, np.asarray(value).item())
 
     def _update_weight(self, i, tensor):
         tensor -= self.lr * tensor.grad
 
+    def _update_flat(self):
+        np.multiply(self.flat_grad, self.lr, out=self._buf)
+        self.flat_param -= self._buf
+
+    def _update_sparse(self, i, tensor, grad):
+        tensor[grad.indices] -= self.lr * grad.values
+
 
 class SGD(Optim):
 
-    def __init__(self, module_params: list, lr: float = 1e-4, momentum: float = 0, dampening: float = 0, nesterov: bool = False):
-        super(SGD, self).__init__(lr)
-        self.params = module_params
+    _state = ('momentum_buf', 'steps', 'sparse_momentum')
+
+    def __init__(self, module_params: list, lr: float = 1e-4, momentum: float = 0, dampening: float = 0, nesterov: bool = False, flat: bool = False):
+        super(SGD, self).__init__(module_params, lr, flat)
         self.momentum = momentum  # Momentum
         self.dampening = dampening
         self.nesterov = nesterov  # NAG
 
+        if flat and momentum > 0:
+            self.momentum_buf = np.zeros_like(self.flat_param)
+            self.steps = 0
+        if momentum > 0:
+            self.sparse_momentum = [np.zeros_like(p) for p in self.sparse_params]
+
     def _update_weight(self, i, tensor):
         # batch_num = tensor.shape[0]
         # idx = np.random.choice(batch_num,1)
         # target_batch = tensor[0,]
+        grad = tensor.grad
         if self.momentum > 0:
             if tensor.momentum_grad is None:
-                tensor.momentum_grad = deepcopy(self.grad)
+                tensor.momentum_grad = deepcopy(grad)
             else:
                 tensor.momentum_grad = self.momentum * \
-                    tensor.momentum_grad + (1-self.dampening) * tensor.grad
+                    tensor.momentum_grad + (1-self.dampening) * grad
 
             if self.nesterov:
-                tensor.grad = tensor.grad + self.momentum * tensor.momentum_grad
+                grad = grad + self.momentum * tensor.momentum_grad
             else:
-                tensor.grad = tensor.momentum_grad
+                grad = tensor.momentum_grad
 
-        v = self.lr * tensor.grad
+        v = self.lr * grad
         tensor -= v
 
-        tensor.grad = zeros(tensor.grad.shape)
+        tensor.grad.fill(0)
+
+    def _update_flat(self):
+        g, buf = self.flat_grad, self._buf
+        if self.momentum > 0:
+            m = self.momentum_buf
+            if self.steps == 0:
+                np.copyto(m, g)
+            else:
+                m *= self.momentum
+                np.multiply(g, 1-self.dampening, out=buf)
+                m += buf
+            self.steps += 1
+
+            if self.nesterov:
+                np.multiply(m, self.momentum, out=buf)
+                buf += g
+                g = buf
+            else:
+                g = m
+
+        np.multiply(g, self.lr, out=buf)
+        self.flat_param -= buf
+
+    def _update_sparse(self, i, tensor, grad):
+        rows, g = grad.indices, grad.values
+        if self.momentum > 0:
+            m = self.momentum * self.sparse_momentum[i][rows] + (1-self.dampening) * g
+            self.sparse_momentum[i][rows] = m
+            g = g + self.momentum * m if self.nesterov else m
+
+        tensor[rows] -= self.lr * g
 
 
 class Adagrad(Optim):
 
-    def __init__(self, module_params: list, lr: float = 1e-2, lr_decay: float = 0, eps: float = 1e-10):
-        super(Adagrad, self).__init__(module_params)
-        self.lr = lr
+    _state = ('grad_square_sum', 'steps', 'sparse_square_sum', 'sparse_steps')
+
+    def __init__(self, module_params: list, lr: float = 1e-2, lr_decay: float = 0, eps: float = 1e-10, flat: bool = False):
+        super(Adagrad, self).__init__(module_params, lr, flat)
         self.lr_decay = lr_decay
         self.eps = eps
-        self.params = module_params
 
         # statistics
-        self.grad_square_sum = [np.zeros_like(self.params[i])
-                                for i in range(len(self.params))]
-        self.steps = [0 for _ in range(len(self.params))]
+        if flat:
+            self.grad_square_sum = np.zeros_like(self.flat_param)
+            self.steps = 0
+        else:
+            self.grad_square_sum = [np.zeros_like(self.params[i])
+                                    for i in range(len(self.params))]
+            self.steps = [0 for _ in range(len(self.params))]
+        self.sparse_square_sum = [np.zeros_like(p) for p in self.sparse_params]
+        self.sparse_steps = [0 for _ in self.sparse_params]
 
     def _update_weight(self, i, tensor):
         self.grad_square_sum[i] += tensor.grad ** 2
@@ -73,56 +227,126 @@ class Adagrad(Optim):
         v = clr * tensor.grad / (np.sqrt(self.grad_square_sum[i]) + self.eps)
         tensor -= v
 
-        tensor.grad = zeros(tensor.grad.shape)
+        tensor.grad.fill(0)
+
+    def _update_flat(self):
+        g, s, buf = self.flat_grad, self.grad_square_sum, self._buf
+        np.multiply(g, g, out=buf)
+        s += buf
+        self.steps += 1
+
+        clr = self.lr * (1 / (1 + self.lr_decay * (self.steps-1)))
+        np.sqrt(s, out=buf)
+        buf += self.eps
+        np.divide(g, buf, out=buf)
+        buf *= clr
+        self.flat_param -= buf
+
+    def _update_sparse(self, i, tensor, grad):
+        rows, g = grad.indices, grad.values
+        s = self.sparse_square_sum[i][rows] + g ** 2
+        self.sparse_square_sum[i][rows] = s
+        self.sparse_steps[i] += 1
+
+        clr = self.lr * (1 / (1 + self.lr_decay * (self.sparse_steps[i]-1)))
+        tensor[rows] -= clr * g / (np.sqrt(s) + self.eps)
 
 
 class RMSProp(Optim):
 
-    def __init__(self, module_params: list, lr: float = 1e-3, alpha: float = 0.99, eps: float = 1e-8, momentum: float = 0):
-        super(RMSProp, self).__init__(lr)
+    _state = ('grad_square_avg', 'momentum_buf', 'steps',
+              'sparse_square_avg', 'sparse_momentum')
+
+    def __init__(self, module_params: list, lr: float = 1e-3, alpha: float = 0.99, eps: float = 1e-8, momentum: float = 0, flat: bool = False):
+        super(RMSProp, self).__init__(module_params, lr, flat)
         self.alpha = alpha
         self.eps = eps
         self.momentum = momentum
-        self.params = module_params
 
         # statistics
-        self.grad_square_avg = [np.zeros_like(
-            self.params[i]) for i in range(len(self.params))]  # Exponential Moving Average
-        self.steps = [0 for _ in range(len(self.params))]
+        if flat:
+            self.grad_square_avg = np.zeros_like(self.flat_param)
+            self.momentum_buf = np.zeros_like(self.flat_param)
+            self.steps = 0
+        else:
+            self.grad_square_avg = [np.zeros_like(
+                self.params[i]) for i in range(len(self.params))]  # Exponential Moving Average
+            self.steps = [0 for _ in range(len(self.params))]
+        self.sparse_square_avg = [np.zeros_like(p) for p in self.sparse_params]
+        if momentum > 0:
+            self.sparse_momentum = [np.zeros_like(p) for p in self.sparse_params]
 
     def _update_weight(self, i, tensor):
         self.grad_square_avg[i] = self.alpha * \
             self.grad_square_avg[i] + (1-self.alpha)*tensor.grad ** 2
         self.steps[i] += 1
 
+        v = tensor.grad / (np.sqrt(self.grad_square_avg[i]) + self.eps)
         if self.momentum > 0:
             if tensor.momentum_grad is None:
-                tensor.momentum_grad = deepcopy(self.grad)
+                tensor.momentum_grad = deepcopy(v)
             else:
-                tensor.momentum_grad = self.momentum * \
-                    tensor.momentum_grad + tensor.grad / \
-                    self.grad_square_avg[i]
-                tensor -= self.lr * tensor.momentum_grad
+                tensor.momentum_grad = self.momentum * tensor.momentum_grad + v
+            v = tensor.momentum_grad
 
-        v = self.lr * tensor.grad / \
-            (np.sqrt(self.grad_square_avg[i]) + self.eps)
-        tensor -= v
+        tensor -= self.lr * v
+
+        tensor.grad.fill(0)
+
+    def _update_flat(self):
+        g, a, buf = self.flat_grad, self.grad_square_avg, self._buf
+        a *= self.alpha
+        np.multiply(g, g, out=buf)
+        buf *= 1-self.alpha
+        a += buf
+        self.steps += 1
 
-        tensor.grad = zeros(tensor.grad.shape)
+        np.sqrt(a, out=buf)
+        buf += self.eps
+        np.divide(g, buf, out=buf)
+        if self.momentum > 0:
+            m = self.momentum_buf
+            m *= self.momentum
+            m += buf
+            np.multiply(m, self.lr, out=buf)
+        else:
+            buf *= self.lr
+        self.flat_param -= buf
+
+    def _update_sparse(self, i, tensor, grad):
+        # lazy: the averages of rows absent from the batch do not decay
+        rows, g = grad.indices, grad.values
+        a = self.alpha * self.sparse_square_avg[i][rows] + (1-self.alpha) * g ** 2
+        self.sparse_square_avg[i][rows] = a
+
+        v = g / (np.sqrt(a) + self.eps)
+        if self.momentum > 0:
+            v = self.momentum * self.sparse_momentum[i][rows] + v
+            self.sparse_momentum[i][rows] = v
+
+        tensor[rows] -= self.lr * v
 
 
 class Adam(Optim):
 
-    def __init__(self, module_params: list, lr: float = 1e-3, betas: tuple = (0.9, 0.999), eps: float = 1e-8, weight_decay: float = 0, amsgrad: bool = False):
-        super(Adam, self).__init__(module_params)
-        self.lr = lr
+    _state = ('m', 'v', 'steps', 'sparse_m', 'sparse_v', 'sparse_steps')
+
+    def __init__(self, module_params: list, lr: float = 1e-3, betas: tuple = (0.9, 0.999), eps: float = 1e-8, weight_decay: float = 0, amsgrad: bool = False, flat: bool = False):
+        super(Adam, self).__init__(module_params, lr, flat)
         self.betas = betas
         self.eps = eps
         self.weight_decay = weight_decay
         self.amsgrad = amsgrad
-        self.params = module_params
 
         # statistics
+        self.sparse_m = [np.zeros_like(p) for p in self.sparse_params]
+        self.sparse_v = [np.zeros_like(p) for p in self.sparse_params]
+        self.sparse_steps = [0 for _ in self.sparse_params]
+        if flat:
+            self.m = np.zeros_like(self.flat_param)
+            self.v = np.zeros_like(self.flat_param)
+            self.steps = 0
+            return
         self.m = [np.zeros_like(
             self.params[i]) for i in range(len(self.params))]
         self.m_ = [np.zeros_like(self.params[i])
@@ -135,15 +359,265 @@ class Adam(Optim):
 
     def _update_weight(self, i, tensor):
         if self.weight_decay != 0:
-            tensor.grad *= self.weight_decay
+            tensor.grad += self.weight_decay * tensor
 
         self.m[i] = self.betas[0] * self.m[i] + (1-self.betas[0]) * tensor.grad
         self.v[i] = self.betas[1] * self.v[i] + \
             (1-self.betas[1]) * tensor.grad**2
-        self.m_[i] = self.m[i] / (1-self.betas[0]**(self.steps[i]+1))
-        self.v_[i] = self.v[i] / (1-self.betas[1]**(self.steps[i]+1))
+        self.steps[i] += 1
+        self.m_[i] = self.m[i] / (1-self.betas[0]**self.steps[i])
+        self.v_[i] = self.v[i] / (1-self.betas[1]**self.steps[i])
 
         v = self.lr * self.m_[i] / (np.sqrt(self.v_[i]) + self.eps)
         tensor -= v
 
-        tensor.grad = zeros(tensor.grad.shape)
+        tensor.grad.fill(0)
+
+    def _update_flat(self):
+        p, g, buf = self.flat_param, self.flat_grad, self._buf
+        b1, b2 = self.betas
+        if self.weight_decay != 0:
+            np.multiply(p, self.weight_decay, out=buf)
+            g += buf
+
+        self.m *= b1
+        np.multiply(g, 1-b1, out=buf)
+        self.m += buf
+        self.v *= b2
+        np.multiply(g, g, out=buf)
+        buf *= 1-b2
+        self.v += buf
+        self.steps += 1
+
+        # p -= lr * (m / bc1) / (sqrt(v / bc2) + eps)
+        np.divide(self.v, 1-b2**self.steps, out=buf)
+        np.sqrt(buf, out=buf)
+        buf += self.eps
+        np.divide(self.m, buf, out=buf)
+        buf *= self.lr / (1-b1**self.steps)
+        p -= buf
+
+    def _update_sparse(self, i, tensor, grad):
+        # lazy Adam: moments of rows absent from the batch are not decayed
+        rows, g = grad.indices, grad.values
+        b1, b2 = self.betas
+        if self.weight_decay != 0:
+            g = g + self.weight_decay * tensor[rows]
+
+        m = b1 * self.sparse_m[i][rows] + (1-b1) * g
+        v = b2 * self.sparse_v[i][rows] + (1-b2) * g**2
+        self.sparse_m[i][rows] = m
+        self.sparse_v[i][rows] = v
+        self.sparse_steps[i] += 1
+
+        m_ = m / (1-b1**self.sparse_steps[i])
+        v_ = v / (1-b2**self.sparse_steps[i])
+        tensor[rows] -= self.lr * m_ / (np.sqrt(v_) + self.eps)
+
+
+def _cubic_interpolate(x1, f1, g1, x2, f2, g2, bounds=None):
+    """Minimiser of the cubic through two points with values and slopes,
+    clipped to `bounds`; the bounds' midpoint when the cubic has none."""
+
+    xmin, xmax = bounds if bounds is not None else sorted((x1, x2))
+    d1 = g1 + g2 - 3 * (f1 - f2) / (x1 - x2)
+    d2_square = d1 ** 2 - g1 * g2
+    if d2_square < 0:
+        return (xmin + xmax) / 2
+    d2 = np.sqrt(d2_square)
+    if x1 <= x2:
+        t = x2 - (x2 - x1) * ((g2 + d2 - d1) / (g2 - g1 + 2 * d2))
+    else:
+        t = x1 - (x1 - x2) * ((g1 + d2 - d1) / (g1 - g2 + 2 * d2))
+    return min(max(t, xmin), xmax)
+
+
+class LBFGS(Optim):
+    """Limited-memory BFGS on the flat parameter vector, for full batch
+    problems.
+
+    `step(closure)` runs up to `max_iter` iterations; `closure` must run a
+    forward and backward pass over the whole dataset and return the loss,
+    and is called once per line search trial. The last `history_size`
+    steps s and gradient changes y are kept as rows of two ring buffers, and
+    H g is computed in the compact form of Byrd, Nocedal and Schnabel: two
+    (m, n) GEMVs, an m x m solve and two more GEMVs, instead of the 4m
+    vector ops of the two-loop recursion.
+
+    The parameters must come from `Module.flatten_parameters()`. The
+    closure must return the loss whose gradient backward produced: the
+    losses report the batch mean but backpropagate the sum, so scale by
+    the batch size.
+
+    Usage:
+        >>> def closure():
+        ...     loss = criterion(model(x), y)
+        ...     model.backward(loss.backward())
+        ...     return loss.loss * len(x)
+        >>> optimizer.step(closure)
+    """
+
+    _state = ('S', 'Y', 'SY', 'YY', 'filled', 'head', 'evals')
+
+    def __init__(self, module_params: list, lr: float = 1, history_size: int = 10, max_iter: int = 20, max_eval: int = None, tolerance_grad: float = 1e-7, tolerance_change: float = 1e-9, line_search: str = 'strong_wolfe'):
+        if any(getattr(p, 'sparse', False) for p in module_params):
+            raise ValueError('LBFGS does not support sparse parameters')
+        if any(p.dtype == np.float16 for p in module_params):
+            raise ValueError('LBFGS does not support float16 parameters')
+        if line_search not in ('strong_wolfe', None):
+            raise ValueError(f'unknown line search {line_search}')
+        super(LBFGS, self).__init__(module_params, lr, flat=True)
+        self.history_size = history_size
+        self.max_iter = max_iter
+        self.max_eval = max_eval if max_eval is not None else max_iter * 5 // 4
+        self.tolerance_grad = tolerance_grad
+        self.tolerance_change = tolerance_change
+        self.line_search = line_search
+
+        # history: row i of S / Y is pair i of the ring, SY[i, j] = s_i.y_j
+        n = self.flat_param.size
+        self.S = np.zeros((history_size, n), self.flat_param.dtype)
+        self.Y = np.zeros((history_size, n), self.flat_param.dtype)
+        self.SY = np.zeros((history_size, history_size))
+        self.YY = np.zeros((history_size, history_size))
+        self.filled = 0  # pairs stored
+        self.head = 0    # slot of the next pair
+        self.evals = 0   # closure calls over all steps
+
+    def _evaluate(self, closure):
+        self.flat_grad.fill(0)
+        loss = float(closure())
+        self.evals += 1
+        return loss, self.flat_grad.copy()
+
+    def _push(self, s, y):
+        k, m = self.head, self.filled
+        self.S[k], self.Y[k] = s, y
+        m = self.filled = min(m + 1, self.history_size)
+        self.head = (k + 1) % self.history_size
+
+        self.SY[k, :m] = self.Y[:m] @ s
+        self.SY[:m, k] = self.S[:m] @ y
+        self.YY[k, :m] = self.YY[:m, k] = self.Y[:m] @ y
+
+    def _direction(self, g):
+        """-H g from the stored pairs, H_0 = gamma I."""
+
+        m = self.filled
+        if m == 0:
+            return -g
+        order = (self.head - m + np.arange(m)) % self.history_size  # oldest first
+        newest = order[-1]
+        gamma = self.SY[newest, newest] / self.YY[newest, newest]
+
+        a = self.S[:m] @ g  # ring order
+        b = self.Y[:m] @ g
+        SY = self.SY[np.ix_(order, order)]
+        R = np.triu(SY)
+        D = np.diag(np.diag(SY))
+        YY = self.YY[np.ix_(order, order)]
+
+        # [p; q] = [[R^-T (D + gamma Y'Y) R^-1, -R^-T], [-R^-1, 0]] [a; gamma b]
+        q = -np.linalg.solve(R, a[order])
+        p = np.linalg.solve(R.T, (D + gamma * YY) @ -q - gamma * b[order])
+        p_ring, q_ring = np.empty(m), np.empty(m)
+        p_ring[order], q_ring[order] = p, q
+
+        Hg = gamma * g + p_ring @ self.S[:m] + gamma * (q_ring @ self.Y[:m])
+        return -Hg
+
+    def _strong_wolfe(self, closure, x, d, t, loss, g, gtd, c1=1e-4, c2=0.9, max_ls=25):
+        """Line search for a t satisfying the strong Wolfe conditions,
+        bracketing then zooming with cubic interpolation. Leaves the
+        parameters at x + t d and returns (t, loss, grad)."""
+
+        d_norm = np.abs(d).max()
+
+        def phi(t):
+            np.multiply(d, t, out=self._buf)
+            np.add(x, self._buf, out=self.flat_param)
+            f, g = self._evaluate(closure)
+            return [t, f, g, float(g @ d)]
+
+        prev = [0.0, loss, g, gtd]
+        bracket = None
+        for ls in range(max_ls):
+            cur = phi(t)
+            if cur[1] > loss + c1 * t * gtd or (ls > 0 and cur[1] >= prev[1]):
+                bracket = [prev, cur]
+                break
+            if abs(cur[3]) <= -c2 * gtd:
+                return cur[:3]
+            if cur[3] >= 0:
+                bracket = [cur, prev]
+                break
+            t = _cubic_interpolate(prev[0], prev[1], prev[3], cur[0], cur[1], cur[3],
+                                   bounds=(t + 0.01 * (t - prev[0]), t * 10))
+            prev = cur
+        if bracket is None:
+            return cur[:3]
+
+        # zoom: lo has the lower loss, the minimiser lies between lo and hi
+        lo, hi = sorted(bracket, key=lambda e: e[1])
+        for _ in range(max_ls - ls):
+            if abs(hi[0] - lo[0]) * d_norm < self.tolerance_change:
+                break
+            t = _cubic_interpolate(lo[0], lo[1], lo[3], hi[0], hi[1], hi[3])
+            # keep away from the interval ends
+            span, left = abs(hi[0] - lo[0]), min(hi[0], lo[0])
+            t = min(max(t, left + 0.1 * span), left + 0.9 * span)
+            cur = phi(t)
+            if cur[1] > loss + c1 * t * gtd or cur[1] >= lo[1]:
+                hi = cur
+            else:
+                if abs(cur[3]) <= -c2 * gtd:
+                    return cur[:3]
+                if cur[3] * (hi[0] - lo[0]) >= 0:
+                    hi = lo
+                lo = cur
+
+        if lo is not cur:
+            np.multiply(d, lo[0], out=self._buf)
+            np.add(x, self._buf, out=self.flat_param)
+        return lo[:3]
+
+    def step(self, closure):
+        """Runs up to `max_iter` iterations and returns the loss at the
+        starting point."""
+
+        loss, g = self._evaluate(closure)
+        first_loss, start = loss, self.evals - 1
+        if np.abs(g).max() <= self.tolerance_grad:
+            return first_loss
+
+        for n_iter in range(self.max_iter):
+            d = self._direction(g)
+            gtd = float(g @ d)
+            if gtd > -self.tolerance_change:
+                break
+
+            # the first step of a fresh history is scaled to the gradient
+            t = self.lr
+            if self.filled == 0:
+                t = min(1., 1. / np.abs(g).sum()) * self.lr
+
+            x = self.flat_param.copy()
+            if self.line_search == 'strong_wolfe':
+                t, new_loss, new_g = self._strong_wolfe(closure, x, d, t, loss, g, gtd)
+            else:
+                self.flat_param += t * d
+                new_loss, new_g = self._evaluate(closure)
+
+            s, y = t * d, new_g - g
+            if y @ s > 1e-10:
+                self._push(s, y)
+            change, loss, g = abs(new_loss - loss), new_loss, new_g
+
+            if np.abs(g).max() <= self.tolerance_grad \
+                    or np.abs(s).max() <= self.tolerance_change \
+                    or change < self.tolerance_change \
+                    or self.evals - start >= self.max_eval:
+                break
+
+        self.flat_grad.fill(0)
+        return first_loss
@@ -1,4 +1,11 @@
 from .Modules import *
 from . import Optim
 from . import Functional
-from .myglobal import all_forward_dict
\ No newline at end of file
+from . import jit
+from . import parallel
+from . import data
+from . import profiler
+from . import codec
+from .serialization import save, load
+from .myglobal import Tape, no_grad, accumulate_grad
+from .myglobal import set_default_dtype, get_default_dtype
\ No newline at end of file
@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class Packed(object):
+    """A saved tensor in encoded form, as stored on the tape."""
+
+    def __init__(self, codec, data, shape, dtype):
+        self.codec = codec
+        self.data = data
+        self.shape = shape
+        self.dtype = dtype
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+
+class Codec(object):
+    """Encoding of the tensors an op saves for backward.
+
+    An op whose `codec` is set has its saved tensors encoded when they are
+    recorded on the tape, and decoded just before its backward runs, which
+    then sees plain arrays again. Tensors the codec does not accept, and
+    anything that is not an array (e.g. shapes), are kept as they are.
+
+    Usage:
+        >>> model.fc1.codec = Float16()
+    """
+
+    def accepts(self, t) -> bool:
+        return False
+
+    def pack(self, t):
+        ...
+
+    def unpack(self, packed):
+        ...
+
+    def encode(self, saved):
+        if saved is None:
+            return None
+        return tuple(Packed(self, self.pack(t), t.shape, t.dtype)
+                     if isinstance(t, np.ndarray) and self.accepts(t) else t
+                     for t in saved)
+
+    def decode(self, saved):
+        if saved is None:
+            return None
+        return tuple(t.codec.unpack(t) if isinstance(t, Packed) else t
+                     for t in saved)
+
+
+class PackBits(Codec):
+    """Boolean masks stored as bits, 1/8 of their numpy size."""
+
+    def accepts(self, t):
+        return t.dtype == np.bool_
+
+    def pack(self, t):
+        return np.packbits(t, axis=None)
+
+    def unpack(self, packed):
+        size = int(np.prod(packed.shape))
+        bits = np.unpackbits(packed.data, count=size)
+        return bits.view(np.bool_).reshape(packed.shape)
+
+
+class Float16(PackBits):
+    """Wider floats stored as float16 and cast back on decode; boolean
+    masks are still bit-packed. Lossy: gradients computed from the saved
+    tensors carry half precision rounding."""
+
+    def accepts(self, t):
+        return super(Float16, self).accepts(t) or (
+            t.dtype.kind == 'f' and t.dtype.itemsize > 2)
+
+    def pack(self, t):
+        if t.dtype == np.bool_:
+            return super(Float16, self).pack(t)
+        return t.astype(np.float16)
+
+    def unpack(self, packed):
+        if packed.dtype == np.bool_:
+            return super(Float16, self).unpack(packed)
+        return packed.data.astype(packed.dtype)
@@ -0,0 +1,135 @@
+import os
+import gzip
+import queue
+import shutil
+import threading
+import numpy as np
+
+
+IDX_DTYPES = {
+    0x08: np.uint8,
+    0x09: np.int8,
+    0x0B: np.dtype('>i2'),
+    0x0C: np.dtype('>i4'),
+    0x0D: np.dtype('>f4'),
+    0x0E: np.dtype('>f8'),
+}
+
+
+def load_idx(path):
+    """Memory-map an idx file (the MNIST format) as a read-only array.
+
+    A gzipped file is decompressed next to itself once, on first use.
+    """
+
+    if not os.path.exists(path) and os.path.exists(path + '.gz'):
+        with gzip.open(path + '.gz', 'rb') as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+        if len(magic) < 4 or magic[:2] != b'\x00\x00' or magic[2] not in IDX_DTYPES:
+            raise ValueError(f'{path} is not an idx file')
+        ndim = magic[3]
+        shape = tuple(np.frombuffer(f.read(4 * ndim), dtype='>i4'))
+
+    return np.memmap(path, dtype=IDX_DTYPES[magic[2]], mode='r',
+                     offset=4 + 4 * ndim, shape=shape)
+
+
+class MNIST(object):
+    """MNIST as memory-mapped uint8 arrays, parsed straight from the idx files.
+
+    Args:
+        root: directory holding the raw files, e.g. `./data/MNIST/raw` as
+            left by `torchvision.datasets.MNIST(download=True)`.
+    """
+
+    def __init__(self, root, train=True):
+        prefix = 'train' if train else 't10k'
+        self.images = load_idx(os.path.join(root, prefix + '-images-idx3-ubyte'))
+        self.labels = load_idx(os.path.join(root, prefix + '-labels-idx1-ubyte'))
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class DataLoader(object):
+    """Shuffled float batches gathered from uint8 arrays by fancy indexing.
+
+    Each batch is gathered, scaled to [0, 1] float32 and passed through
+    `transform` as a whole; with `prefetch > 0` a background thread
+    prepares the next batches while the current one is trained on.
+
+    Usage:
+        >>> loader = DataLoader(MNIST('./data/MNIST/raw'), batch_size=128)
+        >>> for images, labels in loader:
+        ...     ...
+    """
+
+    def __init__(self, dataset, batch_size=1, shuffle=False, transform=None,
+                 prefetch=2):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.transform = transform
+        self.prefetch = prefetch
+
+    def __len__(self):
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+    def _batch(self, idx):
+        # sorted indices turn the gather into a forward scan of the memmap
+        idx = np.sort(idx)
+        images = np.multiply(self.dataset.images[idx], np.float32(1 / 255),
+                             dtype=np.float32)
+        if self.transform is not None:
+            images = self.transform(images)
+        return images, self.dataset.labels[idx].astype(np.int64)
+
+    def _batches(self, order):
+        for start in range(0, len(order), self.batch_size):
+            yield self._batch(order[start:start + self.batch_size])
+
+    def __iter__(self):
+        n = len(self.dataset)
+        order = np.random.permutation(n) if self.shuffle else np.arange(n)
+        if self.prefetch <= 0:
+            yield from self._batches(order)
+            return
+
+        batches = queue.Queue(maxsize=self.prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def produce():
+            try:
+                for batch in self._batches(order):
+                    if not put(batch):
+                        return
+            except Exception as err:  # re-raised in the consumer
+                put(err)
+                return
+            put(None)
+
+        worker = threading.Thread(target=produce, daemon=True)
+        worker.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                yield batch
+        finally:
+            stop.set()
+            worker.join()
@@ -0,0 +1,234 @@
+import numpy as np
+from . import Functional
+from .Modules import Module, Linear
+from .myglobal import is_grad_accumulating, accumulate_grad, _param_ids
+
+
+class Kernel(object):
+    """Arena implementation of one traced op.
+
+    Buffers are bound once by `trace`; `forward` reads `self.x` and writes
+    `self.out`, `backward` reads `dy` and writes `dx` (returning the buffer
+    holding the input delta, which may be `dy` itself).
+    """
+
+    saves = None         # 'input' or 'output': what backward reads
+    elementwise = False  # may write its output over its input
+    scratch = False      # needs a buffer of the output shape in backward
+    tied = False         # its parameters are used again by a later op
+
+    def __init__(self, op):
+        self.op = op
+
+    def out_shape(self, in_shape):
+        return in_shape
+
+    def forward(self):
+        ...
+
+    def backward(self, dy, dx):
+        ...
+
+
+class LinearKernel(Kernel):
+    saves = 'input'
+
+    def out_shape(self, in_shape):
+        return (in_shape[0], self.op.w.shape[-1])
+
+    def forward(self):
+        w = self.op.w
+        np.matmul(self.x, w[1:], out=self.out)
+        self.out += w[0]
+
+    def backward(self, dy, dx):
+        w = self.op.w
+        if is_grad_accumulating():
+            w.grad[1:] += self.x.T.dot(dy)
+            w.grad[0] += dy.sum(axis=0)
+        else:
+            np.matmul(self.x.T, dy, out=w.grad[1:])
+            np.sum(dy, axis=0, out=w.grad[0])
+        if dx is None:  # input delta of the first op is not needed
+            return None
+        np.matmul(dy, w[1:].T, out=dx)
+        return dx
+
+
+class ReLUKernel(Kernel):
+    saves = 'output'
+    elementwise = True
+
+    def forward(self):
+        np.maximum(self.x, 0, out=self.out)
+
+    def backward(self, dy, dx):
+        np.greater(self.out, 0, out=self.mask)
+        np.multiply(dy, self.mask, out=dy)
+        return dy
+
+
+class SigmoidKernel(Kernel):
+    saves = 'output'
+    elementwise = True
+    scratch = True
+
+    def forward(self):
+        np.negative(self.x, out=self.out)
+        np.exp(self.out, out=self.out)
+        self.out += 1
+        np.reciprocal(self.out, out=self.out)
+
+    def backward(self, dy, dx):
+        # dy * y * (1 - y)
+        np.subtract(1, self.out, out=self.tmp)
+        self.tmp *= self.out
+        dy *= self.tmp
+        return dy
+
+
+class SoftmaxKernel(Kernel):
+    elementwise = True
+
+    def forward(self):
+        np.max(self.x, axis=1, keepdims=True, out=self.row)
+        np.subtract(self.x, self.row, out=self.out)
+        np.exp(self.out, out=self.out)
+        np.sum(self.out, axis=1, keepdims=True, out=self.row)
+        self.out /= self.row
+
+    def backward(self, dy, dx):
+        return dy  # as Functional.Softmax, paired with CrossEntropy
+
+
+KERNELS = {
+    Linear: LinearKernel,
+    Functional.ReLU: ReLUKernel,
+    Functional.Sigmoid: SigmoidKernel,
+    Functional.Softmax: SoftmaxKernel,
+}
+
+
+class CompiledModule(object):
+    """Static forward/backward replay of a traced module.
+
+    Behaves like the module it was traced from: call it for the forward
+    pass and then call `backward(dy)`, which writes the parameter
+    gradients. Every activation and delta lives in a buffer allocated once
+    at trace time, so the returned output and input delta are overwritten
+    by the next call.
+    """
+
+    def __init__(self, kernels, x, out, grads, input_grad):
+        self.kernels = kernels
+        self.x = x
+        self.out = out
+        self.grads = grads  # [dy buffer of each kernel, ..., input delta]
+        self.input_grad = input_grad
+        self.shape = x.shape
+
+    def __call__(self, x):
+        if x.shape != self.shape:
+            raise ValueError(
+                f'traced for inputs of shape {self.shape}, got {x.shape}')
+        np.copyto(self.x, x)
+        for kernel in self.kernels:
+            kernel.forward()
+        return self.out
+
+    def backward(self, dy):
+        # kernels write deltas in place, so they run on the arena copy
+        dy_buf = self.grads[-1]
+        np.copyto(dy_buf, np.reshape(dy, dy_buf.shape))
+        dy = dy_buf
+        for i in range(len(self.kernels) - 1, -1, -1):
+            kernel, dx = self.kernels[i], self.grads[i]
+            if kernel.tied:  # the later use already wrote the gradient
+                with accumulate_grad():
+                    dy = kernel.backward(dy, dx)
+            else:
+                dy = kernel.backward(dy, dx)
+        return dy
+
+
+def trace(model: Module, example_input: np.ndarray, input_grad: bool = False):
+    """Record the op sequence of `model` once and compile it for replay.
+
+    The model must be a chain of Linear, ReLU, Sigmoid and Softmax ops
+    called through `Module.__call__`; anything else raises. Batch size and
+    dtype are fixed by `example_input`.
+
+    Usage:
+        >>> step = trace(model, x_train[:batch_size])
+        >>> out = step(x)
+        >>> step.backward(criterion(out, y).backward())
+        >>> optimizer.step()
+
+    Args:
+        input_grad: whether `backward` should also return the delta of the
+            input; skipping it saves the largest GEMM for the first layer.
+    """
+
+    expected = model(example_input)
+    tape, model.tape = model.tape, None
+    ops = [op for op, _ in tape.records] if tape is not None else []
+    if not ops:
+        ops = [model]
+
+    kernels = []
+    for op in ops:
+        if type(op) not in KERNELS:
+            raise TypeError(f'trace does not support {op.get_name()}')
+        kernels.append(KERNELS[type(op)](op))
+    for i, kernel in enumerate(kernels):
+        later = {p for k in kernels[i+1:] for p in _param_ids(k.op)}
+        kernel.tied = not later.isdisjoint(_param_ids(kernel.op))
+
+    # forward plan: an elementwise op overwrites its input unless someone
+    # still needs it for backward
+    dtype = expected.dtype
+    x = np.empty(np.shape(example_input), dtype=dtype)
+    buf, shapes = x, [x.shape]
+    for i, kernel in enumerate(kernels):
+        kernel.x = buf
+        needed = kernel.saves == 'input' or (
+            i > 0 and kernels[i-1].saves == 'output')
+        if kernel.elementwise and not needed:
+            kernel.out = buf
+        else:
+            kernel.out = np.empty(kernel.out_shape(buf.shape), dtype=dtype)
+        if isinstance(kernel, ReLUKernel):
+            kernel.mask = np.empty(kernel.out.shape, dtype=bool)
+        if kernel.scratch:
+            kernel.tmp = np.empty(kernel.out.shape, dtype=dtype)
+        if isinstance(kernel, SoftmaxKernel):
+            kernel.row = np.empty((kernel.out.shape[0], 1), dtype=dtype)
+        buf = kernel.out
+        shapes.append(buf.shape)
+
+    # backward plan: deltas ping-pong between two buffers per shape
+    pool = {}
+
+    def grad_buffer(shape, avoid):
+        pair = pool.setdefault(shape, [np.empty(shape, dtype=dtype),
+                                       np.empty(shape, dtype=dtype)])
+        return pair[1] if pair[0] is avoid else pair[0]
+
+    grads = [None] * (len(kernels) + 1)
+    grads[-1] = dy = grad_buffer(shapes[-1], None)
+    for i in range(len(kernels) - 1, -1, -1):
+        if kernels[i].elementwise:
+            grads[i] = dy  # in place
+        elif i > 0 or input_grad:
+            grads[i] = dy = grad_buffer(shapes[i], dy)
+
+    compiled = CompiledModule(kernels, x, buf, grads, input_grad)
+    out = compiled(example_input)
+    if out.size != np.size(expected) or not np.allclose(
+            out.reshape(np.shape(expected)), expected, rtol=1e-4, atol=1e-5):
+        raise RuntimeError(
+            'traced ops do not reproduce the forward; trace only supports '
+            'sequential chains of module calls')
+    compiled.out = out.reshape(np.shape(expected))
+
+    return compiled
@@ -1,50 +1,153 @@
 import numpy as np
-from copy import deepcopy
+from .myglobal import get_default_dtype
 
 
 class Tensor(np.ndarray):
-    """Derived Class of np.ndarray."""
+    """Derived Class of np.ndarray.
 
-    def __init__(self, *args, **kwargs):
-        self.grad = None
+    `grad` is allocated on first access, and only for tensors with
+    `requires_grad` set; data tensors never carry gradient buffers.
+    Tensors marked `sparse` never get a dense one either: their backward
+    sets `grad` to a `RowSparse`, and it is None between steps.
+    """
+
+    def __array_finalize__(self, obj):
+        self.requires_grad = False
+        self.sparse = False
+        self._grad = None
         self.momentum_grad = None
 
+    @property
+    def grad(self):
+        if self._grad is None and self.requires_grad and not self.sparse:
+            self._grad = np.zeros(self.shape, dtype=self.dtype)
+        return self._grad
+
+    @grad.setter
+    def grad(self, value):
+        self._grad = value
+
+    def __reduce__(self):
+        reconstruct, args, state = super(Tensor, self).__reduce__()
+        return reconstruct, args, (state, self.requires_grad, self.sparse)
+
+    def __setstate__(self, state):
+        state, self.requires_grad, self.sparse = state
+        super(Tensor, self).__setstate__(state)
+
+
+class RowSparse(object):
+    """Gradient touching only some rows of a parameter: `values[k]` is the
+    gradient of row `indices[k]`. Indices may repeat until `coalesce`."""
+
+    def __init__(self, indices, values, shape):
+        self.indices = indices
+        self.values = values
+        self.shape = shape
+
+    def __add__(self, other):
+        return RowSparse(np.concatenate([self.indices, other.indices]),
+                         np.concatenate([self.values, other.values]),
+                         self.shape)
+
+    def coalesce(self):
+        """Return the equivalent RowSparse with sorted, unique indices."""
+        indices, inverse = np.unique(self.indices, return_inverse=True)
+        if len(indices) == len(self.indices):
+            return RowSparse(indices, self.values[np.argsort(self.indices)],
+                             self.shape)
+        values = np.zeros((len(indices),) + self.values.shape[1:],
+                          dtype=self.values.dtype)
+        np.add.at(values, inverse, self.values)
+        return RowSparse(indices, values, self.shape)
+
+    def to_dense(self):
+        dense = np.zeros(self.shape, dtype=self.values.dtype)
+        np.add.at(dense, self.indices, self.values)
+        return dense
+
 
-def tensor(shape):
-    """Return a tensor with a normal Gaussian distribution."""
-    return random(shape)
+def tensor(shape, dtype=None):
+    """Return a trainable tensor with a normal Gaussian distribution."""
+    return random(shape, dtype=dtype, requires_grad=True)
 
 
-def from_array(arr):
-    """Convert the input array-like to a tensor."""
-    t = arr.view(Tensor)
-    t.grad = deepcopy(t)
-    t.grad.fill(1)
-    t.momentum_grad = deepcopy(t)
-    t.momentum_grad.fill(1)
+def compute_dtype(dtype):
+    """Return the dtype arithmetic runs in for parameters stored as `dtype`;
+    float16 storage is computed in float32."""
+    return np.promote_types(dtype, np.float32)
+
+
+def from_array(arr, requires_grad=False):
+    """Convert the input array-like to a tensor.
+
+    NumPy arrays and CPU torch tensors are wrapped without copying.
+    """
+    t = np.asarray(arr).view(Tensor)
+    t.requires_grad = requires_grad
     return t
 
 
-def zeros(shape):
+def flatten(tensors, data=None, grad=None):
+    """Copy tensors into one contiguous data buffer and one gradient buffer.
+
+    Returns new tensors, in the same order, that are views into the shared
+    buffers; their `grad` attributes are views into the gradient buffer.
+    `data` and `grad` may be given as preallocated 1-D buffers, e.g. in
+    shared memory.
+    """
+    total = sum(t.size for t in tensors)
+    if data is None:
+        data = np.empty(total, dtype=np.result_type(*tensors))
+    if grad is None:
+        grad = np.zeros(total, dtype=data.dtype)
+    buffers = (data, grad)
+
+    views = []
+    offset = 0
+    for t in tensors:
+        view = data[offset:offset + t.size].reshape(t.shape).view(Tensor)
+        view[...] = t
+        view.grad = grad[offset:offset + t.size].reshape(t.shape)
+        view.requires_grad = True
+        view.storage = buffers
+        views.append(view)
+        offset += t.size
+    return views
+
+
+def flat_buffers(tensors):
+    """Return the (data, grad) buffers shared by tensors from `flatten`."""
+    data, grad = getattr(tensors[0], 'storage', (None, None))
+    if (data is None
+            or any(getattr(t, 'storage', None) is not tensors[0].storage for t in tensors)
+            or sum(t.size for t in tensors) != data.size):
+        raise ValueError(
+            'parameters do not share one flat buffer; '
+            'call `Module.flatten_parameters()` first.')
+    return data, grad
+
+
+def zeros(shape, dtype=None, requires_grad=False):
     """Return a new tensor of given shape, filled with zeros."""
-    t = ones(shape)
-    t.fill(0)
-    return t
+    return from_array(np.zeros(shape, dtype or get_default_dtype()),
+                      requires_grad)
 
 
-def ones(shape):
+def ones(shape, dtype=None, requires_grad=False):
     """Return a new tensor of given shape, filled with ones."""
-    t = tensor(shape)
-    t.fill(1)
-    return t
+    return from_array(np.ones(shape, dtype or get_default_dtype()),
+                      requires_grad)
 
 
 def ones_like(tensor):
     """Return a new tensor with the same shape as the given tensor, 
        filled with ones."""
-    return ones(tensor.shape)
+    return ones(tensor.shape, tensor.dtype)
 
 
-def random(shape, loc=0.0, scale=1):
+def random(shape, loc=0.0, scale=1, dtype=None, requires_grad=False):
     """Return a new tensor of given shape, from normal distribution."""
-    return from_array(np.random.normal(loc=loc, scale=scale, size=shape))
+    arr = np.random.normal(loc=loc, scale=scale, size=shape)
+    return from_array(arr.astype(dtype or get_default_dtype(), copy=False),
+                      requires_grad)
@@ -1,18 +1,150 @@
-from collections import OrderedDict
+import numpy as np
 
 
-class mygraph(object):
+class Tape(object):
+    """Append-only record of the ops run during one forward pass.
+
+    Each record is an ``(op, saved)`` pair, where ``saved`` holds the tensors
+    the op stashed with ``Module.save_for_backward``. Because the saved
+    tensors live in the record rather than on the op, the same module may
+    appear several times on one tape, and several tapes may be alive at once.
+    Ops with a ``codec`` have their saved tensors recorded in encoded form.
+
+    During backward, an op whose parameters already got their gradient from
+    a later use (weight tying) runs under `accumulate_grad`, so every use
+    adds to the gradient instead of overwriting it.
+    """
+
     def __init__(self,):
-        self.dict = OrderedDict()
+        self.records = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def __enter__(self):
+        _tape_stack.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _tape_stack.pop()
+
+    def record(self, op, saved):
+        self.records.append((op, saved))
+
+    def backward(self, dy):
+        """Runs the recorded ops backward in reverse order.
+
+        Records are popped as they are consumed, so saved activations are
+        released as soon as their gradient has been computed.
+        """
+
+        global _replayed
+        outermost = _replayed is None  # nested tapes (Checkpoint) share the set
+        if outermost:
+            _replayed = set()
+        records, self.records = self.records, []
+        try:
+            while records:
+                op, saved = records.pop()
+                if op.codec is not None:
+                    saved = op.codec.decode(saved)
+                op.saved = saved
+                del saved  # backward may drop saved tensors once it is done with them
+                params = _param_ids(op)
+                if _replayed.isdisjoint(params):
+                    dy = op.backward(dy)
+                else:
+                    with accumulate_grad():
+                        dy = op.backward(dy)
+                _replayed.update(params)
+                op.saved = None
+        finally:
+            if outermost:
+                _replayed = None
+
+        return dy
+
     def flush(self,):
-        del self.dict
-        self.dict = OrderedDict()
+        self.records = []
+
+
+def _param_ids(op):
+    """ids of the parameters (tensors with `requires_grad`) held by an op."""
+    return [id(v) for v in vars(op).values() if getattr(v, 'requires_grad', False)]
+
+
+_tape_stack = []
+_replayed = None  # ids of the parameters already given a gradient by this backward
+_grad_enabled = True
+_grad_accumulating = False
+_default_dtype = np.float32
+
+
+def current_tape():
+    """Return the tape being recorded into, or None outside any forward."""
+    return _tape_stack[-1] if _tape_stack else None
+
+
+def is_grad_enabled():
+    return _grad_enabled
+
+
+class no_grad(object):
+    """Context manager for inference.
+
+    Inside it modules neither record ops on a tape nor keep the tensors
+    their backward would need, so evaluation runs in constant memory.
+
+    Usage:
+        >>> with no_grad():
+        ...     predict = model(x)
+    """
+
+    def __enter__(self):
+        global _grad_enabled
+        self.prev = _grad_enabled
+        _grad_enabled = False
+        return self
+
+    def __exit__(self, *exc_info):
+        global _grad_enabled
+        _grad_enabled = self.prev
+
+
+def is_grad_accumulating():
+    return _grad_accumulating
+
+
+class accumulate_grad(object):
+    """Context manager under which backward adds into the parameter
+    gradients instead of overwriting them.
+
+    The optimizers zero the gradients after every step, so the gradients
+    of several micro-batches can be summed before one `optimizer.step()`.
+
+    Usage:
+        >>> with accumulate_grad():
+        ...     for x, y in micro_batches:
+        ...         model.backward(criterion(model(x), y).backward())
+        >>> optimizer.step()
+    """
+
+    def __enter__(self):
+        global _grad_accumulating
+        self.prev = _grad_accumulating
+        _grad_accumulating = True
+        return self
+
+    def __exit__(self, *exc_info):
+        global _grad_accumulating
+        _grad_accumulating = self.prev
+
 
+def set_default_dtype(dtype):
+    """Set the dtype new tensors and module parameters are created with."""
+    global _default_dtype
+    _default_dtype = np.dtype(dtype).type
 
-graph = mygraph()
-all_forward_dict = OrderedDict()
 
-if __name__ == '__main__':
-    g = mygraph()
-    g.dict['0'] = 111
-    print(g.dict)
+def get_default_dtype():
+    return _default_dtype
@@ -0,0 +1,235 @@
+import os
+import numpy as np
+import multiprocessing as mp
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from . import my_tensor
+from .Modules import Module
+from .myglobal import accumulate_grad
+
+
+BLAS_THREAD_VARS = ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                    'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS']
+
+
+@contextmanager
+def blas_threads(n: int):
+    """Limits BLAS to `n` threads in the processes started inside the block.
+
+    The limit is read when a process loads BLAS, so it reaches spawned
+    workers but not the current process; the environment is restored on
+    exit.
+
+    Usage:
+        >>> with blas_threads(os.cpu_count() // workers):
+        ...     pool = mp.get_context('spawn').Pool(workers)
+    """
+
+    saved = {var: os.environ.get(var) for var in BLAS_THREAD_VARS}
+    os.environ.update(dict.fromkeys(BLAS_THREAD_VARS, str(n)))
+    try:
+        yield
+    finally:
+        for var, value in saved.items():
+            if value is None:
+                del os.environ[var]
+            else:
+                os.environ[var] = value
+
+
+def _shared_array(shape, dtype, blocks):
+    """Allocate a zeroed array in a new shared memory block kept in `blocks`."""
+    size = max(int(np.prod(shape)) * np.dtype(dtype).itemsize, 1)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    blocks.append(shm)
+    arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    arr.fill(0)
+    return arr
+
+
+def _bind_grads(params, grad):
+    """Point the `grad` of each flat parameter view at its slice of `grad`."""
+    offset = 0
+    for p in params:
+        p.grad = grad[offset:offset + p.size].reshape(p.shape)
+        offset += p.size
+
+
+def _worker(model, criterion, conn, x_buf, y_buf, grad):
+    params = [t for _, t in model.named_parameters()]
+    _bind_grads(params, grad)
+    while True:
+        msg = conn.recv()
+        if msg is None:
+            break
+        start, stop = msg
+        grad.fill(0)
+        loss = criterion(model(my_tensor.from_array(x_buf[start:stop])),
+                         my_tensor.from_array(y_buf[start:stop]))
+        model.backward(loss.backward())
+        conn.send(float(loss.loss))
+    conn.close()
+
+
+class MicroBatch(object):
+    """Forward/backward of a large batch as a sequence of micro-batches.
+
+    Gradients are accumulated across the micro-batches, so only one
+    micro-batch of activations is alive at a time: a batch of 4096 trains
+    in the memory of `micro_batch_size` and, since the losses sum their
+    gradient over the batch, yields the same gradient as the whole batch.
+    Same interface as `DataParallel`.
+
+    Usage:
+        >>> trainer = MicroBatch(model, criterion, micro_batch_size=256)
+        >>> for images, labels in loader:  # batch_size=4096
+        ...     loss = trainer.step(images, labels)
+        ...     optimizer.step()
+    """
+
+    def __init__(self, model: Module, criterion, micro_batch_size: int = 256):
+        self.model = model
+        self.criterion = criterion
+        self.micro_batch_size = micro_batch_size
+
+    def step(self, x, y, scale: float = 1.0):
+        """Forward and backward one batch; returns the mean loss.
+
+        Args:
+            scale: multiplies the output delta of every micro-batch, e.g.
+                `1 / len(x)` for the batch mean instead of the sum.
+        """
+
+        total, n = 0.0, len(x)
+        with accumulate_grad():
+            for start in range(0, n, self.micro_batch_size):
+                stop = min(start + self.micro_batch_size, n)
+                loss = self.criterion(self.model(x[start:stop]), y[start:stop])
+                dy = loss.backward()
+                if scale != 1.0:
+                    dy = dy * scale
+                self.model.backward(dy)
+                total += float(loss.loss) * (stop - start)
+
+        return total / n
+
+    def close(self):
+        pass
+
+
+class DataParallel(object):
+    """Data-parallel forward/backward over forked worker processes.
+
+    The parameters are moved into shared memory, so every replica reads the
+    weights the optimizer updates in the parent. Each batch is copied into
+    a shared input buffer and split across `num_workers` processes (the
+    parent computes the first shard itself); each process writes its
+    gradient into its own row of a shared (num_workers, P) buffer, and the
+    rows are summed into the parent's gradient before `optimizer.step()`.
+    The optimizer must be built afterwards, with `flat=True`.
+
+    Workers are forked on the first step, so the model must not change
+    structure afterwards. Limit BLAS to one thread per process (e.g.
+    `OMP_NUM_THREADS=1`) to avoid oversubscribing the cores.
+
+    Usage:
+        >>> trainer = DataParallel(model, criterion, num_workers=4)
+        >>> optimizer = mytorch.Optim.Adam(model.parameters, flat=True)
+        >>> for images, labels in loader:
+        ...     loss = trainer.step(images, labels)
+        ...     optimizer.step()
+        >>> trainer.close()
+    """
+
+    def __init__(self, model: Module, criterion, num_workers: int = 2):
+        self.model = model
+        self.criterion = criterion
+        self.num_workers = num_workers
+        self.blocks = []
+        self.workers = []
+        self.conns = []
+
+        params = [t for _, t in model.named_parameters()]
+        if any(p.sparse for p in params):
+            raise ValueError('DataParallel does not support sparse parameters')
+        size = sum(p.size for p in params)
+        dtype = np.result_type(*params)
+        data = _shared_array((size,), dtype, self.blocks)
+        self.grads = _shared_array((num_workers, size), dtype, self.blocks)
+        model.flatten_parameters(data, self.grads[0])
+
+    def _start(self, x, y):
+        self.x_buf = _shared_array(x.shape, x.dtype, self.blocks)
+        self.y_buf = _shared_array(y.shape, y.dtype, self.blocks)
+
+        ctx = mp.get_context('fork')
+        for rank in range(1, self.num_workers):
+            parent, child = ctx.Pipe()
+            proc = ctx.Process(
+                target=_worker, daemon=True,
+                args=(self.model, self.criterion, child,
+                      self.x_buf, self.y_buf, self.grads[rank]))
+            proc.start()
+            child.close()
+            self.workers.append(proc)
+            self.conns.append(parent)
+
+    def step(self, x, y):
+        """Forward and backward one batch; returns the mean loss.
+
+        Leaves the gradient of the whole batch in the model's parameters.
+        """
+
+        x, y = np.asarray(x), np.asarray(y)
+        if not self.workers and self.num_workers > 1:
+            self._start(x, y)
+        n = len(x)
+        if self.num_workers > 1:
+            if n > len(self.x_buf):
+                raise ValueError(
+                    f'batch of {n} exceeds the first batch size {len(self.x_buf)}')
+            self.x_buf[:n] = x
+            self.y_buf[:n] = y
+
+        # a batch shorter than the workers (e.g. the last one) leaves some
+        # idle rather than give them empty shards, whose mean loss is NaN
+        shards = min(self.num_workers, n)
+        bounds = np.linspace(0, n, shards + 1).astype(int)
+        for conn, start, stop in zip(self.conns, bounds[1:-1], bounds[2:]):
+            conn.send((start, stop))
+
+        # the parent computes shard 0 straight into the optimizer's gradient
+        loss = self.criterion(
+            self.model(my_tensor.from_array(x[:bounds[1]])),
+            my_tensor.from_array(y[:bounds[1]]))
+        self.model.backward(loss.backward())
+        total = float(loss.loss) * bounds[1]
+
+        for conn, start, stop in zip(self.conns, bounds[1:-1], bounds[2:]):
+            total += conn.recv() * (stop - start)
+
+        # all-reduce: losses are summed over the batch, so are the shards
+        for rank in range(1, shards):
+            self.grads[0] += self.grads[rank]
+
+        return total / n
+
+    def close(self):
+        """Stop the workers and release the shared memory names."""
+        for conn in self.conns:
+            conn.send(None)
+            conn.close()
+        for proc in self.workers:
+            proc.join()
+        self.workers, self.conns = [], []
+        # the parameters stay mapped for the model and optimizer; unlinking
+        # only removes the names, the memory goes with the last reference
+        for shm in self.blocks:
+            shm.unlink()
+        self.released, self.blocks = self.blocks, []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,149 @@
+import json
+import numpy as np
+from time import perf_counter
+from .Modules import Module
+from .Functional import Loss
+from .myglobal import current_tape
+
+
+def _subclasses(cls):
+    for sub in cls.__subclasses__():
+        yield sub
+        yield from _subclasses(sub)
+
+
+def _nbytes(tensors):
+    if isinstance(tensors, np.ndarray):
+        return tensors.nbytes
+    if isinstance(tensors, (tuple, list)):
+        return sum(getattr(t, 'nbytes', 0) for t in tensors)
+    return 0
+
+
+class profile(object):
+    """Context manager recording wall time and memory of every op.
+
+    Each forward dispatched through `Module.__call__`, each op backward run
+    by the tape, and each loss `__call__`/`backward` is timed, along with
+    the bytes of its output (zero when it works in place) and of the
+    tensors it saved for backward. The hooks are patched onto the classes
+    on entry and removed on exit, so nothing is paid outside the block.
+
+    Usage:
+        >>> with profile() as prof:
+        ...     loss = criterion(model(x), y)
+        ...     model.backward(loss.backward())
+        >>> print(prof.table())
+        >>> prof.export_chrome_trace('trace.json')
+    """
+
+    _active = None
+
+    def __init__(self):
+        self.events = []  # (name, phase, start, duration, out bytes, saved bytes)
+
+    def __enter__(self):
+        if profile._active is not None:
+            raise RuntimeError('profilers cannot be nested')
+        profile._active = self
+        self._patched = []
+        self._running = set()  # (id(obj), phase) of the patched calls under way
+        self._start = perf_counter()
+
+        self._patch(Module, '__call__', self._wrap_call)
+        for cls in _subclasses(Module):
+            self._patch(cls, 'backward', self._wrap_method('backward'))
+        for cls in [Loss, *_subclasses(Loss)]:
+            self._patch(cls, '__call__', self._wrap_method('forward'))
+            self._patch(cls, 'backward', self._wrap_method('backward'))
+
+        return self
+
+    def __exit__(self, *exc_info):
+        for cls, name, original in reversed(self._patched):
+            setattr(cls, name, original)
+        self._patched = []
+        profile._active = None
+
+    def _patch(self, cls, name, wrap):
+        if name in vars(cls):
+            original = vars(cls)[name]
+            self._patched.append((cls, name, original))
+            setattr(cls, name, wrap(original))
+
+    def _record(self, obj, phase, start, end, args, out, saved_bytes):
+        out_bytes = 0 if any(out is a for a in args) else _nbytes(out)
+        self.events.append((type(obj).__name__, phase, start - self._start,
+                            end - start, out_bytes, saved_bytes))
+
+    def _wrap_call(self, call):
+        def profiled_call(module, x):
+            if not module.is_op():
+                return call(module, x)
+            tape = current_tape()
+            n = len(tape) if tape is not None else 0
+            start = perf_counter()
+            out = call(module, x)
+            end = perf_counter()
+            if tape is not None and len(tape) > n:
+                saved = tape.records[-1][1]
+            else:
+                saved = module.saved
+            self._record(module, 'forward', start, end, (x,), out, _nbytes(saved))
+            return out
+        return profiled_call
+
+    def _wrap_method(self, phase):
+        def wrap(method):
+            def profiled(obj, *args):
+                # a subclass calling super().backward is already being timed
+                key = (id(obj), phase)
+                if key in self._running:
+                    return method(obj, *args)
+                self._running.add(key)
+                try:
+                    start = perf_counter()
+                    out = method(obj, *args)
+                    end = perf_counter()
+                finally:
+                    self._running.discard(key)
+                if phase == 'forward':
+                    # a loss returns itself; what it holds is what it saved
+                    saved = _nbytes(list(vars(obj).values()))
+                    self._record(obj, phase, start, end, args, None, saved)
+                else:
+                    self._record(obj, phase, start, end, args, out, 0)
+                return out
+            return profiled
+        return wrap
+
+    def summary(self):
+        """Per (op, phase): calls, total seconds, output and saved bytes."""
+        rows = {}
+        for name, phase, _, dur, out_bytes, saved_bytes in self.events:
+            row = rows.setdefault((name, phase), [0, 0.0, 0, 0])
+            row[0] += 1
+            row[1] += dur
+            row[2] += out_bytes
+            row[3] += saved_bytes
+        return sorted(rows.items(), key=lambda item: -item[1][1])
+
+    def table(self):
+        """The summary as a text table, most expensive first."""
+        lines = ['%-22s %-9s %7s %11s %11s %13s %13s' % (
+            'op', 'phase', 'calls', 'total ms', 'mean us', 'out MB', 'saved MB')]
+        for (name, phase), (calls, total, out_bytes, saved_bytes) in self.summary():
+            lines.append('%-22s %-9s %7d %11.3f %11.1f %13.3f %13.3f' % (
+                name, phase, calls, total * 1e3, total / calls * 1e6,
+                out_bytes / 2**20, saved_bytes / 2**20))
+        return '\n'.join(lines)
+
+    def export_chrome_trace(self, path):
+        """Write the events in Chrome trace format (chrome://tracing, Perfetto)."""
+        trace = [{
+            'name': name, 'cat': phase, 'ph': 'X', 'pid': 0, 'tid': 0,
+            'ts': start * 1e6, 'dur': dur * 1e6,
+            'args': {'out_bytes': out_bytes, 'saved_bytes': saved_bytes},
+        } for name, phase, start, dur, out_bytes, saved_bytes in self.events]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace}, f)
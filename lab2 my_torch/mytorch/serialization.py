@@ -0,0 +1,94 @@
+import os
+import struct
+import zipfile
+import numpy as np
+from collections import OrderedDict
+
+
+def _flatten(state, prefix=''):
+    for key, value in state.items():
+        if isinstance(value, dict):
+            yield from _flatten(value, prefix + key + '/')
+        else:
+            yield prefix + key, np.asarray(value)
+
+
+def _nest(items):
+    state = OrderedDict()
+    for key, value in items:
+        *path, name = key.split('/')
+        owner = state
+        for p in path:
+            owner = owner.setdefault(p, OrderedDict())
+        owner[name] = value
+    return state
+
+
+def _map_member(f, path, info, mmap_mode):
+    """Memory-map one .npy member of an uncompressed zip archive, or return
+    None when it cannot be mapped."""
+
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    # local file header: 30 fixed bytes, then the name and the extra field
+    f.seek(info.header_offset)
+    header = f.read(30)
+    name_len, extra_len = struct.unpack('<HH', header[26:30])
+    f.seek(info.header_offset + 30 + name_len + extra_len)
+
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+    elif version == (2, 0):
+        shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(f)
+    else:
+        return None
+    if dtype.hasobject or not shape:
+        return None
+
+    return np.memmap(path, dtype=dtype, mode=mmap_mode, offset=f.tell(),
+                     shape=shape, order='F' if fortran_order else 'C')
+
+
+def _npz_path(path) -> str:
+    """`np.savez` appends '.npz' to a path without it; do the same on load."""
+    path = os.fspath(path)
+    return path if path.endswith('.npz') else path + '.npz'
+
+
+def save(state: dict, path: str):
+    """Write a (possibly nested) dict of arrays to an uncompressed .npz,
+    adding the suffix to `path` if it is missing.
+
+    Nested dicts, e.g. `{'model': model.state_dict(), 'optim':
+    optimizer.state_dict()}`, are stored under 'model/...' and 'optim/...'
+    keys. Being uncompressed, every array can later be memory-mapped.
+    """
+
+    np.savez(_npz_path(path), **OrderedDict(_flatten(state)))
+
+
+def load(path: str, mmap_mode: str = 'r') -> OrderedDict:
+    """Read a checkpoint written by `save`, with the same nesting.
+
+    Args:
+        mmap_mode: as in `np.load`. With 'r' the arrays are read-only views
+            of the file and nothing is read until it is used, which is what
+            inference wants; 'c' gives private copy-on-write pages that can
+            be trained in place; None reads everything into memory.
+    """
+
+    path = _npz_path(path)
+    items = []
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as f:
+        for info in archive.infolist():
+            key = info.filename[:-len('.npy')]
+            value = None
+            if mmap_mode is not None:
+                value = _map_member(f, path, info, mmap_mode)
+            if value is None:
+                with archive.open(info) as member:
+                    value = np.lib.format.read_array(member)
+            items.append((key, value))
+
+    return _nest(items)
@@ -0,0 +1,203 @@
+"""Hyperparameter / optimizer sweeps of the mnist and half moon examples.
+
+Every combination of the values given is trained in a process pool. The
+dataset is prepared once by the parent and memory-mapped read-only by
+every worker, so the page cache holds a single copy, and BLAS threads are
+split between the workers. Each finished run appends one JSON line (config,
+loss curve, test accuracy, wall time) to the results file.
+
+Usage:
+    python sweep.py --task mnist --optim Adam SGD Adagrad RMSProp -lr 1e-3 5e-3
+    python sweep.py --task half_moon --optim Adam SGD -lr 1e-2 1e-3 --workers 4
+"""
+import os
+import json
+import time
+import argparse
+import itertools
+import multiprocessing as mp
+import numpy as np
+
+import mytorch
+
+
+def make_optimizer(name, params, lr, flat=False):
+    """The optimizers as configured by the example scripts."""
+    if name == 'Adam':
+        return mytorch.Optim.Adam(params, lr=lr, flat=flat)
+    if name == 'SGD':
+        return mytorch.Optim.SGD(params, lr=lr, momentum=0.9, flat=flat)
+    if name == 'Adagrad':
+        return mytorch.Optim.Adagrad(params, lr=lr, flat=flat)
+    if name == 'RMSProp':
+        return mytorch.Optim.RMSProp(params, lr=lr, flat=flat)
+    raise ValueError(f'unknown optimizer {name}')
+
+
+def prepare_mnist(root):
+    """Fetch the raw idx files once, as `mnist_mytorch.py` does."""
+    raw = os.path.join(root, 'MNIST', 'raw')
+    if not os.path.exists(os.path.join(raw, 't10k-labels-idx1-ubyte')):
+        import torchvision
+        torchvision.datasets.MNIST(root=root, train=True, download=True)
+        torchvision.datasets.MNIST(root=root, train=False, download=True)
+    return raw
+
+
+def prepare_half_moon(root, seed):
+    """Generate the half moon split once and store it as .npy files."""
+    path = os.path.join(root, 'half_moon')
+    if not os.path.exists(os.path.join(path, 'y_test.npy')):
+        from sklearn import datasets
+        from sklearn.model_selection import train_test_split
+        X, y = datasets.make_moons(n_samples=1000, shuffle=True, noise=0.2,
+                                   random_state=seed)
+        splits = train_test_split(X, y, test_size=0.1, shuffle=True,
+                                  random_state=seed)
+        os.makedirs(path, exist_ok=True)
+        for name, arr in zip(['x_train', 'x_test', 'y_train', 'y_test'], splits):
+            np.save(os.path.join(path, name + '.npy'), arr)
+    return path
+
+
+def train_mnist(cfg):
+    """Same network and loop as `mnist_mytorch.py --model mlp`."""
+    train_set = mytorch.data.MNIST(cfg['data'], train=True)
+    test_set = mytorch.data.MNIST(cfg['data'], train=False)
+    model = mytorch.Sequential(mytorch.Linear(784, cfg['hidden_size']),
+                               mytorch.Functional.ReLU(),
+                               mytorch.Linear(cfg['hidden_size'], 10))
+    model.flatten_parameters()
+    params = [t for _, t in model.named_parameters()]
+    optimizer = make_optimizer(cfg['optim'], params, cfg['learning_rate'], flat=True)
+    criterion = mytorch.Functional.SoftmaxCrossEntropy(n_classes=10)
+    loader = mytorch.data.DataLoader(train_set, batch_size=cfg['batch_size'],
+                                     shuffle=True, prefetch=0)
+
+    losses, running = [], []
+    for epoch in range(cfg['num_epochs']):
+        for i, (images, labels) in enumerate(loader):
+            loss = criterion(model(images.reshape(-1, 784)), labels)
+            model.backward(loss.backward())
+            optimizer.step()
+            running.append(float(loss.loss))
+            if (i+1) % 100 == 0:
+                losses.append(float(np.mean(running)))
+                running = []
+        optimizer.lr *= cfg['lr_decay']
+
+    correct = 0
+    with mytorch.no_grad():
+        for images, labels in mytorch.data.DataLoader(
+                test_set, batch_size=1000, prefetch=0):
+            correct += (model(images.reshape(-1, 784)).argmax(-1) == labels).sum()
+
+    return losses, correct / len(test_set)
+
+
+def train_half_moon(cfg):
+    """Same network and loop as `half_moon_mytorch.py`."""
+    load = lambda name: np.load(os.path.join(cfg['data'], name + '.npy'),
+                                mmap_mode='r')
+    x_train, x_test = load('x_train'), load('x_test')
+    y_train, y_test = load('y_train'), load('y_test')
+
+    relu = mytorch.Functional.ReLU()
+    model = mytorch.Sequential(mytorch.Linear(2, 6), relu,
+                               mytorch.Linear(6, 6), relu,
+                               mytorch.Linear(6, 1))
+    params = [t for _, t in model.named_parameters()]
+    optimizer = make_optimizer(cfg['optim'], params, cfg['learning_rate'])
+    criterion = mytorch.Functional.MSELoss(n_classes=2)
+
+    losses = []
+    for epoch in range(cfg['num_epochs']):
+        order = np.random.permutation(len(x_train))
+        running = []
+        for start in range(0, len(order), cfg['batch_size']):
+            idx = np.sort(order[start:start + cfg['batch_size']])
+            loss = criterion(model(x_train[idx]), y_train[idx].reshape(-1, 1))
+            model.backward(loss.backward())
+            optimizer.step()
+            running.append(float(loss.loss))
+        losses.append(float(np.mean(running)))
+        optimizer.lr *= cfg['lr_decay']
+
+    with mytorch.no_grad():
+        predict = model(np.asarray(x_test))[:, 0] > 0.5
+
+    return losses, float((predict == y_test).mean())
+
+
+TASKS = {
+    'mnist': (prepare_mnist, train_mnist),
+    'half_moon': (prepare_half_moon, train_half_moon),
+}
+
+
+def run(cfg):
+    np.random.seed(cfg['seed'])
+    start = time.perf_counter()
+    losses, accuracy = TASKS[cfg['task']][1](cfg)
+    return {'config': cfg, 'loss': losses, 'test_accuracy': float(accuracy),
+            'wall_time': time.perf_counter() - start, 'pid': os.getpid()}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Grid sweep; every option accepts several values")
+    parser.add_argument('--task', default='mnist', choices=list(TASKS))
+    parser.add_argument('--optim', nargs='+', default=['Adam'],
+                        choices=['Adam', 'SGD', 'Adagrad', 'RMSProp'])
+    parser.add_argument('-lr', '--learning-rate', nargs='+', type=float)
+    parser.add_argument('--lr_decay', nargs='+', type=float)
+    parser.add_argument('--batch_size', nargs='+', type=int)
+    parser.add_argument('--num_epochs', nargs='+', type=int)
+    parser.add_argument('--hidden_size', nargs='+', default=[500], type=int)
+    parser.add_argument('--seed', nargs='+', default=[729], type=int)
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    parser.add_argument('--data', default='./data')
+    parser.add_argument('--out', default='',
+                        help='results file, ./result/sweep_<task>.jsonl by default')
+    args = parser.parse_args()
+
+    # defaults of the example scripts
+    defaults = {'mnist': dict(learning_rate=[5e-3], lr_decay=[0.8],
+                              batch_size=[128], num_epochs=[30]),
+                'half_moon': dict(learning_rate=[1e-2], lr_decay=[1.0],
+                                  batch_size=[16], num_epochs=[2000])}[args.task]
+    grid = {}
+    for name in ['optim', 'learning_rate', 'lr_decay', 'batch_size',
+                 'num_epochs', 'hidden_size', 'seed']:
+        grid[name] = getattr(args, name) or defaults[name]
+    if args.task == 'half_moon':
+        del grid['hidden_size']  # the half moon net is fixed at 2-6-6-1
+
+    prepare = TASKS[args.task][0]
+    data = prepare(args.data) if args.task == 'mnist' \
+        else prepare(args.data, args.seed[0])
+    configs = [dict(zip(grid, values), task=args.task, data=data)
+               for values in itertools.product(*grid.values())]
+
+    # workers start fresh interpreters, so the thread limit reaches BLAS
+    workers = max(1, min(args.workers, len(configs)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    with mytorch.parallel.blas_threads(threads):
+        pool = mp.get_context('spawn').Pool(workers)
+
+    out = args.out or os.path.join('result', f'sweep_{args.task}.jsonl')
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    print('%d configs on %d workers x %d BLAS threads -> %s' % (
+        len(configs), workers, threads, out))
+    with pool, open(out, 'a') as f:
+        for result in pool.imap_unordered(run, configs):
+            f.write(json.dumps(result) + '\n')
+            f.flush()
+            cfg = result['config']
+            print('%-8s lr=%.1e bs=%-4d acc=%.4f  %.1fs' % (
+                cfg['optim'], cfg['learning_rate'], cfg['batch_size'],
+                result['test_accuracy'], result['wall_time']))
+
+
+if __name__ == '__main__':
+    main()
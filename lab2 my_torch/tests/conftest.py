@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import `mytorch` from the lab directory, as the scripts do
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
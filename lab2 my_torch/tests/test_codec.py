@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+import mytorch
+from mytorch.codec import PackBits, Float16
+
+
+@pytest.mark.parametrize('shape', [(1,), (7,), (3, 5), (2, 3, 7), (4, 8)])
+def test_packbits_round_trip(shape):
+    np.random.seed(0)
+    mask = np.random.rand(*shape) > 0.5
+    codec = PackBits()
+    packed, = codec.encode((mask,))
+    assert packed.nbytes == (mask.size + 7) // 8
+    out, = codec.decode((packed,))
+    assert out.dtype == np.bool_ and out.shape == shape
+    np.testing.assert_array_equal(out, mask)
+
+
+def test_float16_round_trip():
+    np.random.seed(0)
+    x = np.random.randn(3, 5)
+    mask = x > 0
+    codec = Float16()
+    saved = codec.encode((x, mask, x.shape))
+    assert saved[0].nbytes == x.size * 2 and saved[2] == x.shape
+    out, out_mask, shape = codec.decode(saved)
+    assert out.dtype == x.dtype and shape == x.shape
+    np.testing.assert_allclose(out, x, rtol=1e-3)
+    np.testing.assert_array_equal(out_mask, mask)
+
+
+def test_relu_backward_through_packed_mask():
+    np.random.seed(0)
+    model = mytorch.Sequential(mytorch.Linear(5, 7, dtype=np.float64),
+                               mytorch.Functional.ReLU(),
+                               mytorch.Linear(7, 3, dtype=np.float64))
+    x, dy = np.random.randn(9, 5), np.random.randn(9, 3)
+
+    grads = []
+    for codec in [mytorch.Functional.ReLU.codec, None]:
+        model.modules[1].codec = codec
+        model(x)
+        _, (mask,) = model.tape.records[1]
+        assert isinstance(mask, mytorch.codec.Packed) == (codec is not None)
+        dx = model.backward(dy.copy())
+        grads.append([dx] + [t.grad.copy() for _, t in model.named_parameters()])
+    for packed, plain in zip(*grads):
+        np.testing.assert_array_equal(packed, plain)
@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+import mytorch
+
+
+def numeric_grad(f, a, eps=1e-6):
+    """Central differences of the scalar f() with respect to array a."""
+    grad = np.zeros(a.shape)
+    with mytorch.no_grad():
+        for i in np.ndindex(*a.shape):
+            a[i] += eps
+            plus = f()
+            a[i] -= 2 * eps
+            minus = f()
+            a[i] += eps
+            grad[i] = (plus - minus) / (2 * eps)
+    return grad
+
+
+@pytest.mark.parametrize('stride, padding', [(1, 0), (2, 1)])
+def test_conv2d_gradient(stride, padding):
+    np.random.seed(0)
+    conv = mytorch.Conv2d(2, 3, 3, stride=stride, padding=padding, dtype=np.float64)
+    x = np.random.randn(2, 2, 6, 5)
+    dy = np.random.randn(*conv(x).shape)
+
+    conv(x)
+    dx = conv.backward(dy.copy())
+    loss = lambda: (conv(x) * dy).sum()
+    np.testing.assert_allclose(conv.w.grad, numeric_grad(loss, conv.w),
+                               rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(dx, numeric_grad(loss, x), rtol=1e-6, atol=1e-8)
+
+
+@pytest.mark.parametrize('kernel_size, stride', [(2, 2), (2, 1), (3, 2)])
+def test_maxpool2d_gradient(kernel_size, stride):
+    np.random.seed(0)
+    pool = mytorch.Functional.MaxPool2d(kernel_size, stride)
+    x = np.random.randn(2, 3, 7, 6)
+    dy = np.random.randn(*pool(x).shape)
+
+    pool(x)
+    dx = pool.backward(dy.copy())
+    np.testing.assert_allclose(dx, numeric_grad(lambda: (pool(x) * dy).sum(), x),
+                               rtol=1e-6, atol=1e-8)
+
+
+def test_conv_pool_flatten_chain_gradient():
+    np.random.seed(0)
+    conv = mytorch.Conv2d(1, 2, 3, padding=1, dtype=np.float64)
+    model = mytorch.Sequential(conv, mytorch.Functional.ReLU(),
+                               mytorch.Functional.MaxPool2d(2),
+                               mytorch.Functional.Flatten())
+    x = np.random.randn(3, 1, 6, 6)
+    dy = np.random.randn(3, 18)
+
+    model(x)
+    dx = model.backward(dy.copy())
+    loss = lambda: (model(x) * dy).sum()
+    np.testing.assert_allclose(conv.w.grad, numeric_grad(loss, conv.w),
+                               rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(dx, numeric_grad(loss, x), rtol=1e-6, atol=1e-8)
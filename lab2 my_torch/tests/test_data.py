@@ -0,0 +1,81 @@
+import gzip
+import struct
+import threading
+
+import numpy as np
+import pytest
+
+from mytorch.data import load_idx, MNIST, DataLoader
+
+
+def write_idx(path, arr, code=0x08):
+    with open(path, 'wb') as f:
+        f.write(struct.pack('>BBBB', 0, 0, code, arr.ndim))
+        f.write(struct.pack('>%dI' % arr.ndim, *arr.shape))
+        f.write(arr.tobytes())
+
+
+def make_mnist(root, n=10):
+    images = np.arange(n * 4 * 3, dtype=np.uint8).reshape(n, 4, 3)
+    labels = (np.arange(n) % 10).astype(np.uint8)
+    write_idx(str(root / 'train-images-idx3-ubyte'), images)
+    write_idx(str(root / 'train-labels-idx1-ubyte'), labels)
+    return images, labels
+
+
+def test_load_idx(tmp_path):
+    arr = np.arange(24, dtype='>i4').reshape(2, 3, 4)
+    write_idx(str(tmp_path / 'a'), arr, code=0x0C)
+    loaded = load_idx(str(tmp_path / 'a'))
+    assert isinstance(loaded, np.memmap) and loaded.shape == (2, 3, 4)
+    np.testing.assert_array_equal(loaded, arr)
+
+    # a gzipped file is decompressed next to itself
+    write_idx(str(tmp_path / 'b'), arr.astype(np.uint8))
+    with open(tmp_path / 'b', 'rb') as f, gzip.open(tmp_path / 'c.gz', 'wb') as g:
+        g.write(f.read())
+    np.testing.assert_array_equal(load_idx(str(tmp_path / 'c')), arr)
+
+    (tmp_path / 'bad').write_bytes(b'\x01\x02\x08\x01' + bytes(8))
+    with pytest.raises(ValueError):
+        load_idx(str(tmp_path / 'bad'))
+
+
+@pytest.mark.parametrize('prefetch', [0, 2])
+def test_data_loader_batches(tmp_path, prefetch):
+    images, labels = make_mnist(tmp_path)
+    loader = DataLoader(MNIST(str(tmp_path)), batch_size=4, prefetch=prefetch)
+    batches = list(loader)
+
+    assert len(loader) == len(batches) == 3
+    assert [len(y) for _, y in batches] == [4, 4, 2]  # last batch is partial
+    x = np.concatenate([x for x, _ in batches])
+    assert x.dtype == np.float32
+    np.testing.assert_allclose(x, images / 255, rtol=1e-6)
+    np.testing.assert_array_equal(np.concatenate([y for _, y in batches]), labels)
+
+
+def test_data_loader_shuffle_covers_dataset(tmp_path):
+    _, labels = make_mnist(tmp_path)
+    np.random.seed(0)
+    loader = DataLoader(MNIST(str(tmp_path)), batch_size=3, shuffle=True)
+    seen = np.concatenate([y for _, y in loader])
+    np.testing.assert_array_equal(np.sort(seen), np.sort(labels))
+
+
+def test_prefetch_thread_stops(tmp_path):
+    make_mnist(tmp_path, n=100)
+    before = threading.active_count()
+    loader = DataLoader(MNIST(str(tmp_path)), batch_size=2, prefetch=1)
+
+    it = iter(loader)
+    next(it)
+    it.close()  # abandoned mid-epoch, with the producer blocked on a full queue
+    assert threading.active_count() == before
+
+    def fail(images):
+        raise RuntimeError('transform failed')
+    loader.transform = fail
+    with pytest.raises(RuntimeError, match='transform failed'):
+        list(loader)
+    assert threading.active_count() == before
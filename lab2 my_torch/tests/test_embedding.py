@@ -0,0 +1,45 @@
+import pickle
+
+import numpy as np
+import pytest
+
+import mytorch
+
+
+OPTIMIZERS = [
+    lambda params: mytorch.Optim.SGD(params, lr=0.1),
+    lambda params: mytorch.Optim.SGD(params, lr=0.1, momentum=0.9, nesterov=True),
+    lambda params: mytorch.Optim.Adagrad(params, lr=0.1, lr_decay=0.1),
+    lambda params: mytorch.Optim.RMSProp(params, lr=0.01, momentum=0.5),
+    lambda params: mytorch.Optim.Adam(params, lr=0.01, weight_decay=0.1),
+]
+
+
+@pytest.mark.parametrize('make_optimizer', OPTIMIZERS)
+def test_sparse_step_matches_dense_on_touched_rows(make_optimizer):
+    np.random.seed(0)
+    emb = mytorch.Embedding(6, 3, dtype=np.float64)
+    start = emb.w.copy()
+    dense = mytorch.my_tensor.from_array(start.copy(), requires_grad=True)
+    sparse_opt, dense_opt = make_optimizer([emb.w]), make_optimizer([dense])
+
+    # every step touches rows 1, 3 and 4, with repeated ids
+    for ids in [[3, 1, 3, 4, 1], [4, 4, 1, 3, 3], [1, 3, 4, 4, 4]]:
+        ids = np.array(ids).reshape(5, 1)
+        emb(ids)
+        emb.backward(np.random.randn(5, 1, 3))
+        dense.grad[...] = emb.w.grad.to_dense()
+        sparse_opt.step()
+        dense_opt.step()
+
+    touched = [1, 3, 4]
+    np.testing.assert_allclose(emb.w[touched], dense[touched], rtol=1e-12, atol=1e-14)
+    untouched = [0, 2, 5]
+    np.testing.assert_array_equal(emb.w[untouched], start[untouched])
+    assert emb.w.grad is None
+
+
+def test_sparse_flag_survives_pickle():
+    emb = pickle.loads(pickle.dumps(mytorch.Embedding(6, 3)))
+    assert emb.w.sparse and emb.w.requires_grad
+    assert emb.w.grad is None
@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+
+import mytorch
+from mytorch.Functional import ReLU, Sigmoid, LinearAct
+
+
+def make_model(act):
+    np.random.seed(0)
+    return mytorch.Sequential(mytorch.Linear(16, 64, dtype=np.float64), act(),
+                              mytorch.Linear(64, 64, dtype=np.float64), act(),
+                              mytorch.Linear(64, 3, dtype=np.float64))
+
+
+@pytest.mark.parametrize('act', [ReLU, Sigmoid])
+def test_fused_matches_unfused(act):
+    plain, fused = make_model(act), mytorch.Functional.fuse(make_model(act))
+    assert [type(m) for m in fused.modules].count(LinearAct) == 2
+    assert list(fused.state_dict()) == list(plain.state_dict())
+
+    # two and a half chunks of rows
+    n = fused.modules[0].block_rows(np.empty((1, 64))) * 5 // 2
+    np.random.seed(1)
+    x, dy = np.random.randn(n, 16), np.random.randn(n, 3)
+
+    results = []
+    for model in [plain, fused]:
+        out = model(x)
+        dx = model.backward(dy.copy())
+        results.append([out, dx] + [t.grad.copy() for _, t in model.named_parameters()])
+    for p, f in zip(*results):
+        np.testing.assert_allclose(f, p, rtol=1e-12, atol=1e-12)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+import mytorch
+
+
+def make_model():
+    np.random.seed(0)
+    model = mytorch.Sequential(mytorch.Linear(4, 8), mytorch.Functional.ReLU(),
+                               mytorch.Linear(8, 3), mytorch.Functional.Sigmoid())
+    model.flatten_parameters()
+    return model
+
+
+def grads(model):
+    return [t.grad.copy() for _, t in model.named_parameters()]
+
+
+def test_backward_leaves_dy_untouched():
+    x = np.random.randn(5, 4)
+    dy = np.random.randn(5, 3)
+    model = make_model()
+    model(x)
+    model.backward(dy.copy())
+    expected = grads(model)
+
+    compiled = mytorch.jit.trace(model, x)
+    compiled(x)
+    caller = dy.copy()
+    compiled.backward(caller)
+    np.testing.assert_array_equal(caller, dy)
+    for g, e in zip(grads(model), expected):
+        np.testing.assert_allclose(g, e, rtol=1e-6, atol=1e-8)
+
+
+def test_backward_accepts_readonly_and_flat_dy():
+    x = np.random.randn(5, 4)
+    dy = np.random.randn(5, 3)
+    model = make_model()
+    compiled = mytorch.jit.trace(model, x)
+    compiled(x)
+    compiled.backward(dy.copy())
+    expected = grads(model)
+
+    readonly = dy.copy()
+    readonly.flags.writeable = False
+    for arg in [readonly, dy.ravel()]:
+        compiled(x)
+        compiled.backward(arg)
+        for g, e in zip(grads(model), expected):
+            np.testing.assert_allclose(g, e)
+
+
+def test_trace_rejects_unsupported_ops():
+    model = mytorch.Sequential(mytorch.Linear(4, 8), mytorch.Functional.Flatten())
+    with pytest.raises(TypeError, match='trace does not support'):
+        mytorch.jit.trace(model, np.random.randn(5, 4))
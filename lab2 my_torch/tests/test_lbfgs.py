@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+import mytorch
+
+
+class Point(mytorch.Module):
+    """A single parameter vector, for optimizing plain functions."""
+
+    def __init__(self, x):
+        self.x = mytorch.my_tensor.from_array(np.array(x, np.float64),
+                                              requires_grad=True)
+
+
+def minimize(f_and_grad, x0, **kwargs):
+    # the default tolerances stop about 1e-5 away from the minimum, as torch's
+    kwargs = dict(dict(tolerance_grad=1e-12, tolerance_change=1e-20), **kwargs)
+    point = Point(x0)
+    optimizer = mytorch.Optim.LBFGS(point.flatten_parameters(), **kwargs)
+
+    def closure():
+        f, g = f_and_grad(point.x)
+        point.x.grad[...] = g
+        return f
+
+    for _ in range(10):
+        optimizer.step(closure)
+    return point.x, optimizer
+
+
+def quadratic(n=10, seed=0):
+    rng = np.random.RandomState(seed)
+    M = rng.randn(n, n)
+    A, b = M.dot(M.T) + n * np.eye(n), rng.randn(n)
+    return (lambda x: (0.5 * x.dot(A).dot(x) - b.dot(x), A.dot(x) - b)), A, b
+
+
+def rosenbrock(x):
+    a, b = x
+    f = (1 - a) ** 2 + 100 * (b - a * a) ** 2
+    g = [-2 * (1 - a) - 400 * a * (b - a * a), 200 * (b - a * a)]
+    return f, np.array(g)
+
+
+@pytest.mark.parametrize('line_search', ['strong_wolfe', None])
+def test_lbfgs_quadratic(line_search):
+    f_and_grad, A, b = quadratic()
+    x, _ = minimize(f_and_grad, np.zeros(10), line_search=line_search,
+                    history_size=5)
+    np.testing.assert_allclose(x, np.linalg.solve(A, b), rtol=1e-6, atol=1e-8)
+
+
+def test_lbfgs_rosenbrock():
+    x, _ = minimize(rosenbrock, [-1.5, 2.], history_size=5)
+    np.testing.assert_allclose(x, [1., 1.], atol=1e-6)
+
+
+def two_loop(S, Y, g):
+    """H g by the two-loop recursion, pairs oldest first, H_0 = gamma I."""
+    alphas, q = [], g.copy()
+    for s, y in reversed(list(zip(S, Y))):
+        alpha = s.dot(q) / y.dot(s)
+        q -= alpha * y
+        alphas.append(alpha)
+    q *= S[-1].dot(Y[-1]) / Y[-1].dot(Y[-1])
+    for (s, y), alpha in zip(zip(S, Y), reversed(alphas)):
+        q += (alpha - y.dot(q) / y.dot(s)) * s
+    return q
+
+
+def test_lbfgs_direction_matches_two_loop():
+    f_and_grad, _, _ = quadratic(seed=1)
+    # more iterations than history, so the ring has wrapped
+    _, optimizer = minimize(f_and_grad, np.ones(10), history_size=3, max_iter=2)
+    m = optimizer.filled
+    assert m == 3 and optimizer.head != 0
+    order = (optimizer.head - m + np.arange(m)) % optimizer.history_size
+    S, Y = optimizer.S[order], optimizer.Y[order]
+
+    g = np.random.RandomState(2).randn(10)
+    np.testing.assert_allclose(-optimizer._direction(g), two_loop(S, Y, g),
+                               rtol=1e-8, atol=1e-10)
+
+
+def test_lbfgs_rejects_unsupported_parameters():
+    with pytest.raises(ValueError, match='sparse'):
+        mytorch.Optim.LBFGS([mytorch.Embedding(6, 3).w])
+    half = mytorch.my_tensor.from_array(np.zeros(3, np.float16), requires_grad=True)
+    with pytest.raises(ValueError, match='float16'):
+        mytorch.Optim.LBFGS([half])
@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+from mytorch.Functional import Softmax, CrossEntropy, SoftmaxCrossEntropy
+
+
+@pytest.mark.parametrize('label_shape', [(6,), (6, 1)])
+def test_softmax_cross_entropy_matches_pair(label_shape):
+    np.random.seed(0)
+    logits = np.random.randn(6, 5)
+    labels = np.random.randint(0, 5, 6).reshape(label_shape)
+
+    pair = CrossEntropy(n_classes=5)(Softmax()(logits), labels)
+    fused = SoftmaxCrossEntropy(n_classes=5)(logits, labels)
+    # CrossEntropy takes log(p + 1e-7)
+    np.testing.assert_allclose(fused.loss, pair.loss, rtol=1e-5)
+    np.testing.assert_allclose(fused.backward(), pair.backward(), rtol=1e-10, atol=1e-12)
+
+
+def test_softmax_cross_entropy_float32_and_inputs_untouched():
+    np.random.seed(0)
+    logits = np.random.randn(6, 5).astype(np.float32)
+    labels = np.random.randint(0, 5, (6, 1))
+    caller = logits.copy()
+
+    loss = SoftmaxCrossEntropy(n_classes=5)(logits, labels)
+    assert loss.loss.dtype == np.float32
+    assert loss.backward().dtype == np.float32
+    np.testing.assert_array_equal(logits, caller)
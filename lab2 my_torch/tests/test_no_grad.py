@@ -0,0 +1,26 @@
+import numpy as np
+
+import mytorch
+
+
+class NoMask(np.ndarray):
+    """An input that fails if anyone builds a comparison mask from it."""
+
+    def __gt__(self, other):
+        raise AssertionError('mask built under no_grad')
+
+
+def test_no_grad_records_and_saves_nothing():
+    np.random.seed(0)
+    relu = mytorch.Functional.ReLU()
+    model = mytorch.Sequential(mytorch.Linear(4, 8), relu, mytorch.Linear(8, 3))
+    x = np.random.randn(5, 4)
+
+    with mytorch.no_grad():
+        out = model(x)
+        relu(x.view(NoMask))
+    assert model.tape is None
+    assert all(op.saved is None for op in model.modules) and relu.saved is None
+
+    np.testing.assert_array_equal(out, model(x))
+    assert len(model.tape.records) == 3
@@ -0,0 +1,144 @@
+import numpy as np
+import pytest
+
+import mytorch
+from mytorch import Optim
+
+
+OPTIMIZERS = {
+    'SGD': lambda params, flat: Optim.SGD(params, lr=0.1, flat=flat),
+    'SGD momentum': lambda params, flat: Optim.SGD(params, lr=0.1, momentum=0.9,
+                                                   dampening=0.1, flat=flat),
+    'SGD nesterov': lambda params, flat: Optim.SGD(params, lr=0.1, momentum=0.9,
+                                                   nesterov=True, flat=flat),
+    'Adagrad': lambda params, flat: Optim.Adagrad(params, lr=0.1, lr_decay=0.1,
+                                                  flat=flat),
+    'RMSProp': lambda params, flat: Optim.RMSProp(params, lr=0.01, flat=flat),
+    'RMSProp momentum': lambda params, flat: Optim.RMSProp(params, lr=0.01,
+                                                           momentum=0.5, flat=flat),
+    'Adam': lambda params, flat: Optim.Adam(params, lr=0.01, flat=flat),
+    'Adam weight_decay': lambda params, flat: Optim.Adam(params, lr=0.01,
+                                                         weight_decay=0.1, flat=flat),
+}
+
+
+def make_model(dtype=np.float64):
+    np.random.seed(0)
+    return mytorch.Sequential(mytorch.Linear(4, 3, dtype=dtype),
+                              mytorch.Functional.ReLU(),
+                              mytorch.Linear(3, 2, dtype=dtype))
+
+
+def gradients(params, steps=3, seed=1):
+    rng = np.random.RandomState(seed)
+    return [[rng.randn(*p.shape) for p in params] for _ in range(steps)]
+
+
+def run(optimizer, params, grads):
+    for step in grads:
+        for p, g in zip(params, step):
+            p.grad[...] = g
+        optimizer.step()
+
+
+@pytest.mark.parametrize('name', OPTIMIZERS)
+def test_flat_matches_per_parameter(name):
+    plain, flat = make_model(), make_model()
+    plain_params = [t for _, t in plain.named_parameters()]
+    flat_params = flat.flatten_parameters()
+    grads = gradients(plain_params)
+
+    run(OPTIMIZERS[name](plain_params, False), plain_params, grads)
+    run(OPTIMIZERS[name](flat_params, True), flat_params, grads)
+    for p, f in zip(plain_params, flat_params):
+        np.testing.assert_allclose(f, p, rtol=1e-12, atol=1e-14)
+        assert not f.grad.any()
+
+
+@pytest.mark.parametrize('flat', [False, True])
+@pytest.mark.parametrize('cls', [Optim.SGD, Optim.RMSProp])
+def test_lr_argument_is_used(cls, flat):
+    model = make_model()
+    params = model.flatten_parameters() if flat else [t for _, t in model.named_parameters()]
+    start = [p.copy() for p in params]
+    grads = gradients(params, steps=1)
+
+    run(cls(params, lr=0.5, flat=flat), params, grads)
+    for p, p0, g in zip(params, start, grads[0]):
+        if cls is Optim.RMSProp:  # alpha = 0.99: sqrt(avg) = 0.1 |g|
+            g = g / (0.1 * np.abs(g) + 1e-8)
+        np.testing.assert_allclose(p, p0 - 0.5 * g, rtol=1e-10)
+
+
+@pytest.mark.parametrize('flat', [False, True])
+def test_sgd_momentum_reference(flat):
+    model = make_model()
+    params = model.flatten_parameters() if flat else [t for _, t in model.named_parameters()]
+    expected = [p.copy() for p in params]
+    grads = gradients(params)
+
+    run(Optim.SGD(params, lr=0.1, momentum=0.9, dampening=0.1, flat=flat), params, grads)
+    buf = [None] * len(params)
+    for step in grads:
+        for i, g in enumerate(step):
+            buf[i] = g.copy() if buf[i] is None else 0.9 * buf[i] + 0.9 * g
+            expected[i] -= 0.1 * buf[i]
+    for p, e in zip(params, expected):
+        np.testing.assert_allclose(p, e, rtol=1e-12)
+
+
+@pytest.mark.parametrize('flat', [False, True])
+def test_adam_reference(flat):
+    """Bias correction uses the step count; weight decay adds wd * p."""
+    model = make_model()
+    params = model.flatten_parameters() if flat else [t for _, t in model.named_parameters()]
+    expected = [p.copy() for p in params]
+    grads = gradients(params)
+
+    run(Optim.Adam(params, lr=0.01, weight_decay=0.1, flat=flat), params, grads)
+    b1, b2 = 0.9, 0.999
+    m = [np.zeros_like(p) for p in expected]
+    v = [np.zeros_like(p) for p in expected]
+    for t, step in enumerate(grads, 1):
+        for i, g in enumerate(step):
+            g = g + 0.1 * expected[i]
+            m[i] = b1 * m[i] + (1 - b1) * g
+            v[i] = b2 * v[i] + (1 - b2) * g * g
+            m_, v_ = m[i] / (1 - b1 ** t), v[i] / (1 - b2 ** t)
+            expected[i] -= 0.01 * m_ / (np.sqrt(v_) + 1e-8)
+    for p, e in zip(params, expected):
+        np.testing.assert_allclose(p, e, rtol=1e-10)
+
+
+@pytest.mark.parametrize('flat', [False, True])
+@pytest.mark.parametrize('name', ['SGD momentum', 'Adam'])
+def test_float16_master_weights_track_float32(name, flat):
+    full, half = make_model(np.float32), make_model(np.float32).to(np.float16)
+    for _, p in full.named_parameters():  # the same, representable start
+        p[...] = p.astype(np.float16)
+    if flat:
+        full_params, half_params = full.flatten_parameters(), half.flatten_parameters()
+    else:
+        full_params = [t for _, t in full.named_parameters()]
+        half_params = [t for _, t in half.named_parameters()]
+    start = [p.copy() for p in half_params]
+    # half precision gradients, so both runs see the same values
+    grads = [[g.astype(np.float16) for g in step]
+             for step in gradients(full_params, steps=30)]
+
+    # steps of lr * |g| ~ 1e-4, which float16 weights near 1 would round away
+    full_opt = OPTIMIZERS[name](full_params, flat)
+    half_opt = OPTIMIZERS[name](half_params, flat)
+    full_opt.lr = half_opt.lr = 1e-4
+    run(full_opt, full_params, [[g.astype(np.float32) for g in step] for step in grads])
+    run(half_opt, half_params, grads)
+
+    master = [half_opt.flat_param] if flat else half_opt.params
+    full_master = [full_opt.flat_param] if flat else full_params
+    for m, f in zip(master, full_master):
+        assert m.dtype == np.float32
+        np.testing.assert_array_equal(m, f)
+    for h, f, s in zip(half_params, full_params, start):
+        assert h.dtype == np.float16
+        np.testing.assert_array_equal(h, f.astype(np.float16))
+    assert any((h != s).any() for h, s in zip(half_params, start))
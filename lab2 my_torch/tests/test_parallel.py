@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import mytorch
+
+
+def make_model():
+    np.random.seed(0)
+    return mytorch.Sequential(mytorch.Linear(4, 8, dtype=np.float64),
+                              mytorch.Functional.ReLU(),
+                              mytorch.Linear(8, 3, dtype=np.float64))
+
+
+def plain_grads(x, y):
+    model = make_model()
+    criterion = mytorch.Functional.MSELoss(n_classes=3)
+    model.backward(criterion(model(x), y).backward())
+    return [t.grad.copy() for _, t in model.named_parameters()]
+
+
+@pytest.mark.parametrize('n', [10, 1])
+def test_data_parallel_matches_single_process(n):
+    np.random.seed(1)
+    x, y = np.random.randn(10, 4), np.random.randn(10, 3)
+    model = make_model()
+    criterion = mytorch.Functional.MSELoss(n_classes=3)
+    with mytorch.parallel.DataParallel(model, criterion, num_workers=2) as trainer:
+        trainer.step(x, y)  # the first batch sizes the shared buffers
+        loss = trainer.step(x[:n], y[:n])
+        grads = [t.grad.copy() for _, t in model.named_parameters()]
+
+    assert np.isfinite(loss)
+    np.testing.assert_allclose(loss, criterion(make_model()(x[:n]), y[:n]).loss)
+    for g, e in zip(grads, plain_grads(x[:n], y[:n])):
+        np.testing.assert_allclose(g, e, rtol=1e-10, atol=1e-12)
+
+
+def test_data_parallel_rejects_sparse_parameters():
+    model = mytorch.Sequential(mytorch.Embedding(6, 3), mytorch.Linear(3, 1))
+    criterion = mytorch.Functional.MSELoss(n_classes=1)
+    with pytest.raises(ValueError, match='sparse'):
+        mytorch.parallel.DataParallel(model, criterion)
+
+
+def test_micro_batch_matches_whole_batch():
+    np.random.seed(1)
+    x, y = np.random.randn(10, 4), np.random.randn(10, 3)
+    model = make_model()
+    criterion = mytorch.Functional.MSELoss(n_classes=3)
+    trainer = mytorch.parallel.MicroBatch(model, criterion, micro_batch_size=3)
+    loss = trainer.step(x, y)
+
+    np.testing.assert_allclose(loss, criterion(make_model()(x), y).loss)
+    for (_, t), e in zip(model.named_parameters(), plain_grads(x, y)):
+        np.testing.assert_allclose(t.grad, e, rtol=1e-10, atol=1e-12)
@@ -0,0 +1,19 @@
+import numpy as np
+
+import mytorch
+
+
+def test_fused_backward_recorded_once():
+    np.random.seed(0)
+    model = mytorch.Sequential(mytorch.Linear(4, 8), mytorch.Functional.ReLU(),
+                               mytorch.Linear(8, 3))
+    model = mytorch.Functional.fuse(model)
+    criterion = mytorch.Functional.MSELoss(n_classes=3)
+    x, y = np.random.randn(5, 4), np.random.randn(5, 3)
+
+    with mytorch.profiler.profile() as prof:
+        loss = criterion(model(x), y)
+        model.backward(loss.backward())
+
+    backward = [name for name, phase, *_ in prof.events if phase == 'backward']
+    assert sorted(backward) == sorted(['LinearAct', 'Linear', 'MSELoss'])
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+import mytorch
+
+
+def numeric_grad(f, a, eps=1e-6):
+    """Central differences of the scalar f() with respect to array a."""
+    grad = np.zeros(a.shape)
+    with mytorch.no_grad():
+        for i in np.ndindex(*a.shape):
+            a[i] += eps
+            plus = f()
+            a[i] -= 2 * eps
+            minus = f()
+            a[i] += eps
+            grad[i] = (plus - minus) / (2 * eps)
+    return grad
+
+
+@pytest.mark.parametrize('cls', [mytorch.LSTM, mytorch.GRU])
+def test_recurrent_gradient(cls):
+    np.random.seed(0)
+    rnn = cls(3, 4, dtype=np.float64)
+    x, dy = np.random.randn(5, 2, 3), np.random.randn(5, 2, 4)
+
+    rnn(x)
+    dx = rnn.backward(dy.copy())
+    loss = lambda: (rnn(x) * dy).sum()
+    np.testing.assert_allclose(rnn.w.grad, numeric_grad(loss, rnn.w),
+                               rtol=1e-6, atol=1e-8)
+    np.testing.assert_allclose(dx, numeric_grad(loss, x), rtol=1e-6, atol=1e-8)
+
+
+@pytest.mark.parametrize('cls', [mytorch.LSTM, mytorch.GRU])
+def test_truncated_bptt(cls):
+    np.random.seed(0)
+    rnn = cls(3, 4, stateful=True, dtype=np.float64)
+    x, dy = np.random.randn(6, 2, 3), np.random.randn(3, 2, 4)
+    with mytorch.no_grad():
+        full = rnn(x)
+
+    rnn.reset_state()
+    first = rnn(x[:3])
+    rnn.backward(np.zeros_like(dy))
+    state = rnn.state
+    second = rnn(x[3:])
+    rnn.backward(dy.copy())
+    np.testing.assert_allclose(np.concatenate([first, second]), full)
+
+    # the gradient of the second window stops at its initial state
+    def loss():
+        rnn.state = state
+        return (rnn(x[3:]) * dy).sum()
+    np.testing.assert_allclose(rnn.w.grad, numeric_grad(loss, rnn.w),
+                               rtol=1e-6, atol=1e-8)
+
+
+@pytest.mark.parametrize('name', ['LSTM', 'GRU'])
+def test_matches_torch(name):
+    torch = pytest.importorskip('torch')
+    np.random.seed(0)
+    torch.manual_seed(0)
+    ref = getattr(torch.nn, name)(3, 4).double()
+    rnn = getattr(mytorch, name)(3, 4, dtype=np.float64)
+    b_ih, b_hh = ref.bias_ih_l0.detach().numpy(), ref.bias_hh_l0.detach().numpy()
+    if name == 'LSTM':
+        rnn.w[0] = b_ih + b_hh
+    else:
+        rnn.w[0], rnn.w[1] = b_ih, b_hh
+    rnn.w_x[...] = ref.weight_ih_l0.detach().numpy().T
+    rnn.w_h[...] = ref.weight_hh_l0.detach().numpy().T
+    x, dy = np.random.randn(5, 2, 3), np.random.randn(5, 2, 4)
+
+    out = rnn(x)
+    dx = rnn.backward(dy.copy())
+    x_ref = torch.tensor(x, requires_grad=True)
+    out_ref, _ = ref(x_ref)
+    (out_ref * torch.tensor(dy)).sum().backward()
+
+    np.testing.assert_allclose(out, out_ref.detach().numpy(), rtol=1e-10, atol=1e-12)
+    np.testing.assert_allclose(dx, x_ref.grad.numpy(), rtol=1e-10, atol=1e-12)
+    start = rnn.bias_rows + 3
+    grads = {'w_x': (rnn.w.grad[rnn.bias_rows:start], ref.weight_ih_l0.grad.numpy().T),
+             'w_h': (rnn.w.grad[start:], ref.weight_hh_l0.grad.numpy().T),
+             'b_ih': (rnn.w.grad[0], ref.bias_ih_l0.grad.numpy()),
+             'b_hh': (rnn.w.grad[rnn.bias_rows - 1], ref.bias_hh_l0.grad.numpy())}
+    for key, (g, e) in grads.items():
+        np.testing.assert_allclose(g, e, rtol=1e-10, atol=1e-12, err_msg=key)
@@ -0,0 +1,20 @@
+import numpy as np
+import pytest
+
+import mytorch
+
+
+@pytest.mark.parametrize('name', ['ckpt.npz', 'ckpt'])
+def test_save_load_round_trip(tmp_path, name):
+    np.random.seed(0)
+    model = mytorch.Sequential(mytorch.Linear(4, 3), mytorch.Functional.ReLU())
+    state = {'model': model.state_dict(), 'epoch': np.array(7)}
+    path = str(tmp_path / name)
+
+    mytorch.save(state, path)
+    loaded = mytorch.load(path)
+
+    assert list(loaded['model']) == list(state['model'])
+    for key, value in state['model'].items():
+        np.testing.assert_array_equal(loaded['model'][key], value)
+    assert loaded['epoch'] == 7
@@ -0,0 +1,44 @@
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+import sweep
+
+
+def write_idx(path, arr):
+    with open(path, 'wb') as f:
+        f.write(struct.pack('>BBBB', 0, 0, 0x08, arr.ndim))
+        f.write(struct.pack('>%dI' % arr.ndim, *arr.shape))
+        f.write(arr.tobytes())
+
+
+def test_mnist_sweep_writes_a_row_per_config(tmp_path, monkeypatch):
+    raw = tmp_path / 'MNIST' / 'raw'
+    raw.mkdir(parents=True)
+    rng = np.random.RandomState(0)
+    for split, n in [('train', 32), ('t10k', 16)]:
+        write_idx(str(raw / f'{split}-images-idx3-ubyte'),
+                  rng.randint(0, 256, (n, 28, 28)).astype(np.uint8))
+        write_idx(str(raw / f'{split}-labels-idx1-ubyte'),
+                  (np.arange(n) % 10).astype(np.uint8))
+
+    out = tmp_path / 'out.jsonl'
+    monkeypatch.setattr(sys, 'argv', [
+        'sweep.py', '--task', 'mnist', '--optim', 'Adam', 'SGD',
+        '--num_epochs', '1', '--batch_size', '8', '--hidden_size', '8',
+        '--workers', '2', '--data', str(tmp_path), '--out', str(out)])
+    env = dict(os.environ)
+    sweep.main()
+    assert dict(os.environ) == env  # the BLAS thread limit is restored
+
+    rows = [json.loads(line) for line in out.read_text().splitlines()]
+    assert sorted(row['config']['optim'] for row in rows) == ['Adam', 'SGD']
+    for row in rows:
+        assert set(row) == {'config', 'loss', 'test_accuracy', 'wall_time', 'pid'}
+        assert row['config']['hidden_size'] == 8
+        assert row['config']['data'] == str(raw)
+        assert 0 <= row['test_accuracy'] <= 1 and row['wall_time'] > 0
+    assert all(row['pid'] != os.getpid() for row in rows)
@@ -0,0 +1,28 @@
+import numpy as np
+
+import mytorch
+
+
+def test_from_array_wraps_without_copying():
+    arr = np.arange(6, dtype=np.float32).reshape(2, 3)
+    t = mytorch.my_tensor.from_array(arr, requires_grad=True)
+    assert isinstance(t, mytorch.my_tensor.Tensor) and np.shares_memory(t, arr)
+    t[0, 0] = 7
+    assert arr[0, 0] == 7
+
+
+def test_grad_is_allocated_on_first_use():
+    t = mytorch.my_tensor.from_array(np.ones((2, 3)), requires_grad=True)
+    assert t._grad is None
+    assert t.grad.shape == t.shape and not t.grad.any()  # first read allocates
+    assert t._grad is not None
+
+    written = mytorch.my_tensor.from_array(np.ones(3), requires_grad=True)
+    g = np.full(3, 2.)
+    written.grad = g  # first write keeps the array given, no zeros allocated
+    assert written._grad is g
+
+    assert mytorch.my_tensor.from_array(np.ones(3)).grad is None
+    sparse = mytorch.my_tensor.from_array(np.ones(3), requires_grad=True)
+    sparse.sparse = True
+    assert sparse.grad is None and sparse._grad is None
@@ -0,0 +1,50 @@
+import numpy as np
+
+import mytorch
+
+
+class Tied(mytorch.Module):
+    """The same Linear applied twice, with a ReLU in between."""
+
+    def __init__(self):
+        super(Tied, self).__init__()
+        self.fc = mytorch.Linear(4, 4, dtype=np.float64)
+        self.relu = mytorch.Functional.ReLU()
+
+    def forward(self, x):
+        return self.fc(self.relu(self.fc(x)))
+
+
+def numeric_grad(model, w, x, dy, eps=1e-6):
+    grad = np.zeros(w.shape)
+    with mytorch.no_grad():
+        for i in np.ndindex(*w.shape):
+            w[i] += eps
+            plus = (model(x) * dy).sum()
+            w[i] -= 2 * eps
+            minus = (model(x) * dy).sum()
+            w[i] += eps
+            grad[i] = (plus - minus) / (2 * eps)
+    return grad
+
+
+def test_tied_linear_gradient():
+    np.random.seed(0)
+    model = Tied()
+    x, dy = np.random.randn(5, 4), np.random.randn(5, 4)
+    model(x)
+    model.backward(dy.copy())
+    np.testing.assert_allclose(model.fc.w.grad, numeric_grad(model, model.fc.w, x, dy),
+                               rtol=1e-6, atol=1e-8)
+
+
+def test_tied_linear_gradient_traced():
+    np.random.seed(0)
+    fc = mytorch.Linear(4, 4, dtype=np.float64)
+    model = mytorch.Sequential(fc, mytorch.Functional.ReLU(), fc)
+    x, dy = np.random.randn(5, 4), np.random.randn(5, 4)
+    compiled = mytorch.jit.trace(model, x)
+    compiled(x)
+    compiled.backward(dy)
+    np.testing.assert_allclose(fc.w.grad, numeric_grad(model, fc.w, x, dy),
+                               rtol=1e-6, atol=1e-8)
@@ -4,7 +4,7 @@ import warnings
 
 
 class DefaultConfig(object):
-    model = 'LrkNet'  # 使用的模型，名字必须与models/__init__.py中的名字一致
+    model = 'LrkNet'  # 使用的模型，名字必须是models.available()中的名字
     optim = 'Adam'  # 优化器
     dataset = 'CIFAR10'  # 数据集名称
     vis = False  # 是否使用visdom可视化
@@ -12,6 +12,7 @@ class DefaultConfig(object):
 
     train_data_root = './Data/train/'  # 训练集存放路径
     test_data_root = './Data/test/'  # 测试集存放路径
+    pretrained_root = './Data/pretrained/'  # 预训练权重缓存路径(*_transfer 模型)
     load_model_path = None  # 加载预训练的模型的路径，为None代表不加载
     num_classes = 10  # 类别数
     seed = 729  # random seed
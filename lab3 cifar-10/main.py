@@ -1,9 +1,11 @@
 # -.- coding:utf-8 -.-
 import os
+import sys
+import time
+START = time.perf_counter()  # 启动时间包括下面 torch 等的 import
 import fire
 import torch
 from torch.utils.data import DataLoader
-from torch.utils.data import sampler
 from math import sqrt
 from torchnet import meter
 from torchvision import datasets, transforms
@@ -12,6 +14,11 @@ import utils
 import models
 from config import DefaultConfig
 
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
 # config
 opt = DefaultConfig()
 utils.setup_seed(opt.seed)
@@ -34,44 +41,30 @@ def train(**kwargs):
         vis = utils.Visualizer(opt.vis_env)
 
     # step1: model
-    model = getattr(models, opt.model)
-    if opt.model == 'LrkNet':
-        model = getattr(models, opt.model)()
+    model = build_model(opt.model)
+    report_startup('model %s' % opt.model)
     if opt.load_model_path:
         model.load_state_dict(torch.load(opt.load_model_path))
     if opt.use_gpu:
         print("device: %s" % opt.device)
         model.to(opt.device)
 
-    # step2: data enhancement
-    transform_aug = transforms.Compose([
-        transforms.RandomHorizontalFlip(),
-        transforms.Resize(32),
-        transforms.CenterCrop(32),
-        transforms.ToTensor(),
-        transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
-    ])
-    if opt.model == 'alexnet' or opt.model == 'alexnet_transfer':
-        transform_aug = transforms.Compose([
-            transforms.RandomHorizontalFlip(),
-            transforms.Resize(64),
-            transforms.CenterCrop(64),
-            transforms.ToTensor(),
-            transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
-        ])
-
-    train_dataset = datasets.CIFAR10(
-        root=opt.train_data_root, train=True, download=True, transform=transform_aug)
-    test_dataset = datasets.CIFAR10(
-        root=opt.test_data_root, train=False, download=True, transform=transform_aug)
+    # step2: data, 解码一次缓存为 uint8 数组，整个 batch 一起做数据增强
+    size = 64 if opt.model in ('alexnet', 'alexnet_transfer') else 32
+    train_dataset = utils.CIFAR10Cache(
+        opt.train_data_root, train=True, size=size, flip=True)
+    valid_dataset = utils.CIFAR10Cache(
+        opt.train_data_root, train=True, size=size)
+    test_dataset = utils.CIFAR10Cache(
+        opt.test_data_root, train=False, size=size)
 
     train_num = int(0.8 * len(train_dataset))  # 训练集:验证集=8:2
-    train_data = DataLoader(dataset=train_dataset, batch_size=opt.batch_size,
-                            sampler=sampler.SubsetRandomSampler(range(train_num)))
-    valid_data = DataLoader(dataset=train_dataset, batch_size=opt.batch_size,
-                            sampler=sampler.SubsetRandomSampler(range(train_num, len(train_dataset))))
-    test_data = DataLoader(dataset=test_dataset,
-                           batch_size=opt.batch_size, shuffle=False)
+    train_data = utils.batch_loader(train_dataset, range(train_num), opt.batch_size,
+                                    shuffle=True, num_workers=opt.num_workers)
+    valid_data = utils.batch_loader(valid_dataset, range(train_num, len(train_dataset)),
+                                    opt.batch_size, num_workers=opt.num_workers)
+    test_data = utils.batch_loader(test_dataset, range(len(test_dataset)),
+                                   opt.batch_size, num_workers=opt.num_workers)
     print('data loaded')
 
     # step3: loss_fn & optimizer
@@ -190,6 +183,27 @@ def train(**kwargs):
           best_acc, 'test_acc: %.2f%%' % test_accuracy)
 
 
+def build_model(name, **kwargs):
+    """
+    build only the model asked for
+    """
+
+    models.set_pretrained_root(opt.pretrained_root)
+    return models.create(name, **kwargs)
+
+
+def report_startup(built):
+    """
+    print the startup cost once every model of the command is built
+    """
+
+    # ru_maxrss 在 Linux 上以 KB 为单位，在 macOS 上以字节为单位
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / \
+        (2**20 if sys.platform == 'darwin' else 2**10) if resource else float('nan')
+    print('%s built, startup %.2fs, peak RSS %.0f MB' %
+          (built, time.perf_counter() - START, rss))
+
+
 def step_test(model, dataloader):
     """
     test the model
@@ -223,36 +237,20 @@ def test(**kwargs):
         os.mkdir(opt.model_file)
 
     # step1: model
-    model = getattr(models, opt.model)
-    if opt.model == 'LrkNet':
-        model = getattr(models, opt.model)()
+    model = build_model(opt.model)
+    report_startup('model %s' % opt.model)
     if opt.load_model_path:
         model.load_state_dict(torch.load(opt.load_model_path))
     if opt.use_gpu:
         print("device: %s" % opt.device)
         model.to(opt.device)
 
-    # step2: data enhancement
-    transform_aug = transforms.Compose([
-        transforms.RandomHorizontalFlip(),
-        transforms.Resize(32),
-        transforms.CenterCrop(32),
-        transforms.ToTensor(),
-        transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
-    ])
-    if opt.model == 'alexnet' or opt.model == 'alexnet_transfer':
-        transform_aug = transforms.Compose([
-            transforms.RandomHorizontalFlip(),
-            transforms.Resize(64),
-            transforms.CenterCrop(64),
-            transforms.ToTensor(),
-            transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
-        ])
-
-    test_dataset = datasets.CIFAR10(
-        root=opt.test_data_root, train=False, download=True, transform=transform_aug)
-    test_data = DataLoader(dataset=test_dataset,
-                           batch_size=opt.batch_size, shuffle=False)
+    # step2: data
+    size = 64 if opt.model in ('alexnet', 'alexnet_transfer') else 32
+    test_dataset = utils.CIFAR10Cache(
+        opt.test_data_root, train=False, size=size)
+    test_data = utils.batch_loader(test_dataset, range(len(test_dataset)),
+                                   opt.batch_size, num_workers=opt.num_workers)
 
     # step3: test
     cm_value, test_accuracy = step_test(model, test_data)
@@ -265,6 +263,38 @@ def test(**kwargs):
     print(cm_value)
 
 
+def loader(**kwargs):
+    """
+    measure the throughput (images/sec) of one epoch of training data,
+    cached uint8 batches vs per-sample PIL transforms
+    """
+
+    opt.parse(kwargs)
+    size = 64 if opt.model in ('alexnet', 'alexnet_transfer') else 32
+    cached = utils.CIFAR10Cache(
+        opt.train_data_root, train=True, size=size, flip=True)
+    transform_aug = transforms.Compose([
+        transforms.RandomHorizontalFlip(),
+        transforms.Resize(size),
+        transforms.CenterCrop(size),
+        transforms.ToTensor(),
+        transforms.Normalize((0.485, 0.456, 0.406), (0.229, 0.224, 0.225))
+    ])
+    pil = datasets.CIFAR10(root=opt.train_data_root, train=True,
+                           download=True, transform=transform_aug)
+
+    for name, data in [
+            ('uint8 cache', utils.batch_loader(cached, range(len(cached)), opt.batch_size,
+                                               shuffle=True, num_workers=opt.num_workers)),
+            ('PIL', DataLoader(dataset=pil, batch_size=opt.batch_size,
+                               shuffle=True, num_workers=opt.num_workers))]:
+        start, n = time.perf_counter(), 0
+        for images, _ in data:
+            n += len(images)
+        print('%-12s %d workers: %8.0f images/sec' %
+              (name, opt.num_workers, n / (time.perf_counter() - start)))
+
+
 def ensemble(**kwargs):
 
     print('Model ensemble begin')
@@ -285,55 +315,56 @@ def ensemble(**kwargs):
     device = 'cuda:1' if torch.cuda.is_available() else 'cpu'
 
     # models
-    googlenet = getattr(models, 'googlenet_transfer').to(device).eval()
+    googlenet = build_model('googlenet_transfer', pretrained=False).to(device).eval()
     googlenet.load_state_dict(torch.load(
         './checkpoints/googlenet_transfer/best_model_86-6.pth'))
-    resnet18 = getattr(models, 'resnet18').to(device).eval()
+    resnet18 = build_model('resnet18').to(device).eval()
     resnet18.load_state_dict(torch.load(
         './checkpoints/resnet18_transfer/best_model_85-49.pth'))
-    resnet34 = getattr(models, 'resnet34').to(device).eval()
+    resnet34 = build_model('resnet34').to(device).eval()
     resnet34.load_state_dict(torch.load(
         './checkpoints/resnet34_transfer/best_model_84-99.pth'))
-    resnet50 = getattr(models, 'resnet50').to(device).eval()
+    resnet50 = build_model('resnet50').to(device).eval()
     resnet50.load_state_dict(torch.load(
         './checkpoints/resnet50_transfer/best_model_87-32.pth'))
-    resnet101 = getattr(models, 'resnet101').to(device).eval()
+    resnet101 = build_model('resnet101').to(device).eval()
     resnet101.load_state_dict(torch.load(
         './checkpoints/resnet101_transfer/best_model_85-16.pth'))
-    resnet152 = getattr(models, 'resnet152').to(device).eval()
+    resnet152 = build_model('resnet152').to(device).eval()
     resnet152.load_state_dict(torch.load(
         './checkpoints/resnet152_transfer/best_model_85-94.pth'))
-    vgg11 = getattr(models, 'vgg11').to(device).eval()
+    vgg11 = build_model('vgg11').to(device).eval()
     vgg11.load_state_dict(torch.load(
         './checkpoints/vgg11_transfer/best_model_87-5.pth'))
-    vgg13 = getattr(models, 'vgg13').to(device).eval()
+    vgg13 = build_model('vgg13').to(device).eval()
     vgg13.load_state_dict(torch.load(
         './checkpoints/vgg13_transfer/best_model_89-45.pth'))
-    vgg16 = getattr(models, 'vgg16').to(device).eval()
+    vgg16 = build_model('vgg16').to(device).eval()
     vgg16.load_state_dict(torch.load(
         './checkpoints/vgg16_transfer/best_model_88-98.pth'))
-    vgg19 = getattr(models, 'vgg19').to(device).eval()
+    vgg19 = build_model('vgg19').to(device).eval()
     vgg19.load_state_dict(torch.load(
         './checkpoints/vgg19_transfer/best_model_87-12.pth'))
-    dense121 = getattr(models, 'dense121').to(device).eval()
+    dense121 = build_model('dense121').to(device).eval()
     dense121.load_state_dict(torch.load(
         './checkpoints/densenet121_transfer/best_model_88-64.pth'))
-    dense161 = getattr(models, 'dense161').to(device).eval()
+    dense161 = build_model('dense161').to(device).eval()
     dense161.load_state_dict(torch.load(
         './checkpoints/densenet161_transfer/best_model_88-51.pth'))
-    dense169 = getattr(models, 'dense169').to(device).eval()
+    dense169 = build_model('dense169').to(device).eval()
     dense169.load_state_dict(torch.load(
         './checkpoints/densenet169_transfer/best_model_88-51.pth'))
-    dense201 = getattr(models, 'dense201').to(device).eval()
+    dense201 = build_model('dense201').to(device).eval()
     dense201.load_state_dict(torch.load(
         './checkpoints/densenet201_transfer/best_model_88-67.pth'))
 
     # daocat model
-    dogcat_model = models.vgg11_dogcat.to(device)
+    dogcat_model = build_model('vgg11_dogcat').to(device)
     dogcat_model.load_state_dict(torch.load(
         './DogCat/checkpoints/best_94.pth'))
 
     print('Model loaded')
+    report_startup('ensemble')
 
     # data enhancement
     opt.batch_size = 64
@@ -1,15 +1,29 @@
-# torchvision 封装好的模型
-from .packaged import resnet18, resnet34, resnet50, resnet101, resnet152, vgg11, vgg13, vgg16, vgg19, dense121, dense161, dense169, dense201
+# 模型在 registry 中按名字注册，只在 create 时构建，import models 不会构建任何网络
+from .registry import register, create, available
 
-# # 用torchvision预训练的模型迁移学习
-from .transfer import googlenet_transfer
-#     resnet18_transfer, resnet34_transfer, resnet50_transfer, resnet101_transfer, resnet152_transfer, \
-#     vgg11_transfer, vgg13_transfer, vgg16_transfer, vgg19_transfer, \
-#     densenet121_transfer, densenet161_transfer, densenet169_transfer, densenet201_transfer, \
-#     googlenet_transfer, alexnet_transfer
+# torchvision 封装好的模型: resnet18..152, vgg11..19, dense121..201
+from . import packaged
+
+# 用torchvision预训练的模型迁移学习: <arch>_transfer，权重缓存在 pretrained_root
+from . import transfer
+from .transfer import set_pretrained_root
 
 # 自定义网络结构
 from .nets import LrkNet
 
 # # DogCat enhance transfer
-from .dogcat_transfer import vgg11_dogcat
\ No newline at end of file
+from . import dogcat_transfer
+
+
+_instances = {}
+
+
+def __getattr__(name):
+    """`models.resnet18` etc. still give one shared instance, built on first
+    access instead of at import."""
+
+    if name not in available():
+        raise AttributeError("module %r has no attribute %r" % (__name__, name))
+    if name not in _instances:
+        _instances[name] = create(name)
+    return _instances[name]
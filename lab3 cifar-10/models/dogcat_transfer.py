@@ -1,7 +1,9 @@
-import torch
-from torch import nn
-from torchvision import models
+from .registry import register
+
 
 # vgg11
-vgg11_dogcat = models.vgg11(pretrained=False, num_classes=2)
-# vgg11_dogcat.load_state_dict(torch.load('./DogCat/vgg11_best.pth'))
+@register('vgg11_dogcat')
+def vgg11_dogcat():
+    from torchvision import models
+    # 训练好的权重在 main.ensemble 中加载: './DogCat/checkpoints/best_94.pth'
+    return models.vgg11(weights=None, num_classes=2)
@@ -1,10 +1,12 @@
 # -.-coding:utf-8 -.-
 
 from .Basic import BasicModule
+from .registry import register
 
 from torch import nn
 
 
+@register('LrkNet')
 class LrkNet(BasicModule):
 
     def __init__(self, num_classes=10):
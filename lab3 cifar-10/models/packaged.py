@@ -1,25 +1,26 @@
-from torch import nn
-from torchvision import models
+from .registry import register
 
-# 全局取消证书验证
-import ssl
-ssl._create_default_https_context = ssl._create_unverified_context
 
-# 加载预训练好的模型，如果不存在会进行下载
-# 预训练好的模型保存在 ~/.torch/models/下面
-resnet18 = models.resnet18(pretrained=False, num_classes=10)
-resnet34 = models.resnet34(pretrained=False, num_classes=10)
-resnet50 = models.resnet50(pretrained=False, num_classes=10)
-resnet101 = models.resnet101(pretrained=False, num_classes=10)
-resnet152 = models.resnet152(pretrained=False, num_classes=10)
-vgg11 = models.vgg11(pretrained=False, num_classes=10)
-vgg13 = models.vgg13(pretrained=False, num_classes=10)
-vgg16 = models.vgg16(pretrained=False, num_classes=10)
-vgg19 = models.vgg19(pretrained=False, num_classes=10)
-dense121 = models.densenet121(pretrained=False, num_classes=10)
-dense161 = models.densenet161(pretrained=False, num_classes=10)
-dense169 = models.densenet169(pretrained=False, num_classes=10)
-dense201 = models.densenet201(pretrained=False, num_classes=10)
+def _packaged(arch):
+    """Factory of the torchvision `arch` trained from scratch on 10 classes;
+    torchvision is only imported when the model is built."""
+
+    def build():
+        from torchvision import models
+        return getattr(models, arch)(weights=None, num_classes=10)
+    build.__name__ = arch
+    return build
+
+
+# 名字 -> torchvision 中的模型
+for name, arch in [('resnet18', 'resnet18'), ('resnet34', 'resnet34'),
+                   ('resnet50', 'resnet50'), ('resnet101', 'resnet101'),
+                   ('resnet152', 'resnet152'),
+                   ('vgg11', 'vgg11'), ('vgg13', 'vgg13'),
+                   ('vgg16', 'vgg16'), ('vgg19', 'vgg19'),
+                   ('dense121', 'densenet121'), ('dense161', 'densenet161'),
+                   ('dense169', 'densenet169'), ('dense201', 'densenet201')]:
+    register(name)(_packaged(arch))
 
 
 # # 修改最后的全连接层为10分类问题（默认是ImageNet上的1000分类）
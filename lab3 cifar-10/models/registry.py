@@ -0,0 +1,37 @@
+# -.-coding:utf-8 -.-
+"""Named model factories.
+
+Importing `models` only fills this table; a network (and torchvision, and
+any pretrained weights) is built when `create` asks for it by name.
+"""
+from collections import OrderedDict
+
+
+_factories = OrderedDict()
+
+
+def register(name):
+    """Decorator adding a factory (a function or class returning a fresh
+    nn.Module) under `name`, the name used by `--model`."""
+
+    def wrap(factory):
+        if name in _factories:
+            raise KeyError('model %s is already registered' % name)
+        _factories[name] = factory
+        return factory
+    return wrap
+
+
+def create(name, **kwargs):
+    """A new instance of the model registered as `name`."""
+
+    if name not in _factories:
+        raise KeyError('unknown model %s, available: %s' %
+                       (name, ', '.join(_factories)))
+    return _factories[name](**kwargs)
+
+
+def available():
+    """Names of every registered model, in registration order."""
+
+    return list(_factories)
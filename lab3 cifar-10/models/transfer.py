@@ -1,11 +1,121 @@
 # -.-coding:utf-8 -.-
-from torch import nn
-from torchvision import models
+"""ImageNet pretrained torchvision models with a new 10 classes head.
+
+Each factory builds only the requested network. Its weights are downloaded
+once (with certificate verification) and re-saved under `pretrained_root`
+in torch's zip format, which `torch.load(mmap=True)` maps instead of reading:
+the network is created on the meta device and takes the mapped tensors as
+its parameters, so neither a random initialisation nor a second copy of the
+weights is ever made. This needs torch >= 2.1 and torchvision >= 0.16.
+"""
+import os
+import re
+
+from .registry import register
+
+
+# 预训练权重缓存目录，main.py 中由 --pretrained_root 设置
+pretrained_root = './Data/pretrained/'
+
+# 旧版 densenet 权重中的 'norm.1' 等参数名
+_DENSENET_KEY = re.compile(
+    r'^(.*denselayer\d+\.(?:norm|relu|conv))\.((?:[12])\.(?:weight|bias|running_mean|running_var))$')
+
+# 与 torchvision 加载 googlenet 预训练权重时的结构一致
+_ARCH_KWARGS = {
+    'googlenet': dict(aux_logits=True, transform_input=True, init_weights=False),
+}
+
+
+def set_pretrained_root(path):
+    """Directory the converted pretrained weights are cached in."""
+
+    global pretrained_root
+    pretrained_root = path
+
+
+def _weights_url(arch):
+    from torchvision import models
+    return models.get_model_weights(arch).IMAGENET1K_V1.url
+
+
+def _build(arch):
+    from torchvision import models
+    return getattr(models, arch)(**_ARCH_KWARGS.get(arch, {}))
+
+
+def cached_weights(arch):
+    """Path of the ImageNet weights of `arch`, fetched and converted on the
+    first call.
+
+    The downloaded state dict gets its legacy densenet keys renamed and the
+    BatchNorm counters older files lack, so it loads strictly as it is.
+    """
+    import torch
+
+    path = os.path.join(pretrained_root, arch + '.pth')
+    if os.path.exists(path):
+        return path
+
+    os.makedirs(pretrained_root, exist_ok=True)
+    download = path + '.download'
+    torch.hub.download_url_to_file(_weights_url(arch), download)
+    state = torch.load(download, map_location='cpu')
+    for key in list(state):
+        match = _DENSENET_KEY.match(key)
+        if match:
+            state[match.group(1) + match.group(2)] = state.pop(key)
+    with torch.device('meta'):
+        expected = _build(arch).state_dict()
+    for key in expected:
+        if key.endswith('num_batches_tracked') and key not in state:
+            state[key] = torch.tensor(0)
+
+    torch.save(state, path + '.tmp')
+    os.replace(path + '.tmp', path)
+    os.remove(download)
+    return path
+
+
+def _new_head(model, num_classes):
+    from torch import nn
+    if hasattr(model, 'fc'):  # resnet, googlenet
+        model.fc = nn.Linear(model.fc.in_features, num_classes)
+    elif isinstance(model.classifier, nn.Linear):  # densenet
+        model.classifier = nn.Linear(model.classifier.in_features, num_classes)
+    else:  # vgg, alexnet
+        model.classifier[6] = nn.Linear(
+            model.classifier[6].in_features, num_classes)
+    return model
+
+
+def _transfer(arch):
+    """Factory of `arch` with pretrained weights and a new head."""
+
+    def build(pretrained=True, num_classes=10):
+        import torch
+        if not pretrained:  # 之后会加载训练好的权重，如 main.ensemble
+            model = _build(arch)
+        else:
+            state = torch.load(cached_weights(arch), map_location='cpu',
+                               mmap=True, weights_only=True)
+            with torch.device('meta'):
+                model = _build(arch)
+            model.load_state_dict(state, assign=True)
+        if arch == 'googlenet':  # 与 pretrained=True 时相同，去掉辅助分类器
+            model.aux_logits = False
+            model.aux1 = model.aux2 = None
+        return _new_head(model, num_classes)
+    build.__name__ = arch + '_transfer'
+    return build
+
+
+for arch in ['resnet18', 'resnet34', 'resnet50', 'resnet101', 'resnet152',
+             'vgg11', 'vgg13', 'vgg16', 'vgg19', 'googlenet', 'alexnet',
+             'densenet121', 'densenet161', 'densenet169', 'densenet201']:
+    register(arch + '_transfer')(_transfer(arch))
 
 
-# resnet18
-resnet18_transfer = models.resnet18(pretrained=True)
-resnet18_transfer.fc = nn.Linear(resnet18_transfer.fc.in_features, 10)
 # resnet18_transfer.fc = nn.Sequential(
 #     nn.Linear(resnet18_transfer.fc.in_features, 100, bias=True),
 #     nn.ReLU(),
@@ -24,78 +134,3 @@ resnet18_transfer.fc = nn.Linear(resnet18_transfer.fc.in_features, 10)
 # total_trainable_params = sum(
 #     p.numel() for p in resnet18_transfer.parameters() if p.requires_grad)
 # print('需训练参数个数:{}'.format(total_trainable_params))
-
-
-# resnet34
-resnet34_transfer = models.resnet34(pretrained=True)
-resnet34_transfer.fc = nn.Linear(resnet34_transfer.fc.in_features, 10)
-
-
-# resnet50
-resnet50_transfer = models.resnet50(pretrained=True)
-resnet50_transfer.fc = nn.Linear(resnet50_transfer.fc.in_features, 10)
-
-
-# resnet101
-resnet101_transfer = models.resnet101(pretrained=True)
-resnet101_transfer.fc = nn.Linear(resnet101_transfer.fc.in_features, 10)
-
-
-# resnet152
-resnet152_transfer = models.resnet152(pretrained=True)
-resnet152_transfer.fc = nn.Linear(resnet152_transfer.fc.in_features, 10)
-
-
-# vgg11
-vgg11_transfer = models.vgg11(pretrained=True)
-vgg11_transfer.classifier[6] = nn.Linear(
-    vgg11_transfer.classifier[6].in_features, 10)
-
-
-# vgg13
-vgg13_transfer = models.vgg13(pretrained=True)
-vgg13_transfer.classifier[6] = nn.Linear(
-    vgg13_transfer.classifier[6].in_features, 10)
-
-
-# vgg16
-vgg16_transfer = models.vgg16(pretrained=True)
-vgg16_transfer.classifier[6] = nn.Linear(
-    vgg16_transfer.classifier[6].in_features, 10)
-
-
-# vgg19
-vgg19_transfer = models.vgg19(pretrained=True)
-vgg19_transfer.classifier[6] = nn.Linear(
-    vgg19_transfer.classifier[6].in_features, 10)
-
-
-# googlenet
-googlenet_transfer = models.googlenet(pretrained=True)
-googlenet_transfer.fc = nn.Linear(
-    googlenet_transfer.fc.in_features, 10)
-
-# alexnet
-alexnet_transfer = models.alexnet(pretrained=True)
-alexnet_transfer.classifier[6] = nn.Linear(
-    alexnet_transfer.classifier[6].in_features, 10)
-
-# densenet121
-densenet121_transfer = models.densenet121(pretrained=True)
-densenet121_transfer.classifier = nn.Linear(
-    densenet121_transfer.classifier.in_features, 10)
-
-# densenet161
-densenet161_transfer = models.densenet161(pretrained=True)
-densenet161_transfer.classifier = nn.Linear(
-    densenet161_transfer.classifier.in_features, 10)
-
-# densenet169
-densenet169_transfer = models.densenet169(pretrained=True)
-densenet169_transfer.classifier = nn.Linear(
-    densenet169_transfer.classifier.in_features, 10)
-
-# densenet201
-densenet201_transfer = models.densenet201(pretrained=True)
-densenet201_transfer.classifier = nn.Linear(
-    densenet201_transfer.classifier.in_features, 10)
\ No newline at end of file
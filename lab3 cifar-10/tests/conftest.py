@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the tests import `utils` and `models` from the lab directory, as main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
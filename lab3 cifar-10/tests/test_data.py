@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+import torch
+from PIL import Image
+from torchvision import transforms
+
+from utils.data import CIFAR10Cache, MEAN, STD, batch_loader
+
+
+def make_cache(root, n=20):
+    """Cache files as `CIFAR10Cache` writes them, so nothing is downloaded."""
+    images = np.random.RandomState(0).randint(0, 256, (n, 32, 32, 3)).astype(np.uint8)
+    np.save(str(root / 'cifar10_test_uint8.npy'), images)
+    np.save(str(root / 'cifar10_test_labels.npy'), np.arange(n, dtype=np.int64))
+    return images
+
+
+# PIL rounds the resized image to uint8: one level is 1 / (255 * std)
+@pytest.mark.parametrize('size, atol', [(32, 1e-5), (64, 1.01 / (255 * min(STD)))])
+def test_cache_batch_matches_pil_pipeline(tmp_path, size, atol):
+    images = make_cache(tmp_path)
+    pipeline = transforms.Compose([
+        transforms.Resize(size),
+        transforms.CenterCrop(size),
+        transforms.ToTensor(),
+        transforms.Normalize(MEAN, STD)
+    ])
+    index = np.array([7, 2, 11, 3])
+    data, labels = CIFAR10Cache(str(tmp_path), train=False, size=size)[index]
+
+    expected = torch.stack([pipeline(Image.fromarray(images[i])) for i in sorted(index)])
+    assert data.shape == (4, 3, size, size) and data.dtype == torch.float32
+    assert labels.tolist() == sorted(index)
+    assert (data - expected).abs().max() < atol
+
+
+def test_cache_flip_mirrors_whole_images(tmp_path):
+    make_cache(tmp_path)
+    plain = CIFAR10Cache(str(tmp_path), train=False)
+    flipped = CIFAR10Cache(str(tmp_path), train=False, flip=True)
+    torch.manual_seed(0)
+    index = np.arange(20)
+    a, b = plain[index][0], flipped[index][0]
+    mirrored = (a.flip(-1) == b).flatten(1).all(1)
+    assert mirrored.any() and (mirrored | (a == b).flatten(1).all(1)).all()
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_batch_loader_covers_every_index_once(tmp_path, shuffle):
+    make_cache(tmp_path, n=50)
+    dataset = CIFAR10Cache(str(tmp_path), train=False)
+    indices = range(5, 42)
+    loader = batch_loader(dataset, indices, batch_size=8, shuffle=shuffle)
+    for _ in range(2):
+        batches = [labels for _, labels in loader]
+        assert [len(b) for b in batches] == [8, 8, 8, 8, 5]
+        assert sorted(torch.cat(batches).tolist()) == list(indices)
@@ -0,0 +1,41 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import models
+
+
+LAB = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_available_lists_models_without_building_them(tmp_path):
+    # a fresh interpreter, so no other test has imported torchvision yet
+    script = ('import sys, models\n'
+              'models.set_pretrained_root(sys.argv[1])\n'
+              'print(" ".join(models.available()))\n'
+              'print("torchvision" in sys.modules)\n')
+    out = subprocess.run([sys.executable, '-c', script, str(tmp_path / 'pretrained')],
+                         cwd=LAB, check=True, capture_output=True, text=True).stdout
+    names, torchvision_imported = out.split('\n')[:2]
+
+    names = names.split()
+    for name in ['resnet18', 'vgg11', 'dense121', 'resnet18_transfer',
+                 'googlenet_transfer', 'LrkNet', 'vgg11_dogcat']:
+        assert name in names
+    assert len(names) == len(set(names))
+    assert torchvision_imported == 'False'
+    assert not (tmp_path / 'pretrained').exists()  # no weights fetched
+
+
+def test_create_builds_a_new_model_per_call():
+    a, b = models.create('LrkNet'), models.create('LrkNet')
+    assert a is not b and type(a).__name__ == 'LrkNet'
+
+
+def test_unknown_model_raises():
+    with pytest.raises(KeyError, match='unknown model'):
+        models.create('resnet19')
+    with pytest.raises(AttributeError):
+        models.resnet19
@@ -1,3 +1,4 @@
 from .utils import setup_seed
+from .data import CIFAR10Cache, batch_loader
 from .visualize import Visualizer
 from .help import help
@@ -0,0 +1,88 @@
+# -.-coding:utf-8 -.-
+import os
+import numpy as np
+import torch
+from torch.nn import functional as F
+from torch.utils.data import Dataset, DataLoader
+from torch.utils.data import sampler
+
+
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+
+def _save(path, array):
+    """
+    写到临时文件后再改名，中断或多个进程同时写都不会留下不完整的文件
+    """
+
+    tmp = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp, path)
+
+
+class CIFAR10Cache(Dataset):
+    """
+    CIFAR-10 解码一次后存为 (N,32,32,3) uint8 的 .npy 文件，之后以 mmap 方式读取。
+    一次取一个 batch 的下标，按下标 gather 图片，翻转/缩放/归一化对整个 batch 做，
+    等价于 RandomHorizontalFlip -> Resize(size) -> CenterCrop(size) -> ToTensor -> Normalize
+    """
+
+    def __init__(self, root, train=True, size=32, flip=False):
+        split = 'train' if train else 'test'
+        images = os.path.join(root, 'cifar10_%s_uint8.npy' % split)
+        labels = os.path.join(root, 'cifar10_%s_labels.npy' % split)
+        if not os.path.exists(labels):
+            from torchvision import datasets
+            dataset = datasets.CIFAR10(root=root, train=train, download=True)
+            # 先写图片再写标签，标签文件存在即说明缓存已完整写入
+            _save(images, np.ascontiguousarray(dataset.data, dtype=np.uint8))
+            _save(labels, np.asarray(dataset.targets, dtype=np.int64))
+        self.images = np.load(images, mmap_mode='r')
+        self.labels = np.load(labels)
+        if self.images.shape != (len(self.labels), 32, 32, 3):
+            raise ValueError('%s has shape %s for %d labels, delete it to rebuild the cache'
+                             % (images, self.images.shape, len(self.labels)))
+
+        self.size = size
+        self.flip = flip
+        # Normalize(ToTensor(x)) = x * scale + shift
+        std = torch.tensor(STD).view(1, 3, 1, 1)
+        self.scale = 1 / (255 * std)
+        self.shift = -torch.tensor(MEAN).view(1, 3, 1, 1) / std
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        """
+        index 是一个 batch 的下标，返回 (B,3,size,size) float32 图片与 (B,) 标签
+        """
+
+        index = np.sort(index)  # 顺序读 mmap
+        images = self.images[index]
+        if self.flip:
+            mask = (torch.rand(len(index)) < 0.5).numpy()
+            images[mask] = images[mask, :, ::-1]
+
+        data = torch.from_numpy(images).permute(0, 3, 1, 2).to(
+            torch.float32, memory_format=torch.contiguous_format)
+        if self.size != data.shape[-1]:
+            # 放大时 Resize 之后的 CenterCrop 不裁剪任何像素
+            data = F.interpolate(data, size=self.size, mode='bilinear',
+                                 align_corners=False)
+        data.mul_(self.scale).add_(self.shift)
+        return data, torch.from_numpy(self.labels[index])
+
+
+def batch_loader(dataset, indices, batch_size, shuffle=False, num_workers=0):
+    """
+    DataLoader 每次把一个 batch 的下标交给 dataset，worker 各自组装整个 batch
+    """
+
+    if shuffle:
+        indices = sampler.SubsetRandomSampler(indices)
+    return DataLoader(dataset, batch_size=None, num_workers=num_workers,
+                      sampler=sampler.BatchSampler(indices, batch_size, drop_last=False),
+                      pin_memory=torch.cuda.is_available())
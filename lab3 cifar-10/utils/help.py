@@ -8,7 +8,7 @@ def help(opt):
 
     print("""
     usage : python {0} <function> [--args=value,]
-    <function> := train | test | help
+    <function> := train | test | loader | help
     example: 
             python {0} train --env='env0701' --lr=0.01
             python {0} test --dataset='path/to/dataset/root/'